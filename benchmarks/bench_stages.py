@@ -0,0 +1,225 @@
+"""Per-stage throughput and peak-memory benchmarks for the BB84, B92 and E91 protocols.
+
+Usage:
+    python benchmarks/bench_stages.py                          # print results
+    python benchmarks/bench_stages.py --save baseline.json     # record a new baseline
+    python benchmarks/bench_stages.py --compare baseline.json  # flag regressions
+
+Each stage is timed on inputs prepared beforehand, so only the stage itself is measured.
+Throughput is reported in qubits (or bits, for post-sifting stages) per second, taking the
+best of several repeats, and peak memory is measured in a separate run under tracemalloc.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import qkdsim.bb84 as bb84
+import qkdsim.b92 as b92
+import qkdsim.e91 as e91
+import qkdsim.qkdutils as util
+import qkdsim.rng as rng
+
+SIZES = [10000, 100000, 1000000]
+REPEATS = 5
+
+# Minimum duration of one timed repeat, so that fast stages on small keys are looped
+# enough times to rise above timer noise
+MIN_TIME = 0.05
+
+# Throughput below (1 - RATE_TOLERANCE) times the baseline, or peak memory above
+# (1 + MEMORY_TOLERANCE) times the baseline, is reported as a regression. Timings are
+# noisy on shared machines, peak memory is not.
+RATE_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.1
+
+# Stages whose baseline call took less than this many seconds are too fast to time
+# reliably (e.g. slicing views), so only their memory is compared
+MIN_CALL_TIME = 1e-4
+
+def bb84Stages(numBits, engine):
+    """Return a list of (stage, count, function) for BB84, with inputs already prepared."""
+    key = util.getRandomBitArray(numBits)
+    bases_A = util.getRandomBitArray(numBits)
+    bases_E = util.getRandomBitArray(numBits)
+    bases_B = util.getRandomBitArray(numBits)
+
+    if engine == 'numpy':
+        sent = bb84.encodeKeyBatch(key, bases_A)
+        key_B = bb84.decodeStateBatch(sent, bases_B)
+        sifted_A, sifted_B = bb84.matchKeysBatch(key, key_B, bases_A, bases_B)
+        stages = [
+            ('encodeKey', numBits, lambda: bb84.encodeKeyBatch(key, bases_A)),
+            ('simulateEavesdrop', numBits, lambda: bb84.simulateEavesdropBatch(sent, bases_E)),
+            ('simulateNoise', numBits, lambda: bb84.simulateNoiseBatch(sent, 0.05)),
+            ('decodeState', numBits, lambda: bb84.decodeStateBatch(sent, bases_B)),
+            ('matchKeys', numBits, lambda: bb84.matchKeysBatch(key, key_B, bases_A, bases_B)),
+        ]
+    else:
+        key, bases_A, bases_E, bases_B = [list(x) for x in (key, bases_A, bases_E, bases_B)]
+        sent = bb84.encodeKey(key, bases_A)
+        key_B = [bb84.decodeState(sent[k], bases_B[k]) for k in range(numBits)]
+        sifted_A, sifted_B = bb84.matchKeys(key, key_B, bases_A, bases_B)
+        stages = [
+            ('encodeKey', numBits, lambda: bb84.encodeKey(key, bases_A)),
+            ('simulateEavesdrop', numBits, lambda: [bb84.simulateEavesdrop(sent[k], bases_E[k]) for k in range(numBits)]),
+            ('simulateNoise', numBits, lambda: bb84.simulateNoise(list(sent), 0.05)),
+            ('decodeState', numBits, lambda: [bb84.decodeState(sent[k], bases_B[k]) for k in range(numBits)]),
+            ('matchKeys', numBits, lambda: bb84.matchKeys(key, key_B, bases_A, bases_B)),
+        ]
+
+    return stages + _postStages(sifted_A, sifted_B)
+
+def b92Stages(numBits, engine):
+    """Return a list of (stage, count, function) for B92, with inputs already prepared."""
+    key = util.getRandomBitArray(numBits)
+    bases_E = util.getRandomBitArray(numBits)
+    bases_B = util.getRandomBitArray(numBits)
+
+    if engine == 'numpy':
+        sent = b92.encodeKeyBatch(key)
+        key_B = b92.decodeStateBatch(sent, bases_B)
+        sifted_A, sifted_B = b92.matchKeysBatch(key, key_B)
+        stages = [
+            ('encodeKey', numBits, lambda: b92.encodeKeyBatch(key)),
+            ('simulateEavesdrop', numBits, lambda: b92.simulateEavesdropBatch(sent, bases_E)),
+            ('simulateNoise', numBits, lambda: b92.simulateNoiseBatch(sent, 0.05)),
+            ('decodeState', numBits, lambda: b92.decodeStateBatch(sent, bases_B)),
+            ('matchKeys', numBits, lambda: b92.matchKeysBatch(key, key_B)),
+        ]
+    else:
+        key, bases_E, bases_B = [list(x) for x in (key, bases_E, bases_B)]
+        sent = b92.encodeKey(key)
+        key_B = [b92.decodeState(sent[k], bases_B[k]) for k in range(numBits)]
+        key_B = [-1 if r is None else r for r in key_B]
+        sifted_A, sifted_B = b92.matchKeys(key, key_B)
+        stages = [
+            ('encodeKey', numBits, lambda: b92.encodeKey(key)),
+            ('simulateEavesdrop', numBits, lambda: [b92.simulateEavesdrop(sent[k], bases_E[k]) for k in range(numBits)]),
+            ('simulateNoise', numBits, lambda: b92.simulateNoise(list(sent), 0.05)),
+            ('decodeState', numBits, lambda: [b92.decodeState(sent[k], bases_B[k]) for k in range(numBits)]),
+            ('matchKeys', numBits, lambda: b92.matchKeys(key, key_B)),
+        ]
+
+    return stages + _postStages(sifted_A, sifted_B)
+
+def e91Stages(numBits, engine):
+    """Return a list of (stage, count, function) for E91, with inputs already prepared.
+    E91 has no encoding or channel stages; choosing axes and measuring pairs take their place.
+    """
+    if engine == 'numpy':
+        bases_A, bases_B = e91.chooseAxesBatch(numBits)
+        key_A, key_B = e91.measureEntangledStateBatch(bases_A, bases_B)
+        sifted_A, sifted_B, _, _ = e91.matchKeysBatch(key_A, key_B, bases_A, bases_B)
+        stages = [
+            ('chooseAxes', numBits, lambda: e91.chooseAxesBatch(numBits)),
+            ('measureEntangledState', numBits, lambda: e91.measureEntangledStateBatch(bases_A, bases_B)),
+            ('matchKeys', numBits, lambda: e91.matchKeysBatch(key_A, key_B, bases_A, bases_B)),
+        ]
+    else:
+        bases_A, bases_B = e91.chooseAxes(numBits)
+        pairs = [e91.measureEntangledState(bases_A[k], bases_B[k]) for k in range(numBits)]
+        key_A = [p[0] for p in pairs]
+        key_B = [p[1] for p in pairs]
+        sifted_A, sifted_B, _, _ = e91.matchKeys(key_A, key_B, bases_A, bases_B)
+        stages = [
+            ('chooseAxes', numBits, lambda: e91.chooseAxes(numBits)),
+            ('measureEntangledState', numBits, lambda: [e91.measureEntangledState(bases_A[k], bases_B[k]) for k in range(numBits)]),
+            ('matchKeys', numBits, lambda: e91.matchKeys(key_A, key_B, bases_A, bases_B)),
+        ]
+
+    return stages + _postStages(sifted_A, [not b for b in sifted_B] if engine != 'numpy' else ~sifted_B)
+
+def _postStages(sifted_A, sifted_B):
+    _, kept_A, _, kept_B = util.discloseHalf(sifted_A, sifted_B)
+    return [
+        ('discloseHalf', len(sifted_A), lambda: util.discloseHalf(sifted_A, sifted_B)),
+        ('detectEavesdrop', len(kept_A), lambda: util.detectEavesdrop(kept_A, kept_B, 0.0)),
+    ]
+
+PROTOCOLS = {'BB84': bb84Stages, 'B92': b92Stages, 'E91': e91Stages}
+
+def measure(function, repeats=REPEATS):
+    """Return (seconds per call, peak bytes allocated) for one stage."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for j in range(loops):
+            function()
+        if time.perf_counter() - start >= MIN_TIME: break
+        loops *= 2
+
+    best = float('inf')
+    for j in range(repeats):
+        start = time.perf_counter()
+        for k in range(loops):
+            function()
+        best = min(best, (time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (best, peak)
+
+def run(sizes, engine, protocols, repeats=REPEATS):
+    """Return a dict of results keyed by 'engine/protocol/stage/size'."""
+    rng.seed(0)
+    results = {}
+    for protocol in protocols:
+        for numBits in sizes:
+            for stage, count, function in PROTOCOLS[protocol](numBits, engine):
+                seconds, peak = measure(function, repeats)
+                rate = count / seconds if seconds > 0 else float('inf')
+                key = '%s/%s/%s/%d' % (engine, protocol, stage, numBits)
+                results[key] = {'rate': rate, 'seconds': seconds, 'peakBytes': peak}
+                print("%-45s %14.0f /s %12d bytes" % (key, rate, peak))
+    return results
+
+def compare(results, baseline, rateTolerance=RATE_TOLERANCE, memoryTolerance=MEMORY_TOLERANCE):
+    """Return a list of messages describing regressions against the baseline."""
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline: continue
+        new, old = results[key], baseline[key]
+        timed = old['seconds'] >= MIN_CALL_TIME
+        if timed and new['rate'] < old['rate'] * (1 - rateTolerance):
+            regressions.append("%s: throughput %.0f/s, baseline %.0f/s" % (key, new['rate'], old['rate']))
+        if new['peakBytes'] > old['peakBytes'] * (1 + memoryTolerance):
+            regressions.append("%s: peak memory %d bytes, baseline %d bytes" % (key, new['peakBytes'], old['peakBytes']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--engine', choices=['numpy', 'qit'], default='numpy')
+    parser.add_argument('--protocols', nargs='+', choices=sorted(PROTOCOLS), default=sorted(PROTOCOLS))
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--save', metavar='FILE', help="write results to a baseline JSON file")
+    parser.add_argument('--compare', metavar='FILE', help="compare results against a baseline JSON file")
+    parser.add_argument('--rate-tolerance', type=float, default=RATE_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.engine, args.protocols, args.repeats)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.rate_tolerance, args.memory_tolerance)
+        for message in regressions:
+            print("REGRESSION " + message)
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
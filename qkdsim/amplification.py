@@ -0,0 +1,61 @@
+from math import log2
+import numpy as np
+from qkdsim.packedkey import PackedKey
+from qkdsim.rng import getRNG
+
+# Default failure probability of privacy amplification
+EPSILON = 1e-10
+
+def binaryEntropy(p):
+    """Return the binary Shannon entropy h(p) in bits."""
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -p * log2(p) - (1 - p) * log2(1 - p)
+
+def secureLength(length, qber, leaked, epsilon=EPSILON):
+    """Return the number of secret bits that can be extracted from a reconciled key of the
+    given length. Eve's information is bounded by length*h(qber) from her measurements
+    plus the leaked bits announced during reconciliation, and 2*log2(1/epsilon) bits are
+    sacrificed for the security of the hash.
+    """
+    m = length * (1 - binaryEntropy(qber)) - leaked - 2 * log2(1 / epsilon)
+    return max(0, int(m))
+
+def toeplitzHash(key, outLength, seed):
+    """Return the product T.key mod 2 as a bool array, where T is the outLength x len(key)
+    Toeplitz matrix with T[i, j] = seed[i - j + len(key) - 1]. seed holds
+    len(key) + outLength - 1 bits. The product is computed as an FFT convolution in
+    O(n log n) instead of a dense matrix multiplication.
+    """
+    x = np.asarray(key, dtype=float)
+    s = np.asarray(seed, dtype=float)
+    n = len(x)
+    if outLength <= 0 or n == 0:
+        return np.zeros(max(outLength, 0), dtype=bool)
+    if len(s) != n + outLength - 1:
+        raise ValueError("Expected %d seed bits, got %d" % (n + outLength - 1, len(s)))
+
+    # Only outputs n-1 .. n+outLength-2 of the full convolution are needed, and circular
+    # wrap-around cannot reach them if the transform covers len(s) points.
+    size = 1 << (len(s) - 1).bit_length()
+    c = np.fft.irfft(np.fft.rfft(s, size) * np.fft.rfft(x, size), size)[n - 1:n - 1 + outLength]
+
+    counts = np.rint(c)
+    if len(c) and np.max(np.abs(c - counts)) > 0.25:
+        raise ArithmeticError("FFT rounding error too large for exact hashing")
+    return (counts.astype(np.int64) & 1).astype(bool)
+
+def amplify(key_A, key_B, qber, leaked, epsilon=EPSILON):
+    """Compress Alice and Bob's reconciled keys with the same random Toeplitz hash and return
+    the tuple (key_A, key_B). The hash seed is public, and the output length is given by
+    secureLength. Keys are returned as PackedKeys if key_A is one.
+    """
+    n = len(key_A)
+    m = min(n, secureLength(n, qber, leaked, epsilon))
+    seed = getRNG().randomBits(n + m - 1) if m else np.zeros(0, dtype=bool)
+
+    out_A = toeplitzHash(key_A, m, seed)
+    out_B = toeplitzHash(key_B, m, seed)
+    if isinstance(key_A, PackedKey):
+        return (PackedKey.fromBits(out_A), PackedKey.fromBits(out_B))
+    return (out_A, out_B)
@@ -0,0 +1,250 @@
+from math import erfc, exp, floor, lgamma, log, sqrt
+import numpy as np
+import qkdsim.attacks as attacks
+import qkdsim.e91 as e91
+import qkdsim.states as states
+import qkdsim.trials as trials
+
+# Raw bits sent per requested key bit, as in the run functions
+RAW_BITS = {'BB84': 5, 'B92': 8, 'E91': 5}
+
+# Gauss-Hermite nodes used to average the detection probability over the sifted length
+_NODES, _WEIGHTS = np.polynomial.hermite_e.hermegauss(9)
+_WEIGHTS = _WEIGHTS / _WEIGHTS.sum()
+
+class Estimate(object):
+    """Closed-form expectations for one protocol configuration:
+        rawBits       = number of qubits or pairs sent
+        siftedYield   = probability that a raw bit survives sifting
+        siftedMean    = expected sifted key length
+        qber          = expected error rate of the final keys
+        detectionRate = probability that Alice and Bob abort
+    """
+
+    def __init__(self, protocol, n, rawBits, siftedYield, qber, detectionRate):
+        self.protocol = protocol
+        self.n = n
+        self.rawBits = rawBits
+        self.siftedYield = siftedYield
+        self.siftedMean = rawBits * siftedYield
+        self.qber = qber
+        self.detectionRate = detectionRate
+
+    def __repr__(self):
+        return "Estimate(%s, sifted=%.1f, qber=%.4f, detection=%.4f)" % (self.protocol,
+               self.siftedMean, self.qber, self.detectionRate)
+
+    def asDict(self):
+        """Return the estimate as a dict, using the same keys as TrialStats.asDict where
+        they mean the same thing.
+        """
+        return {
+            'method': 'analytic',
+            'rawBits': self.rawBits,
+            'siftedYield': self.siftedYield,
+            'siftedMean': self.siftedMean,
+            'errorMean': self.qber,
+            'detectionRate': self.detectionRate,
+        }
+
+def estimate(protocol, n, eve=False, errorRate=0.0, attack=None, channel=None):
+    """Return the Estimate for a run of the given protocol with the same arguments as the
+    run functions. Results are exact for the models used by the numpy engine, apart from
+    the detection probability, which averages over the spread of the sifted length.
+    """
+    if protocol not in RAW_BITS:
+        raise ValueError("Unknown protocol: %s" % protocol)
+    rawBits = RAW_BITS[protocol] * n
+    if attack is None and eve and protocol != 'E91':
+        attack = attacks.InterceptResend(1.0)
+    attack = attacks.getAttack(attack) if attack is not None else None
+    transmittance = channel.transmittance if channel is not None else 1.0
+    probOne = channel.probOne() if channel is not None else states.PROB_ONE
+
+    if protocol == 'BB84':
+        transitions, arrival = _bb84Transitions(attack)
+        transitions = _flip(transitions, states.FLIP, errorRate)
+        siftedYield = 0.5 * arrival * transmittance
+        qber = 0.0
+        for a in range(4):
+            value, basis = a & 1, a >> 1
+            ones = transitions[a].dot(probOne[:, basis])
+            qber += 0.25 * (1 - ones if value else ones)
+
+    elif protocol == 'B92':
+        transitions, arrival = _b92Transitions(attack)
+        transitions = _flip(transitions, states.HADAMARD, errorRate)
+        passed = wrong = 0.0
+        for a, value in [(states.ZERO, 0), (states.PLUS, 1)]:
+            # Bob's filter b passes on measuring 1 in basis 1 - b, and he then reads bit b
+            for b in [0, 1]:
+                p = 0.25 * transitions[a].dot(probOne[:, 1 - b])
+                passed += p
+                if b != value: wrong += p
+        siftedYield = passed * arrival * transmittance
+        qber = wrong / passed if passed else 0.0
+
+        # Eve's full intercept-resend drops photons, which Alice and Bob notice as
+        # differing key lengths
+        if eve and isinstance(attack, attacks.InterceptResend):
+            return Estimate(protocol, n, rawBits, siftedYield, qber, 1.0 - 0.25 ** rawBits)
+
+    else:
+        if attack is not None:
+            raise ValueError("Attacks are not modelled for E91")
+        if eve:
+            channel = e91.interceptChannel() if channel is None else e91.interceptChannel() >> channel
+        rho = channel.applyToPair(e91.SINGLET) if channel is not None else e91.SINGLET
+        # Bob inverts his sifted bits, so equal results are errors
+        same = np.mean([p[0] + p[3] for p in [e91.jointProbabilities(a, a, rho) for a in (0, np.pi/8)]])
+        flip = 2 * errorRate * (1 - errorRate)
+        siftedYield = 2.0 / 9 * transmittance
+        qber = same * (1 - flip) + (1 - same) * flip
+        detection = bellDetectionProbability(rawBits * transmittance / 9, rho, errorRate)
+        return Estimate(protocol, n, rawBits, siftedYield, qber, detection)
+
+    detection = detectionProbability(rawBits, siftedYield, qber, errorRate)
+    return Estimate(protocol, n, rawBits, siftedYield, qber, detection)
+
+def detectionProbability(rawBits, siftedYield, qber, errorRate):
+    """Return the probability that util.detectEavesdrop flags the kept half of a sifted
+    key drawn from rawBits raw bits, when each kept bit is wrong with probability qber.
+    """
+    mean = rawBits * siftedYield
+    sd = sqrt(rawBits * siftedYield * (1 - siftedYield))
+    total = 0.0
+    for z, w in zip(_NODES, _WEIGHTS):
+        kept = int(max(0, round(mean + z * sd))) // 2
+        total += w * _detectGivenKept(kept, qber, errorRate)
+    return min(1.0, total)
+
+def bellDetectionProbability(pairsPerTerm, rho, errorRate):
+    """Return the probability that the CHSH test of runE91 aborts, when each correlation
+    in the test is measured on pairsPerTerm pairs in the state rho: none below
+    e91.MIN_TERM_PAIRS, and otherwise the chance that |S| falls e91.BELL_Z standard errors
+    below the bound. The estimate of |S| is taken as normally distributed.
+    """
+    if pairsPerTerm < e91.MIN_TERM_PAIRS:
+        return 0.0
+    S = 0.0
+    variance = 0.0
+    for a, b, sign in e91.CHSH_TERMS:
+        p = e91.jointProbabilities(e91.AXES_A[a], e91.AXES_B[b], rho)
+        # Independent flips on both sides scale each correlation by (1 - 2e)^2
+        E = (p[0] + p[3] - p[1] - p[2]) * (1 - 2 * errorRate) ** 2
+        S += sign * E
+        variance += (1 - E ** 2) / max(pairsPerTerm, 1.0)
+    sd = sqrt(variance)
+    return 0.5 * erfc((abs(S) + e91.BELL_Z * sd - e91.CHSH_BOUND) / (sqrt(2) * sd))
+
+def _detectGivenKept(kept, qber, errorRate):
+    if kept == 0:
+        return 1.0
+
+    # detectEavesdrop flags the key when abs(m/kept - errorRate) > 1.2*errorRate, i.e.
+    # when the number m of mismatches exceeds the largest passing count t
+    t = int(floor(2.2 * errorRate * kept))
+    while t + 1 <= kept and not abs(float(t + 1) / kept - errorRate) > errorRate * 1.2:
+        t += 1
+    while t >= 0 and abs(float(t) / kept - errorRate) > errorRate * 1.2:
+        t -= 1
+    return binomialTail(kept, qber, t)
+
+def binomialTail(k, p, t):
+    """Return P(X > t) for X ~ Binomial(k, p). Only the terms within a few standard
+    deviations of the mean are summed, so the cost does not grow with k.
+    """
+    if t < 0:
+        return 1.0
+    if t >= k or p <= 0:
+        return 0.0
+    if p >= 1:
+        return 1.0
+
+    # Terms shrink away from the mean, so beyond width of them the rest are negligible
+    width = int(12 * sqrt(k * p * (1 - p))) + 20
+    if t >= k * p:
+        return float(np.sum(_pmf(k, p, t + 1, min(k, t + 1 + width))))
+    return max(0.0, 1.0 - float(np.sum(_pmf(k, p, max(0, t - width), t))))
+
+def _pmf(k, p, lo, hi):
+    """Return the binomial probabilities of lo..hi successes, inclusive."""
+    m = np.arange(lo, hi)
+    logStart = lgamma(k + 1) - lgamma(lo + 1) - lgamma(k - lo + 1) + lo * log(p) + (k - lo) * log(1 - p)
+    logRatios = np.log((k - m) / (m + 1.0)) + log(p / (1 - p))
+    return np.exp(logStart + np.concatenate([[0.0], np.cumsum(logRatios)]))
+
+def _flip(transitions, flip, errorRate):
+    """Apply bit-flip noise, which maps state c to flip[c] with probability errorRate."""
+    return (1 - errorRate) * transitions + errorRate * transitions[:, flip]
+
+def _bb84Transitions(attack):
+    """Return (T, arrival) where T[a, c] is the probability that Alice's state a reaches
+    Bob as state c, given that it arrives, and arrival is the probability that it does.
+    """
+    size = len(states.FLIP)
+    identity = np.eye(4, size)
+    if attack is None:
+        return (identity, 1.0)
+
+    if isinstance(attack, attacks.InterceptResend):
+        T = (1 - attack.fraction) * identity
+        for a in range(4):
+            for basis in [0, 1]:
+                ones = states.PROB_ONE[a, basis]
+                T[a, states.encode(0, basis)] += attack.fraction * 0.5 * (1 - ones)
+                T[a, states.encode(1, basis)] += attack.fraction * 0.5 * ones
+        return (T, 1.0)
+
+    if isinstance(attack, attacks.Breidbart):
+        ones = states.VECTORS[:4].dot(states.VECTORS[states.BREIDBART_1]) ** 2
+        T = (1 - attack.fraction) * identity
+        T[:, states.BREIDBART_0] += attack.fraction * (1 - ones)
+        T[:, states.BREIDBART_1] += attack.fraction * ones
+        return (T, 1.0)
+
+    if isinstance(attack, attacks.PhotonNumberSplitting):
+        return (identity, _pnsArrival(attack))
+
+    raise ValueError("No analytic model for %r" % attack)
+
+def _b92Transitions(attack):
+    """As _bb84Transitions for the two B92 states."""
+    size = len(states.FLIP)
+    identity = np.eye(4, size)
+    if attack is None:
+        return (identity, 1.0)
+
+    # Eve's filters pass a quarter of the photons, and she resends exactly what she saw
+    if isinstance(attack, attacks.InterceptResend):
+        return (identity, 1 - 0.75 * attack.fraction)
+
+    if isinstance(attack, attacks.PhotonNumberSplitting):
+        return (identity, _pnsArrival(attack))
+
+    raise ValueError("No analytic model for %r" % attack)
+
+def _pnsArrival(attack):
+    mu = attack.meanPhotons
+    return 1 - exp(-mu) - attack.block * mu * exp(-mu)
+
+def validate(protocol, n, eve=False, errorRate=0.0, numTrials=10, seed=None, confidence=0.999):
+    """Spot-check the analytic estimate against numTrials sampled runs and return the
+    tuple (estimate, stats, agrees), where stats is the TrialStats of the sampled runs and
+    agrees is True if every sampled mean lies within the confidence bounds of the estimate.
+    """
+    est = estimate(protocol, n, eve, errorRate)
+    stats = trials.runTrials(protocol, numTrials, n, eve, errorRate, workers=1, seed=seed)
+    z = trials.zScore(confidence)
+
+    siftedSD = sqrt(est.rawBits * est.siftedYield * (1 - est.siftedYield) / numTrials)
+    agrees = abs(stats.siftedMean - est.siftedMean) <= z * siftedSD + 1
+
+    if stats.errorTrials:
+        kept = max(1.0, est.siftedMean / 2)
+        errorSD = sqrt(est.qber * (1 - est.qber) / kept / stats.errorTrials)
+        agrees = agrees and abs(stats.errorMean - est.qber) <= z * errorSD + 1.0 / kept
+
+    low, high = stats.detectionInterval(confidence)
+    agrees = agrees and low <= est.detectionRate <= high
+    return (est, stats, agrees)
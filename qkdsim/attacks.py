@@ -0,0 +1,168 @@
+from math import exp, sqrt
+import numpy as np
+import qkdsim.b92 as b92
+import qkdsim.bb84 as bb84
+import qkdsim.states as states
+from qkdsim.amplification import binaryEntropy
+from qkdsim.rng import getRNG
+
+# Eve's knowledge of each bit after the bases are announced, used to estimate her
+# information. Her guesses on NO_INFO bits are random.
+NO_INFO, INFORMED, WRONG_BASIS = 0, 1, 2
+
+class Interception(object):
+    """What an attack did to a batch of qubits:
+        states   = the state codes that travel on to Bob
+        arrived  = bool mask of the qubits that reach Bob at all
+        guesses  = Eve's guess of each of Alice's bits
+        classes  = Eve's knowledge of each bit, one of NO_INFO, INFORMED or WRONG_BASIS
+    """
+
+    def __init__(self, states, arrived, guesses, classes):
+        self.states = states
+        self.arrived = arrived
+        self.guesses = guesses
+        self.classes = classes
+
+class InterceptResend(object):
+    """Eve intercepts a fraction of the qubits, measures each in a random basis (or with a
+    random filter in B92) and resends the state matching her result.
+    """
+
+    def __init__(self, fraction=1.0):
+        self.fraction = fraction
+
+    def __repr__(self):
+        return "InterceptResend(fraction=%g)" % self.fraction
+
+    def bb84(self, codes):
+        rng = getRNG()
+        codes = np.asarray(codes, dtype=np.uint8)
+        attacked = rng.random(len(codes)) < self.fraction
+        bases_E = rng.randomBits(len(codes))
+
+        results = bb84.decodeStateBatch(codes, bases_E)
+        resent = np.where(attacked, bb84.encodeKeyBatch(results, bases_E), codes)
+
+        # Alice's bases are announced during sifting, so Eve learns which results to trust
+        classes = np.where(bases_E == (codes >> 1).astype(bool), INFORMED, WRONG_BASIS)
+        classes = np.where(attacked, classes, NO_INFO)
+        return Interception(resent, np.ones(len(codes), dtype=bool), results, classes)
+
+    def b92(self, codes):
+        rng = getRNG()
+        codes = np.asarray(codes, dtype=np.uint8)
+        attacked = rng.random(len(codes)) < self.fraction
+        bases_E = rng.randomBits(len(codes))
+
+        # Photons absorbed by Eve's filter are lost; the rest are resent as she saw them
+        results = b92.decodeStateBatch(codes, bases_E)
+        seen = attacked & (results != -1)
+        resent = np.where(seen, results, codes).astype(np.uint8)
+        guesses = np.where(seen, results.astype(bool), rng.randomBits(len(codes)))
+        classes = np.where(seen, INFORMED, NO_INFO)
+        return Interception(resent, ~attacked | seen, guesses, classes)
+
+class Breidbart(object):
+    """Eve intercepts a fraction of the qubits and measures each in the Breidbart basis,
+    halfway between the two BB84 bases, which guesses Alice's bit correctly with
+    probability cos(pi/8)^2 whichever basis she used. She resends the Breidbart state
+    matching her result. Defined for BB84 only.
+    """
+
+    def __init__(self, fraction=1.0):
+        self.fraction = fraction
+
+    def __repr__(self):
+        return "Breidbart(fraction=%g)" % self.fraction
+
+    def bb84(self, codes):
+        rng = getRNG()
+        codes = np.asarray(codes, dtype=np.uint8)
+        attacked = rng.random(len(codes)) < self.fraction
+
+        pOne = states.VECTORS[codes].dot(states.VECTORS[states.BREIDBART_1]) ** 2
+        results = rng.random(len(codes)) < pOne
+        resent = np.where(attacked, states.BREIDBART_0 + results.astype(np.uint8), codes)
+        classes = np.where(attacked, INFORMED, NO_INFO)
+        return Interception(resent.astype(np.uint8), np.ones(len(codes), dtype=bool), results, classes)
+
+    def b92(self, codes):
+        raise ValueError("The Breidbart attack is only defined for BB84")
+
+class PhotonNumberSplitting(object):
+    """Alice sends weak coherent pulses with a Poisson-distributed number of photons.
+    Eve blocks the given fraction of single-photon pulses, keeps one photon of every
+    multi-photon pulse and forwards the rest to Bob over a lossless line, so she causes no
+    errors. She measures her photons once the bases are announced, learning the bit
+    exactly in BB84, and by unambiguous state discrimination (succeeding with probability
+    1 - 1/sqrt(2)) in B92. Empty pulses never reach Bob.
+    """
+
+    def __init__(self, meanPhotons=0.1, block=1.0):
+        self.meanPhotons = meanPhotons
+        self.block = block
+
+    def __repr__(self):
+        return "PhotonNumberSplitting(meanPhotons=%g, block=%g)" % (self.meanPhotons, self.block)
+
+    def _split(self, numPulses):
+        """Return masks of the pulses that reach Bob and those Eve splits."""
+        rng = getRNG()
+        mu = self.meanPhotons
+        u = rng.random(numPulses)
+        empty = u < exp(-mu)
+        single = ~empty & (u < exp(-mu) * (1 + mu))
+        split = ~empty & ~single
+        blocked = single & (rng.random(numPulses) < self.block)
+        return (~empty & ~blocked, split)
+
+    def bb84(self, codes):
+        codes = np.asarray(codes, dtype=np.uint8)
+        arrived, split = self._split(len(codes))
+        guesses = np.where(split, (codes & 1).astype(bool), getRNG().randomBits(len(codes)))
+        classes = np.where(split, INFORMED, NO_INFO)
+        return Interception(codes, arrived, guesses, classes)
+
+    def b92(self, codes):
+        rng = getRNG()
+        codes = np.asarray(codes, dtype=np.uint8)
+        arrived, split = self._split(len(codes))
+        known = split & (rng.random(len(codes)) < 1 - 1 / sqrt(2))
+        guesses = np.where(known, codes.astype(bool), rng.randomBits(len(codes)))
+        classes = np.where(known, INFORMED, NO_INFO)
+        return Interception(codes, arrived, guesses, classes)
+
+ATTACKS = {
+    'intercept': InterceptResend,
+    'breidbart': Breidbart,
+    'pns': PhotonNumberSplitting,
+}
+
+def getAttack(attack):
+    """Return an attack object for one of the names in ATTACKS, or attack itself."""
+    if isinstance(attack, str):
+        if attack not in ATTACKS:
+            raise ValueError("Unknown attack: %s" % attack)
+        return ATTACKS[attack]()
+    return attack
+
+def eveInformation(key, guesses, classes):
+    """Estimate Eve's information about the given key, in bits per key bit, from her
+    guesses: for each class of bits she has information on, 1 - h(e) where e is her error
+    rate on that class.
+    """
+    key = np.asarray(key, dtype=bool)
+    guesses = np.asarray(guesses, dtype=bool)
+    classes = np.asarray(classes)
+    if not len(key):
+        return 0.0
+
+    info = 0.0
+    for c in (INFORMED, WRONG_BASIS):
+        mask = classes == c
+        count = np.count_nonzero(mask)
+        if count:
+            errors = np.count_nonzero(key[mask] != guesses[mask]) / float(count)
+            info += count * (1 - binaryEntropy(errors))
+    return info / len(key)
@@ -1,11 +1,13 @@
 import numpy as np
-import qit
 import qkdsim.qkdutils as util
+import qkdsim.states as states
+from qkdsim.rng import getRNG
+from qkdsim.packedkey import PackedKey
 
 def simulateNoise(bits, errorRate):
     """Simulate channel noise for the B92 protocol."""
     for k in range(len(bits)):
-        p = np.random.random_sample()
+        p = getRNG().random()
         if p < errorRate: bits[k] = flipState(bits[k])
 
     return bits
@@ -16,8 +18,18 @@ def decodeState(state, basis):
     If basis=0, the filter will pass antidiagonal photons and absorb diagonal photons.
     If basis=1, the filter will pass horizontal photons and absorb vertical photons.
     This corresponds to measuring the correct result 1/4 of the time, otherwise measuring nothing.
+    state may also be a state code, see qkdsim.states.
     """
+    # The filter with basis=0 changes basis before measuring, i.e. it measures in the
+    # Hadamard basis, and the photon passes if the result is 1
+    code = states.toCode(state)
+    if code is not None:
+        if states.measure(code, not basis, getRNG()):
+            return code != states.ZERO
+        return None
+
     # Save the original bit Alice sent
+    import qit
     aliceBit = True
     if util.equivState(state, qit.state('0')):
         aliceBit = False
@@ -40,12 +52,10 @@ def simulateEavesdrop(state, basis):
     return None
 
 def encodeBit(value):
-    """Return the quantum state representing the B92 encoding of the given binary value."""
-    q = qit.state('0')
-    if value:
-        return q.u_propagate(qit.H)
-    else:
-        return q
+    """Return the quantum state representing the B92 encoding of the given binary value.
+    The state is shared with every other qubit encoding the same value.
+    """
+    return states.toState(states.PLUS if value else states.ZERO)
 
 def encodeKey(key):
     """Return a list of quantum states corresponding to the B92 encoding of the given binary string."""
@@ -57,6 +67,10 @@ def encodeKey(key):
 
 def flipState(state):
     """Perform the transformation corresponding to a bit flip in the B92 protocol."""
+    code = states.toCode(state)
+    if code is not None:
+        return states.toState(states.HADAMARD[code])
+    import qit
     return state.u_propagate(qit.H)
 
 def matchKeys(keyA, keyB):
@@ -71,3 +85,64 @@ def matchKeys(keyA, keyB):
     keyA = [keyA[k] for k in range(len(keyA)) if match[k]]
 
     return (keyA, keyB)
+
+# Batch engine: qubits are held as arrays of integer state codes, where code 0 is |0> and
+# code 1 is +0.7071 (|0> + |1>), i.e. the code equals the bit the state encodes. Code c
+# here is code c << 1 in qkdsim.states.
+
+def encodeKeyBatch(key):
+    """Return a uint8 array of state codes for the given key, equivalent to encodeKey."""
+    return np.asarray(key, dtype=bool).astype(np.uint8)
+
+def simulateNoiseBatch(states, errorRate):
+    """Vectorized simulateNoise: apply a bit flip to each state with probability errorRate.
+    Returns a new array.
+    """
+    states = np.asarray(states, dtype=np.uint8)
+    flips = getRNG().random(states.shape) < errorRate
+    return states ^ flips.astype(np.uint8)
+
+def decodeStateBatch(states, bases, channel=None):
+    """Vectorized decodeState: return an int8 array holding the bit each state encodes where
+    the photon passed Bob's filter, and -1 where it was absorbed.
+    A filter only passes the state it is not orthogonal to after the basis change
+    (basis=0 passes |0>, basis=1 passes the Hadamard state), and then only half of the time.
+    If a qkdsim.channels.Channel is given, the states pass through it first. Bob then
+    infers the bit from the filter that passed the photon, so channel errors show up as
+    wrong bits.
+    """
+    states = np.asarray(states, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=bool)
+    if channel is not None:
+        # basis=0 measures in the Hadamard basis and basis=1 in the computational basis
+        passed = channel.measure(states << 1, ~bases)
+        return np.where(passed, bases, -1).astype(np.int8)
+
+    passed = (states.astype(bool) == bases) & getRNG().randomBits(len(states))
+    return np.where(passed, states, -1).astype(np.int8)
+
+def simulateEavesdropBatch(states, bases):
+    """Vectorized simulateEavesdrop: Eve measures every state with her filters and re-encodes
+    the results she sees. Photons absorbed by her filters are lost, so the returned array
+    only holds the states she was able to resend.
+    """
+    results = decodeStateBatch(states, bases)
+    return encodeKeyBatch(results[results != -1])
+
+def matchKeysBatch(keyA, keyB):
+    """Vectorized matchKeys: return the tuple (keyA, keyB) as bool arrays after removing bits
+    where Bob's photon was absorbed (-1 in keyB). As in matchKeys, bits of keyA beyond the
+    length of keyB are kept. If keyA is a PackedKey both keys are returned packed.
+    """
+    keyB = np.asarray(keyB)
+    detected = keyB != -1
+
+    match = np.ones(len(keyA), dtype=bool)
+    m = min(len(keyA), len(keyB))
+    match[:m] = detected[:m]
+
+    if isinstance(keyA, PackedKey):
+        return (keyA.compress(match), PackedKey.fromBits(keyB[detected]))
+
+    keyA = np.asarray(keyA, dtype=bool)
+    return (keyA[match], keyB[detected].astype(bool))
@@ -0,0 +1,102 @@
+import importlib
+import importlib.util
+
+PROTOCOLS = ('BB84', 'B92', 'E91')
+
+class Backend(object):
+    """A way of running the protocols. run() takes the arguments of the run functions and
+    returns a ProtocolResult, or an analytic.Estimate for the analytic backend. Backends
+    import what they need on first use, so choosing one never loads the others' modules.
+    """
+
+    name = None
+    requires = ()
+
+    def __repr__(self):
+        return "%s()" % type(self).__name__
+
+    def available(self):
+        """Return True if every module the backend needs can be imported."""
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+def _runFunction(protocol):
+    if protocol not in PROTOCOLS:
+        raise ValueError("Unknown protocol: %s" % protocol)
+    simulations = importlib.import_module('qkdsim.simulations')
+    return getattr(simulations, 'run' + protocol)
+
+class QitBackend(Backend):
+    """Reference backend simulating one qit state per qubit."""
+
+    name = 'qit'
+    requires = ('qit',)
+
+    def run(self, protocol, n, **kwargs):
+        kwargs.setdefault('quiet', True)
+        return _runFunction(protocol)(n, engine='qit', **kwargs)
+
+class NumpyBackend(Backend):
+    """Batch backend holding every qubit of a run in NumPy arrays. Never imports qit."""
+
+    name = 'numpy'
+
+    def run(self, protocol, n, **kwargs):
+        kwargs.setdefault('quiet', True)
+        return _runFunction(protocol)(n, engine='numpy', **kwargs)
+
+class AnalyticBackend(Backend):
+    """Closed-form expectations from qkdsim.analytic, without sampling any qubits. Options
+    of the run functions that do not change the expectations, such as quiet or engine,
+    are ignored.
+    """
+
+    name = 'analytic'
+
+    def run(self, protocol, n, eve=False, errorRate=0.0, attack=None, channel=None, **kwargs):
+        analytic = importlib.import_module('qkdsim.analytic')
+        return analytic.estimate(protocol, n, eve, errorRate, attack, channel)
+
+class FusedBackend(Backend):
+    """Single-pass BB84 and B92 from qkdsim.fused, compiled with Numba when it is
+    installed. Channels and attacks are not supported.
+    """
+
+    name = 'fused'
+
+    def run(self, protocol, n, **kwargs):
+        if protocol == 'E91':
+            raise ValueError("The fused backend does not support E91")
+        kwargs.pop('quiet', None)
+        fused = importlib.import_module('qkdsim.fused')
+        return getattr(fused, 'run' + protocol)(n, **kwargs)
+
+_registry = {}
+
+def register(backend):
+    """Add a Backend instance to the registry under its name, replacing any backend of the
+    same name.
+    """
+    _registry[backend.name] = backend
+    return backend
+
+def getBackend(name):
+    """Return the registered backend of the given name."""
+    if name not in _registry:
+        raise ValueError("Unknown backend: %s" % name)
+    backend = _registry[name]
+    if not backend.available():
+        raise ImportError("Backend %s needs %s" % (name, ', '.join(backend.requires)))
+    return backend
+
+def available():
+    """Return the names of the registered backends that can run here."""
+    return [name for name, backend in sorted(_registry.items()) if backend.available()]
+
+def run(protocol, n, backend='numpy', **kwargs):
+    """Run the protocol with the named backend, see Backend.run."""
+    return getBackend(backend).run(protocol, n, **kwargs)
+
+register(QitBackend())
+register(NumpyBackend())
+register(AnalyticBackend())
+register(FusedBackend())
@@ -1,19 +1,30 @@
 import numpy as np
-import qit
 import qkdsim.qkdutils as util
+import qkdsim.states as states
+from qkdsim.rng import getRNG
+from qkdsim.states import PROB_ONE, MINUS
+from qkdsim.packedkey import PackedKey, asPackedKey
 
 def simulateNoise(bits, errorRate):
     """Simulate channel noise, each bit can be flipped with probability given by errorRate."""
     for k in range(len(bits)):
-        p = np.random.random_sample()
+        p = getRNG().random()
         if p < errorRate:
             bits[k] = flipState(bits[k])
 
     return bits
 
 def decodeState(state, basis):
-    """Return a bool corresponding to the result of measuring the given state in the given basis."""
+    """Return a bool corresponding to the result of measuring the given state in the given basis.
+    state may also be a state code, see qkdsim.states.
+    """
+    # The four protocol states are measured by table lookup
+    code = states.toCode(state)
+    if code is not None:
+        return states.measure(code, basis, getRNG())
+
     # Change basis if necessary
+    import qit
     if basis:
         state = state.u_propagate(qit.H)
 
@@ -28,15 +39,10 @@ def simulateEavesdrop(state, basis):
     return encodeBit(result, basis)
 
 def encodeBit(value, basis):
-    """Return the quantum state representing the encoding of the given binary value in the given basis."""
-    q = qit.state('0')
-
-    if value:
-        q = q.u_propagate(qit.sx) # Apply Pauli X operator to flip the qubit
-    if basis:
-        q = q.u_propagate(qit.H) # Apply Hadamard operator to change basis
-
-    return q
+    """Return the quantum state representing the encoding of the given binary value in the given basis.
+    The state is shared with every other qubit encoding the same value in the same basis.
+    """
+    return states.toState(states.encode(value, basis))
 
 def encodeKey(key, bases):
     """Return a list of quantum states corresponding to individual qubits prepared using the
@@ -63,6 +69,11 @@ def flipState(state):
     """Perform the transformation corresponding to a bit flip on the given quantum state
     and return it.
     """
+    code = states.toCode(state)
+    if code is not None:
+        return states.toState(states.FLIP[code])
+
+    import qit
     if util.equivState(state, qit.state('0')) or util.equivState(state, qit.state('1')):
         return state.u_propagate(qit.sx)
     else:
@@ -76,3 +87,64 @@ def matchKeys(key1, key2, bases1, bases2):
     newKey1 = [key1[k] for k in range(len(key1)) if match[k]]
     newKey2 = [key2[k] for k in range(len(key1)) if match[k]]
     return (newKey1, newKey2)
+
+# Batch engine: qubits are held as arrays of the uint8 state codes defined in
+# qkdsim.states instead of one qit.state per qubit. Bit 0 of a code is the encoded value
+# and bit 1 the basis, so flips and basis checks reduce to bit operations. Codes above 3
+# only appear after an attack (see qkdsim.attacks) and are measured by table lookup.
+# Keys and bases may be given as PackedKeys, but are unpacked to full arrays here.
+
+def encodeKeyBatch(key, bases):
+    """Return a uint8 array of state codes for the given key and bases, equivalent to
+    encodeKey. key and bases are arrays (or lists) of bools of the same length.
+    """
+    key = np.asarray(key, dtype=bool)
+    bases = np.asarray(bases, dtype=bool)
+    if key.shape != bases.shape:
+        raise ValueError("key and bases must be the same length")
+
+    return key.astype(np.uint8) | (bases.astype(np.uint8) << 1)
+
+def decodeStateBatch(states, bases, channel=None):
+    """Return a bool array with the results of measuring each encoded state in the given
+    basis. Measuring in the encoding basis recovers the value, otherwise the result is
+    uniformly random, exactly as with decodeState.
+    If a qkdsim.channels.Channel is given, the states pass through it before being measured.
+    """
+    if channel is not None:
+        return channel.measure(states, bases)
+
+    states = np.asarray(states, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=bool)
+    if len(states) and states.max() > MINUS:
+        return getRNG().random(states.shape) < PROB_ONE[states, bases.astype(np.uint8)]
+
+    values = (states & 1).astype(bool)
+    match = (states >> 1).astype(bool) == bases
+    guesses = getRNG().randomBits(len(states))
+    return np.where(match, values, guesses)
+
+def simulateEavesdropBatch(states, bases):
+    """Vectorized simulateEavesdrop: measure every state in Eve's bases and re-encode the
+    results in the same bases.
+    """
+    return encodeKeyBatch(decodeStateBatch(states, bases), bases)
+
+def simulateNoiseBatch(states, errorRate):
+    """Vectorized simulateNoise: flip the encoded value of each state with probability
+    errorRate. Returns a new array.
+    """
+    states = np.asarray(states, dtype=np.uint8)
+    flips = getRNG().random(states.shape) < errorRate
+    return states ^ flips.astype(np.uint8)
+
+def matchKeysBatch(key1, key2, bases1, bases2):
+    """Vectorized matchKeys: return the tuple (key1, key2) as arrays, keeping only the bits
+    where bases1 and bases2 agree. If key1 is a PackedKey both keys are returned packed.
+    """
+    if isinstance(key1, PackedKey):
+        match = ~(asPackedKey(bases1) ^ asPackedKey(bases2))
+        return (key1.compress(match), asPackedKey(key2).compress(match))
+
+    match = np.asarray(bases1, dtype=bool) == np.asarray(bases2, dtype=bool)
+    return (np.asarray(key1)[match], np.asarray(key2)[match])
@@ -0,0 +1,117 @@
+import json
+import os
+import numpy as np
+import qkdsim
+import qkdsim.bb84 as bb84
+import qkdsim.qkdutils as util
+import qkdsim.streaming as streaming
+from qkdsim.packedkey import PackedKey
+
+# Bit strings stored in a capture, one packed .npy file each. bases_E is only written
+# when Eve is present.
+FIELDS = ('rawKey', 'bases_A', 'bases_E', 'bases_B', 'key_B')
+
+META_FILE = 'meta.json'
+
+def capture(directory, n, eve=False, errorRate=0.0, blockSize=streaming.BLOCK_SIZE):
+    """Simulate the quantum part of a BB84 run on 5*n qubits with the numpy engine and write
+    Alice's raw key and bases, Eve's bases and Bob's bases and results to memory-mapped
+    files in directory, packed eight bits to a byte. Qubits are generated blockSize at a
+    time, so the capture can be far larger than memory. Returns the Capture.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    numBits = 5 * n
+    blockSize = max(8, blockSize - blockSize % 8)
+    fields = [f for f in FIELDS if eve or f != 'bases_E']
+    files = dict((f, np.lib.format.open_memmap(os.path.join(directory, f + '.npy'), mode='w+',
+                                                dtype=np.uint8, shape=((numBits + 7) // 8,)))
+                 for f in fields)
+
+    for start in range(0, numBits, blockSize):
+        size = min(blockSize, numBits - start)
+        block = {'rawKey': util.getRandomBitArray(size), 'bases_A': util.getRandomBitArray(size)}
+        sent = bb84.encodeKeyBatch(block['rawKey'], block['bases_A'])
+        if eve:
+            block['bases_E'] = util.getRandomBitArray(size)
+            sent = bb84.simulateEavesdropBatch(sent, block['bases_E'])
+        sent = bb84.simulateNoiseBatch(sent, errorRate)
+        block['bases_B'] = util.getRandomBitArray(size)
+        block['key_B'] = bb84.decodeStateBatch(sent, block['bases_B'])
+
+        for f in fields:
+            packed = np.packbits(block[f])
+            files[f][start >> 3:(start >> 3) + len(packed)] = packed
+
+    for f in fields:
+        files[f].flush()
+    del files
+
+    meta = {'protocol': 'BB84', 'n': n, 'numBits': numBits, 'eve': eve, 'errorRate': errorRate,
+            'fields': fields, 'version': qkdsim.__version__}
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    return Capture(directory)
+
+class Capture(object):
+    """The raw data of a captured BB84 run, mapped read-only from the files written by
+    capture(). Each field in FIELDS is a PackedKey whose bytes are the mapped file itself,
+    or None if it was not captured; nothing is read until it is used.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.numBits = self.meta['numBits']
+        self.errorRate = self.meta['errorRate']
+        self.eve = self.meta['eve']
+        for f in FIELDS:
+            key = None
+            if f in self.meta['fields']:
+                data = np.load(os.path.join(directory, f + '.npy'), mmap_mode='r')
+                key = PackedKey(data, self.numBits)
+            setattr(self, f, key)
+
+    def __repr__(self):
+        return "Capture(%s, %d qubits)" % (self.directory, self.numBits)
+
+    def __len__(self):
+        return self.numBits
+
+    def blocks(self, blockSize=streaming.BLOCK_SIZE):
+        """Yield the tuple (rawKey, key_B, bases_A, bases_B) of bool arrays for each block
+        of blockSize qubits, unpacking only that block.
+        """
+        blockSize = max(8, blockSize - blockSize % 8)
+        for start in range(0, self.numBits, blockSize):
+            stop = start + blockSize
+            yield tuple(key.toBits(start, stop) for key in (self.rawKey, self.key_B, self.bases_A, self.bases_B))
+
+def replay(capture, blockSize=streaming.BLOCK_SIZE, stats=None, discloseFraction=None):
+    """Run matchKeys, discloseHalf and the counts behind detectEavesdrop over a Capture (or
+    the directory of one) block by block, as streaming.streamBB84 does for a live run.
+    With discloseFraction, a random sample of that fraction of each block's sifted bits
+    is announced instead of every other bit. Yields the kept (key_A, key_B) of each block;
+    pass a StreamStats as stats to read the verdict once the replay is exhausted.
+    """
+    if not isinstance(capture, Capture):
+        capture = Capture(capture)
+    if stats is None: stats = streaming.StreamStats()
+    stats.rawBits = capture.numBits
+    blocks = (bb84.matchKeysBatch(*block) for block in capture.blocks(blockSize))
+    return streaming.disclose(blocks, stats, fraction=discloseFraction)
+
+def analyze(capture, errorRate=None, blockSize=streaming.BLOCK_SIZE, discloseFraction=None):
+    """Replay a capture without keeping any key bits and return the tuple (stats, detected),
+    where detected is the verdict of detectEavesdrop for the given error rate, by default
+    the one the capture was simulated with. discloseFraction is passed on to replay.
+    """
+    if not isinstance(capture, Capture):
+        capture = Capture(capture)
+    if errorRate is None:
+        errorRate = capture.errorRate
+    stats = streaming.StreamStats()
+    for block in replay(capture, blockSize, stats, discloseFraction):
+        pass
+    return (stats, stats.detected(errorRate))
@@ -0,0 +1,126 @@
+import numpy as np
+import qkdsim.states as states
+from qkdsim.rng import getRNG
+
+# Typical attenuation of telecom fibre at 1550nm, in dB/km
+ATTENUATION = 0.2
+
+_I = np.eye(2, dtype=complex)
+_X = np.array([[0, 1], [1, 0]], dtype=complex)
+_Y = np.array([[0, -1j], [1j, 0]])
+_Z = np.array([[1, 0], [0, -1]], dtype=complex)
+
+# Density matrix of each state code
+DENSITY = np.einsum('ni,nj->nij', states.VECTORS, states.VECTORS).astype(complex)
+
+class Channel(object):
+    """Quantum channel acting on single qubits, given by its Kraus operators, together
+    with the probability that a photon survives it at all. Channels are applied to whole
+    batches of density matrices at once, and compose with compose() or the >> operator:
+    (a >> b) applies a and then b.
+    """
+
+    def __init__(self, kraus, transmittance=1.0, name='channel'):
+        self.kraus = np.asarray(kraus, dtype=complex).reshape(-1, 2, 2)
+        self.transmittance = float(transmittance)
+        self.name = name
+        self._probOne = None
+
+    def __repr__(self):
+        return "Channel(%s, %d Kraus operators, transmittance=%g)" % (self.name, len(self.kraus), self.transmittance)
+
+    def isTracePreserving(self):
+        total = np.einsum('kji,kjl->il', self.kraus.conj(), self.kraus)
+        return np.allclose(total, _I)
+
+    def apply(self, rho):
+        """Return the density matrices rho, of shape (..., 2, 2), after the channel."""
+        K = self.kraus
+        return np.einsum('kij,...jl,kml->...im', K, rho, K.conj())
+
+    def applyToPair(self, rho):
+        """Return the two-qubit density matrices rho, of shape (..., 4, 4), after the second
+        qubit of each pair passes through the channel.
+        """
+        K = np.einsum('ab,kij->kaibj', _I, self.kraus).reshape(-1, 4, 4)
+        return np.einsum('kij,...jl,kml->...im', K, rho, K.conj())
+
+    def compose(self, other):
+        """Return the channel applying this one and then other."""
+        kraus = np.einsum('jab,ibc->jiac', other.kraus, self.kraus).reshape(-1, 2, 2)
+        return Channel(kraus, self.transmittance * other.transmittance,
+                       '%s >> %s' % (self.name, other.name))
+
+    def __rshift__(self, other):
+        return self.compose(other)
+
+    def probOne(self):
+        """Return the table P[code, basis] of the probability of measuring 1 in the given
+        basis after a qubit with the given state code passes through the channel. Since
+        only four input states exist, the channel is applied to those once and the table
+        is reused for every qubit.
+        """
+        if self._probOne is None:
+            out = self.apply(DENSITY)
+            onesZ = out[:, 1, 1].real
+            onesX = np.einsum('i,nij,j->n', states.VECTORS[states.MINUS], out, states.VECTORS[states.MINUS]).real
+            self._probOne = np.clip(np.stack([onesZ, onesX], axis=1), 0, 1)
+        return self._probOne
+
+    def errorRate(self):
+        """Return the probability that a BB84 state, measured in its own basis after the
+        channel, gives the wrong bit, averaged over the four states.
+        """
+        codes = np.arange(4)
+        ones = self.probOne()[codes, codes >> 1]
+        return float(np.mean(np.where(codes & 1, 1 - ones, ones)))
+
+    def measure(self, codes, bases):
+        """Return a bool array with the results of measuring qubits with the given state
+        codes in the given bases after the channel.
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        bases = np.asarray(bases, dtype=bool).astype(np.uint8)
+        return getRNG().random(codes.shape) < self.probOne()[codes, bases]
+
+    def transmit(self, numPhotons):
+        """Return a bool array marking which of numPhotons photons survive the channel."""
+        if self.transmittance >= 1:
+            return np.ones(numPhotons, dtype=bool)
+        return getRNG().random(numPhotons) < self.transmittance
+
+def compose(*channels):
+    """Return the channel applying each of the given channels in turn."""
+    out = identity()
+    for channel in channels:
+        out = out.compose(channel)
+    return out
+
+def identity():
+    return Channel([_I], name='identity')
+
+def bitFlip(p):
+    """Pauli X with probability p, the noise model of simulateNoise."""
+    return Channel([np.sqrt(1 - p) * _I, np.sqrt(p) * _X], name='bitFlip(%g)' % p)
+
+def dephasing(p):
+    """Pauli Z with probability p."""
+    return Channel([np.sqrt(1 - p) * _I, np.sqrt(p) * _Z], name='dephasing(%g)' % p)
+
+def depolarizing(p):
+    """Replace the qubit with the maximally mixed state with probability p."""
+    return Channel([np.sqrt(1 - 3*p/4) * _I, np.sqrt(p/4) * _X, np.sqrt(p/4) * _Y, np.sqrt(p/4) * _Z],
+                   name='depolarizing(%g)' % p)
+
+def amplitudeDamping(gamma):
+    """Decay from |1> to |0> with probability gamma."""
+    K0 = np.array([[1, 0], [0, np.sqrt(1 - gamma)]])
+    K1 = np.array([[0, np.sqrt(gamma)], [0, 0]])
+    return Channel([K0, K1], name='amplitudeDamping(%g)' % gamma)
+
+def loss(distance, attenuation=ATTENUATION):
+    """Photon loss over distance km of fibre with the given attenuation in dB/km. Photons
+    that survive are unchanged.
+    """
+    transmittance = 10 ** (-attenuation * distance / 10.0)
+    return Channel([_I], transmittance, name='loss(%gkm)' % distance)
@@ -0,0 +1,220 @@
+from math import exp, factorial
+import numpy as np
+import qkdsim.channels as channels
+from qkdsim.amplification import binaryEntropy
+from qkdsim.rng import getRNG
+
+# Intensity classes. Alice sends weak coherent pulses with one of these mean photon
+# numbers, chosen at random per pulse with the given probabilities; key bits come from
+# the signal pulses only.
+SIGNAL, DECOY, VACUUM = 0, 1, 2
+INTENSITIES = (0.5, 0.1, 0.0)
+PROBABILITIES = (0.8, 0.1, 0.1)
+
+# Detector model: probability of a dark count per pulse (the vacuum yield Y0), detector
+# efficiency, and the probability that a detected photon gives the wrong bit
+DARK_COUNT = 1e-5
+DETECTOR_EFFICIENCY = 0.1
+MISALIGNMENT = 0.015
+
+# Error correction leaks EC_EFFICIENCY times the Shannon limit h(E) per bit
+EC_EFFICIENCY = 1.16
+
+# Photon numbers at or above MAX_PHOTONS are counted together
+MAX_PHOTONS = 16
+
+# Number of pulses simulated at a time
+CHUNK_PULSES = 1 << 22
+
+class DecoyStats(object):
+    """Counts from a decoy-state run, indexed by intensity class c and photon number k:
+        sent[c, k]     = pulses sent
+        detected[c, k] = pulses that gave a detection
+        errors[c, k]   = detections with the wrong bit
+        sifted[c]      = detections where Alice and Bob's bases agree
+    Chunks of a long run accumulate into the same DecoyStats, and two can be merged.
+    The photon numbers are known only to the simulation; gains(), errorRates() and
+    bounds() use the per-class totals that Alice and Bob actually observe.
+    """
+
+    def __init__(self, intensities=INTENSITIES):
+        self.intensities = tuple(float(mu) for mu in intensities)
+        shape = (len(self.intensities), MAX_PHOTONS + 1)
+        self.sent = np.zeros(shape, dtype=np.int64)
+        self.detected = np.zeros(shape, dtype=np.int64)
+        self.errors = np.zeros(shape, dtype=np.int64)
+        self.sifted = np.zeros(len(self.intensities), dtype=np.int64)
+
+    def __repr__(self):
+        return "DecoyStats(%d pulses, rate=%.3g)" % (self.pulses(), self.keyRate())
+
+    def merge(self, other):
+        self.sent += other.sent
+        self.detected += other.detected
+        self.errors += other.errors
+        self.sifted += other.sifted
+        return self
+
+    def pulses(self):
+        return int(self.sent.sum())
+
+    def gains(self):
+        """Return the gain Q of each intensity class, the fraction of its pulses detected."""
+        return self.detected.sum(axis=1) / np.maximum(self.sent.sum(axis=1), 1.0)
+
+    def errorRates(self):
+        """Return the error rate E of the detections in each intensity class."""
+        return self.errors.sum(axis=1) / np.maximum(self.detected.sum(axis=1), 1.0)
+
+    def photonYields(self):
+        """Return the true yield Y_k of k-photon pulses over all classes, known only to the
+        simulation, for checking the bounds against.
+        """
+        return self.detected.sum(axis=0) / np.maximum(self.sent.sum(axis=0), 1.0)
+
+    def bounds(self):
+        """Return the dict of decoy-state estimates from the observed gains and error rates,
+        using the vacuum + weak decoy bounds of Ma et al. (2005):
+            Y0 = vacuum yield
+            Y1 = lower bound on the single-photon yield
+            Q1 = lower bound on the single-photon gain of the signal pulses
+            e1 = upper bound on the single-photon error rate
+        """
+        mu, nu = self.intensities[SIGNAL], self.intensities[DECOY]
+        Q, E = self.gains(), self.errorRates()
+        Y0 = Q[VACUUM]
+        Y1 = mu / (mu * nu - nu ** 2) * (Q[DECOY] * exp(nu) - Q[SIGNAL] * exp(mu) * nu ** 2 / mu ** 2
+                                          - (mu ** 2 - nu ** 2) / mu ** 2 * Y0)
+        Y1 = max(Y1, 0.0)
+        e1 = (E[DECOY] * Q[DECOY] * exp(nu) - 0.5 * Y0) / (Y1 * nu) if Y1 > 0 else 0.5
+        return {'Y0': Y0, 'Y1': Y1, 'Q1': Y1 * mu * exp(-mu), 'e1': min(max(e1, 0.0), 0.5)}
+
+    def keyRate(self, ecEfficiency=EC_EFFICIENCY):
+        """Return the GLLP lower bound on the secret key rate per signal pulse,
+            R = 1/2 (Q1 (1 - h(e1)) - f Q h(E)),
+        where the factor 1/2 is the BB84 sifting ratio and Q, E are the signal gain and
+        error rate. Returns 0 if no key can be extracted.
+        """
+        if not self.sent[SIGNAL].sum() or not self.sent[DECOY].sum() or not self.sent[VACUUM].sum():
+            return 0.0
+        b = self.bounds()
+        Q, E = self.gains()[SIGNAL], self.errorRates()[SIGNAL]
+        rate = 0.5 * (b['Q1'] * (1 - binaryEntropy(b['e1'])) - ecEfficiency * Q * binaryEntropy(E))
+        return max(rate, 0.0)
+
+    def secretBits(self, ecEfficiency=EC_EFFICIENCY):
+        """Return the number of secret bits the signal pulses of the run yield."""
+        return int(self.keyRate(ecEfficiency) * self.sent[SIGNAL].sum())
+
+    def asDict(self):
+        b = self.bounds()
+        return {
+            'pulses': self.pulses(),
+            'intensities': list(self.intensities),
+            'gains': self.gains().tolist(),
+            'errorRates': self.errorRates().tolist(),
+            'sifted': self.sifted.tolist(),
+            'Y0': b['Y0'], 'Y1': b['Y1'], 'Q1': b['Q1'], 'e1': b['e1'],
+            'keyRate': self.keyRate(),
+            'secretBits': self.secretBits(),
+        }
+
+    def render(self):
+        """Return a human-readable summary of the run."""
+        lines = ["=====Decoy-state BB84=====", "%d pulses" % self.pulses()]
+        Q, E = self.gains(), self.errorRates()
+        for c, name in enumerate(('signal', 'decoy', 'vacuum')):
+            lines.append("%-7s mu=%.3f  gain %.4e  error rate %.4f" % (name + ':', self.intensities[c], Q[c], E[c]))
+        b = self.bounds()
+        lines.append("Y1 >= %.4e, e1 <= %.4f" % (b['Y1'], b['e1']))
+        lines.append("Key rate: %.4e bits per signal pulse, %d secret bits" % (self.keyRate(), self.secretBits()))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.render()
+
+def _errorProbability(channel, misalignment):
+    """Return the probability that a detected photon gives the wrong bit, from either the
+    misalignment or the errors the channel's Kraus map causes on the BB84 states.
+    """
+    e = channel.errorRate()
+    return misalignment * (1 - e) + e * (1 - misalignment)
+
+def photonTables(transmittance, darkCount=DARK_COUNT, misalignment=MISALIGNMENT):
+    """Return the tables (Y, EY) over photon numbers k = 0..MAX_PHOTONS of the yield
+        Y_k = 1 - (1 - Y0)(1 - eta)^k
+    and of the product E_k Y_k = Y0/2 + eD (1 - (1 - eta)^k), where eta is the overall
+    transmittance including the detector.
+    """
+    k = np.arange(MAX_PHOTONS + 1)
+    arrive = 1 - (1 - transmittance) ** k
+    Y = 1 - (1 - darkCount) * (1 - arrive)
+    EY = 0.5 * darkCount + misalignment * arrive
+    return (Y, EY)
+
+def poissonTable(mu):
+    """Return the cumulative Poisson distribution P(N <= k) for k = 0..MAX_PHOTONS - 1."""
+    p = np.array([exp(-mu) * mu ** k / factorial(k) for k in range(MAX_PHOTONS)])
+    return np.cumsum(p)
+
+def simulate(numPulses, distance=0.0, channel=None, intensities=INTENSITIES,
+             probabilities=PROBABILITIES, darkCount=DARK_COUNT, efficiency=DETECTOR_EFFICIENCY,
+             misalignment=MISALIGNMENT, chunkSize=CHUNK_PULSES, stats=None):
+    """Simulate numPulses weak coherent pulses of decoy-state BB84 over distance km of
+    fibre, or through the given qkdsim.channels.Channel, and return the DecoyStats. The
+    channel's transmittance sets the loss, and the error rate its Kraus map causes on the
+    BB84 states adds to the misalignment.
+    Each pulse gets an intensity class and a Poisson photon number, and is detected with
+    the yield of that photon number, so every step is a table lookup over whole arrays
+    and chunkSize pulses are processed at a time. Pass stats to add to earlier counts.
+    """
+    if channel is None:
+        channel = channels.loss(distance)
+    if stats is None:
+        stats = DecoyStats(intensities)
+    eta = channel.transmittance * efficiency
+    Y, EY = photonTables(eta, darkCount, _errorProbability(channel, misalignment))
+    classLimits = np.cumsum(probabilities)[:-1]
+    # The cumulative tables of all classes side by side, class c offset by c, so one
+    # search of c + u finds the photon numbers of every class at once
+    poisson = np.concatenate([c + poissonTable(mu) for c, mu in enumerate(intensities)])
+    size = len(intensities) * (MAX_PHOTONS + 1)
+
+    rng = getRNG()
+    for start in range(0, numPulses, chunkSize):
+        count = min(chunkSize, numPulses - start)
+        classes = np.searchsorted(classLimits, rng.random(count), side='right')
+
+        # Photon numbers by inverting each class's cumulative distribution
+        photons = np.searchsorted(poisson, classes + rng.random(count), side='right') - classes * MAX_PHOTONS
+
+        # One uniform decides both the detection and whether it is an error, since
+        # E_k Y_k <= Y_k
+        u = rng.random(count)
+        detected = u < Y[photons]
+        wrong = u < EY[photons]
+        matched = rng.randomBits(count)
+
+        index = classes * (MAX_PHOTONS + 1) + photons
+        stats.sent += np.bincount(index, minlength=size).reshape(stats.sent.shape)
+        stats.detected += np.bincount(index[detected], minlength=size).reshape(stats.sent.shape)
+        stats.errors += np.bincount(index[wrong], minlength=size).reshape(stats.sent.shape)
+        stats.sifted += np.bincount(classes[detected & matched], minlength=len(intensities))
+
+    return stats
+
+def expectedGains(distance=0.0, channel=None, intensities=INTENSITIES, darkCount=DARK_COUNT,
+                  efficiency=DETECTOR_EFFICIENCY, misalignment=MISALIGNMENT):
+    """Return the arrays (Q, E) of the expected gain and error rate of each intensity
+    class, Q = Y0 + 1 - exp(-eta mu) and E Q = Y0/2 + eD (1 - exp(-eta mu)), where eD
+    combines the misalignment with the channel's errors as in simulate.
+    """
+    if channel is None:
+        channel = channels.loss(distance)
+    misalignment = _errorProbability(channel, misalignment)
+    eta = channel.transmittance * efficiency
+    mu = np.asarray(intensities, dtype=float)
+    arrive = 1 - np.exp(-eta * mu)
+    Q = darkCount + arrive - darkCount * arrive
+    E = (0.5 * darkCount + misalignment * arrive) / Q
+    return (Q, E)
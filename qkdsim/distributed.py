@@ -0,0 +1,266 @@
+import argparse
+import ipaddress
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import numpy as np
+import qkdsim.trials as trials
+
+# Environment variable holding the shared secret that workers authenticate with. There is
+# no default: a coordinator on a loopback address makes up a random key when none is
+# given, and one reachable from other hosts refuses to start without one.
+AUTHKEY_VARIABLE = 'QKDSIM_AUTHKEY'
+
+# Number of times a task is handed out again after the worker running it is lost
+RETRIES = 3
+
+# Seconds runTrials waits for any result before giving up
+RESULT_TIMEOUT = 600
+
+# Longest message accepted from the other side, in bytes
+MAX_MESSAGE = 1 << 20
+
+# Seconds the coordinator waits before accepting again after the listener fails, e.g.
+# when out of file descriptors, doubling on each further failure up to MAX_ACCEPT_DELAY
+ACCEPT_DELAY = 0.05
+MAX_ACCEPT_DELAY = 5.0
+
+_log = logging.getLogger(__name__)
+
+class _Task(object):
+    def __init__(self, campaign, index, args):
+        self.campaign = campaign
+        self.index = index
+        self.args = args
+        self.attempts = 0
+
+def _isLoopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def _authkey(authkey):
+    """Return authkey, or the key in QKDSIM_AUTHKEY, as bytes, or None if neither is set."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if isinstance(authkey, str):
+        authkey = authkey.encode('utf-8')
+    return authkey
+
+# Messages are JSON rather than pickles, so a peer can at worst send bad numbers, never code
+
+def _send(conn, message):
+    conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+def _recv(conn):
+    return json.loads(conn.recv_bytes(MAX_MESSAGE).decode('utf-8'))
+
+class Coordinator(object):
+    """Hands out chunks of trials to workers connected over TCP and merges their results.
+    Workers connect with runWorker, from any host that can reach address, and may join or
+    leave at any time. Several threads may call runTrials at once; their chunks share
+    the workers and each call collects only its own results. A chunk whose worker disconnects, or takes longer than taskTimeout
+    seconds, is handed out again up to retries times. Trial k of a campaign always draws
+    from stream k of its seed, so results do not depend on which worker ran it.
+    authkey is the secret workers must prove they know, by default QKDSIM_AUTHKEY. It is
+    required unless address is a loopback address, where a random key is made up; either
+    way it is available as the authkey attribute.
+    """
+
+    def __init__(self, address=('localhost', 0), authkey=None, taskTimeout=None, retries=RETRIES):
+        self.authkey = _authkey(authkey)
+        if self.authkey is None:
+            if not _isLoopback(address[0]):
+                raise ValueError("An authkey, or %s, is required to listen on %s" % (AUTHKEY_VARIABLE, address[0]))
+            self.authkey = os.urandom(32)
+
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.taskTimeout = taskTimeout
+        self.retries = retries
+        self.workers = 0
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._campaigns = 0
+        # Result queue of each runTrials call in progress, by campaign id
+        self._results = {}
+        self._closed = False
+        self._acceptor = threading.Thread(target=self._accept)
+        self._acceptor.daemon = True
+        self._acceptor.start()
+
+    def __repr__(self):
+        return "Coordinator(%s:%d, %d workers)" % (self.address[0], self.address[1], self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Tell the connected workers to stop and stop accepting new ones."""
+        self._closed = True
+        with self._lock:
+            workers = self.workers
+        for k in range(workers):
+            self._tasks.put(None)
+        self.listener.close()
+
+    def _accept(self):
+        delay = ACCEPT_DELAY
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError) as e:
+                _log.info("Rejected worker: %s", e)
+                continue
+            except Exception as e:
+                # Once closed the listener raises here
+                if self._closed:
+                    return
+                _log.warning("Accepting workers failed, retrying in %g s: %s", delay, e)
+                time.sleep(delay)
+                delay = min(2 * delay, MAX_ACCEPT_DELAY)
+                continue
+            delay = ACCEPT_DELAY
+            serve = threading.Thread(target=self._serve, args=(conn,))
+            serve.daemon = True
+            serve.start()
+
+    def _serve(self, conn):
+        """Feed tasks to one worker until it is lost or the coordinator closes."""
+        with self._lock:
+            self.workers += 1
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    _send(conn, None)
+                    return
+                results = self._results.get(task.campaign)
+                if results is None:
+                    # Left over from a runTrials call that has given up
+                    continue
+                try:
+                    _send(conn, task.args)
+                    if self.taskTimeout is not None and not conn.poll(self.taskTimeout):
+                        raise EOFError("worker timed out")
+                    results.put((task, trials.TrialStats.fromState(_recv(conn))))
+                except (EOFError, OSError, ValueError, KeyError, TypeError):
+                    results.put((task, None))
+                    return
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.workers -= 1
+            conn.close()
+
+    def runTrials(self, protocol, numTrials, n, eve=False, errorRate=0.0, seed=None, chunkSize=None,
+                  bins=trials.ERROR_BINS, callback=None, timeout=RESULT_TIMEOUT):
+        """Run numTrials trials over the connected workers and return the aggregated
+        TrialStats, as trials.runTrials does over local processes. If given, callback is
+        called with the running TrialStats as each chunk comes back.
+        """
+        if protocol not in trials.PROTOCOLS:
+            raise ValueError("Unknown protocol: %s" % protocol)
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        if chunkSize is None:
+            chunkSize = max(1, -(-numTrials // (4 * max(self.workers, 1))))
+
+        results = queue.Queue()
+        with self._lock:
+            self._campaigns += 1
+            campaign = self._campaigns
+            self._results[campaign] = results
+
+        stats = trials.TrialStats(bins)
+        stats.seed = seed
+        bins = np.asarray(bins, dtype=float).tolist()
+        pending = set()
+        for start in range(0, numTrials, chunkSize):
+            stop = min(start + chunkSize, numTrials)
+            args = [protocol, int(n), bool(eve), float(errorRate), seed, start, stop, bins]
+            pending.add(start)
+            self._tasks.put(_Task(campaign, start, args))
+
+        try:
+            while pending:
+                try:
+                    task, result = results.get(timeout=timeout)
+                except queue.Empty:
+                    raise RuntimeError("No results from workers for %d seconds" % timeout)
+
+                if result is None:
+                    task.attempts += 1
+                    if task.attempts > self.retries:
+                        raise RuntimeError("Chunk at trial %d failed on %d workers" % (task.index, task.attempts))
+                    self._tasks.put(task)
+                elif task.index in pending:
+                    pending.discard(task.index)
+                    stats.merge(result)
+                    if callback: callback(stats)
+        finally:
+            # Workers skip whatever is left of this call's tasks
+            with self._lock:
+                del self._results[campaign]
+
+        return stats
+
+def _runTask(args):
+    """Check the types of a task received from the coordinator and run it."""
+    protocol, n, eve, errorRate, seed, start, stop, bins = args
+    if protocol not in trials.PROTOCOLS:
+        raise ValueError("Unknown protocol: %s" % protocol)
+    seeds = seed if isinstance(seed, list) else [seed]
+    if not all(isinstance(s, int) and s >= 0 for s in seeds):
+        raise ValueError("Invalid seed: %r" % seed)
+    stats = trials.runChunk(protocol, int(n), bool(eve), float(errorRate), seed, int(start), int(stop),
+                            np.asarray(bins, dtype=float))
+    return stats.toState()
+
+def runWorker(address, authkey=None):
+    """Connect to the coordinator at address and run the chunks of trials it sends until it
+    closes. authkey must match the coordinator's, by default QKDSIM_AUTHKEY. Returns the
+    number of chunks run.
+    """
+    authkey = _authkey(authkey)
+    if authkey is None:
+        raise ValueError("runWorker needs the coordinator's authkey, or %s" % AUTHKEY_VARIABLE)
+    conn = Client(tuple(address), authkey=authkey)
+    count = 0
+    try:
+        while True:
+            try:
+                args = _recv(conn)
+            except EOFError:
+                break
+            if args is None:
+                break
+            _send(conn, _runTask(args))
+            count += 1
+    finally:
+        conn.close()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a qkdsim worker for a remote coordinator. "
+                                                 "The shared key is read from %s." % AUTHKEY_VARIABLE)
+    parser.add_argument('address', help="coordinator address as host:port")
+    args = parser.parse_args()
+    host, port = args.address.rsplit(':', 1)
+    count = runWorker((host, int(port)))
+    print("Ran %d chunks" % count)
+
+if __name__ == '__main__':
+    main()
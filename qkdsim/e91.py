@@ -1,6 +1,27 @@
-from math import pi, cos, sqrt
+from math import pi, cos, sin, sqrt
 import numpy as np
-from Crypto.Random import random
+import qkdsim.channels as channels
+from qkdsim.rng import getRNG
+from qkdsim.packedkey import PackedKey, asPackedKey
+
+AXES_A = [0, pi/8, pi/4]
+AXES_B = [0, pi/8, -pi/8]
+
+# Singlet state +0.7071 |01> -0.7071 |10> shared by Alice (first qubit) and Bob
+SINGLET = np.outer([0, 1, -1, 0], [0, 1, -1, 0]) / 2.0
+
+# Correlations summed in the CHSH parameter, as (index into AXES_A, index into AXES_B,
+# sign). |S| is 2*sqrt(2) for the singlet, and at most CHSH_BOUND if Eve's measurements
+# have broken the entanglement.
+CHSH_TERMS = [(0, 1, 1), (0, 2, 1), (2, 1, 1), (2, 2, -1)]
+CHSH_BOUND = 2.0
+
+# Fewest pairs every CHSH term needs before the Bell test reaches a verdict. With fewer,
+# even the singlet falls below the bound too often for an abort to mean anything.
+MIN_TERM_PAIRS = 25
+
+# Standard errors by which |S| must fall below the bound before a run aborts
+BELL_Z = 3.0
 
 def chooseAxes(numBits):
     """Return Alice and Bob's randomly chosen mstment axes for the specified
@@ -8,13 +29,12 @@ def chooseAxes(numBits):
            A chooses from (0, pi/4, pi/2) with equal probability,
            B chooses from (pi/4, pi/2, 3pi/4) with equal probability.
     """
-    choicesA = [0, pi/8, pi/4]
-    choicesB = [0, pi/8, -pi/8]
+    rng = getRNG()
     basesA = []
     basesB = []
     for j in range(numBits):
-        basesA.append(random.choice(choicesA))
-        basesB.append(random.choice(choicesB))
+        basesA.append(rng.choice(AXES_A))
+        basesB.append(rng.choice(AXES_B))
 
     return (basesA, basesB)
 
@@ -54,28 +74,193 @@ def matchKeys(key1, key2, bases1, bases2):
 def measureEntangledState(basisA, basisB, errorRate=0.0):
     """Return Alice and Bob's measurement results on a pair of maximally
     entangled qubits. basis[A,B] contain Alice and Bob's axes of mstment.
+    Bob's result equals Alice's with probability (1 + r)/2 for the correlation r of
+    their axes, which reproduces the singlet statistics exactly; it used to be a
+    thresholded Gaussian, whose correlations were too weak for a Bell violation.
     """
     # Alice measures either basis state with equal probability
     # -1 will correspond to False (0) and +1 will correspond to True (1)
-    resultA = random.choice([-1, 1])
+    resultA = getRNG().choice([-1, 1])
 
     # If Alice and Bob chose the same axis of mstment, Bob's result is
     # perfectly anti-correlated with Alice's. Otherwise its correlation
-    # coefficient is given by -cos[2(basisA-basisB)]. We use the result
-    # r to generate a correlated random number that gives Bob's result.
+    # coefficient is given by -cos[2(basisA-basisB)], so Bob's result equals
+    # Alice's with probability (1 + r)/2.
     r = -1 * cos(2 * (basisA - basisB))
-    r2 = r ** 2
-    ve = 1 - r2
-    SD = sqrt(ve)
-    e = np.random.normal(0, SD)
-    resultB = resultA * r + e
+    resultB = resultA if getRNG().random() < (1 + r) / 2 else -resultA
 
     resultA = False if resultA < 0 else True
     resultB = False if resultB < 0 else True
 
     if errorRate:
-        samples = np.random.rand(2)
+        samples = getRNG().random(2)
         if samples[0] < errorRate: resultA = not(resultA)
         if samples[1] < errorRate: resultB = not(resultB)
 
     return (resultA, resultB)
+
+def chooseAxesBatch(numBits):
+    """Vectorized chooseAxes: return Alice and Bob's measurement axes for numBits pairs as
+    two float arrays.
+    """
+    rng = getRNG()
+    basesA = np.array(AXES_A)[rng.integers(len(AXES_A), numBits)]
+    basesB = np.array(AXES_B)[rng.integers(len(AXES_B), numBits)]
+    return (basesA, basesB)
+
+def formatBasesForPrintBatch(bases):
+    """Vectorized formatBasesForPrint, returning the same list of values."""
+    bases = np.asarray(bases, dtype=float)
+    out = np.select([bases == 0, bases == pi/8, bases == pi/4, bases == -pi/8], [1, 2, 3, 4], 0)
+    return out[out != 0].tolist()
+
+def matchKeysBatch(key1, key2, bases1, bases2):
+    """Vectorized matchKeys: return the tuple (key1, key2, discard1, discard2) as bool
+    arrays. As in matchKeys, Bob's sifted bits are inverted to undo the anti-correlation.
+    If key1 is a PackedKey all four keys are returned packed.
+    """
+    match = np.asarray(bases1) == np.asarray(bases2)
+    if isinstance(key1, PackedKey):
+        key2 = asPackedKey(key2)
+        return (key1.compress(match), ~key2.compress(match), key1.compress(~match), key2.compress(~match))
+
+    key1 = np.asarray(key1, dtype=bool)
+    key2 = np.asarray(key2, dtype=bool)
+    return (key1[match], np.logical_not(key2[match]), key1[~match], key2[~match])
+
+def measureEntangledStateBatch(basesA, basesB, errorRate=0.0, channel=None):
+    """Vectorized measureEntangledState: return Alice and Bob's results for every pair as
+    two bool arrays, drawn from the same correlated distribution.
+    If a qkdsim.channels.Channel is given, Bob's half of each pair passes through it and
+    the results are sampled from the exact joint distribution of the noisy pair.
+    """
+    basesA = np.asarray(basesA, dtype=float)
+    basesB = np.asarray(basesB, dtype=float)
+
+    rng = getRNG()
+    rho = channel.applyToPair(SINGLET) if channel is not None else SINGLET
+    resultA, resultB = _sampleJoint(basesA, basesB, rho)
+
+    if errorRate:
+        resultA ^= rng.random(resultA.shape) < errorRate
+        resultB ^= rng.random(resultB.shape) < errorRate
+
+    return (resultA, resultB)
+
+def jointProbabilities(basisA, basisB, rho=SINGLET):
+    """Return the probabilities [P(0,0), P(0,1), P(1,0), P(1,1)] of Alice and Bob's results
+    when measuring the pair state rho along the given axes. A measurement along angle t
+    gives 0 for cos(t)|0> + sin(t)|1> and 1 for the orthogonal state.
+    """
+    vA = np.array([[np.cos(basisA), np.sin(basisA)], [-np.sin(basisA), np.cos(basisA)]])
+    vB = np.array([[np.cos(basisB), np.sin(basisB)], [-np.sin(basisB), np.cos(basisB)]])
+    v = np.einsum('xi,yj->xyij', vA, vB).reshape(4, 4)
+    return np.einsum('ni,ij,nj->n', v, rho, v).real
+
+def cumulativeTable(rho=SINGLET):
+    """Return the cumulative distributions of the outcome 2*x + y of Alice and Bob's
+    results x and y on pairs in the state rho, one row for each pair of axes with Alice's
+    axis AXES_A[a] and Bob's AXES_B[b] in row a*3 + b. The last column, always 1, is left out.
+    """
+    table = np.array([jointProbabilities(a, b, rho) for a in AXES_A for b in AXES_B])
+    return np.cumsum(table, axis=1)[:, :3]
+
+SINGLET_TABLE = cumulativeTable(SINGLET)
+
+def _sampleJoint(basesA, basesB, rho):
+    """Sample Alice and Bob's results on pairs in the state rho by looking up the
+    cumulative distribution of each pair's axes and comparing one uniform against it.
+    """
+    table = SINGLET_TABLE if rho is SINGLET else cumulativeTable(rho)
+    index = _axisIndex(basesA, AXES_A) * len(AXES_B) + _axisIndex(basesB, AXES_B)
+    u = getRNG().random(len(index))
+
+    # Outcome k = 2x + y is the number of cumulative probabilities at or below u
+    outcome = np.zeros(len(index), dtype=np.uint8)
+    for column in table.T:
+        outcome += u >= column[index]
+    return (outcome >= 2, (outcome & 1).astype(bool))
+
+def interceptChannel(fraction=1.0):
+    """Return the channel Eve applies to Bob's particles when she intercepts the given
+    fraction of them, measures each along one of Bob's axes chosen at random and resends
+    the state she saw. Her measurement breaks the entanglement with Alice's particle.
+    """
+    kraus = [sqrt(1 - fraction) * np.eye(2)]
+    for t in AXES_B:
+        for v in ([cos(t), sin(t)], [-sin(t), cos(t)]):
+            kraus.append(sqrt(fraction / len(AXES_B)) * np.outer(v, v))
+    return channels.Channel(kraus, name='intercept')
+
+def _axisIndex(bases, axes):
+    """Return the uint8 index into axes of each of the given angles."""
+    bases = np.asarray(bases, dtype=float)
+    index = (bases == axes[1]).view(np.uint8)
+    for k in range(2, len(axes)):
+        index += (bases == axes[k]).view(np.uint8) * np.uint8(k)
+    return index
+
+class CHSHAccumulator(object):
+    """Running estimate of the CHSH parameter S from the results of pairs measured along
+    different axes. Results can be added in chunks with update() as they are produced, and
+    accumulators from separate chunks combined with merge().
+    """
+
+    def __init__(self):
+        # counts[a, b, equal] for the indices of Alice and Bob's axes
+        self.counts = np.zeros((len(AXES_A), len(AXES_B), 2), dtype=np.int64)
+
+    def __repr__(self):
+        return "CHSHAccumulator(S=%.4f, pairs=%d)" % (self.value(), self.pairs())
+
+    def update(self, basesA, basesB, resultsA, resultsB):
+        """Add the results of a chunk of pairs. Pairs outside the CHSH terms are counted
+        but do not enter S.
+        """
+        a = _axisIndex(basesA, AXES_A)
+        b = _axisIndex(basesB, AXES_B)
+        equal = np.asarray(resultsA, dtype=bool) == np.asarray(resultsB, dtype=bool)
+        index = (a * len(AXES_B) + b) * 2 + equal
+        self.counts += np.bincount(index, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def pairs(self):
+        """Return the number of pairs in the CHSH terms."""
+        return int(sum(self.counts[a, b].sum() for a, b, sign in CHSH_TERMS))
+
+    def correlations(self):
+        """Return the table E[a, b] of the mean product of Alice and Bob's results as +-1,
+        or 0 where no pairs were measured.
+        """
+        total = self.counts.sum(axis=2)
+        return (self.counts[:, :, 1] - self.counts[:, :, 0]) / np.maximum(total, 1.0)
+
+    def value(self):
+        """Return the estimate of |S|."""
+        E = self.correlations()
+        return abs(sum(sign * E[a, b] for a, b, sign in CHSH_TERMS))
+
+    def standardError(self):
+        """Return the standard error of value(), or infinity until every term has pairs."""
+        E = self.correlations()
+        total = self.counts.sum(axis=2)
+        if any(total[a, b] == 0 for a, b, sign in CHSH_TERMS):
+            return float('inf')
+        return sqrt(sum((1 - E[a, b] ** 2) / total[a, b] for a, b, sign in CHSH_TERMS))
+
+    def conclusive(self, minPairs=MIN_TERM_PAIRS):
+        """Return True once every CHSH term has at least minPairs pairs."""
+        total = self.counts.sum(axis=2)
+        return all(total[a, b] >= minPairs for a, b, sign in CHSH_TERMS)
+
+    def violated(self, threshold=CHSH_BOUND, z=0.0):
+        """Return True unless S is at or below threshold. With z > 0, S must be below it
+        by z standard errors, so that a small sample does not end a run early.
+        """
+        if not z:
+            return self.value() > threshold
+        return self.value() + z * self.standardError() > threshold
@@ -0,0 +1,200 @@
+import importlib
+import importlib.util
+import numpy as np
+import qkdsim.simulations as simulations
+from qkdsim.results import ProtocolResult, ABORT_LENGTH
+from qkdsim.rng import getRNG
+
+# Fused engine: noise, Eve, Bob's measurement and sifting are applied in one pass, with
+# every random choice for a qubit taken from the bits of one random uint32 word, and the
+# sifted keys written straight into preallocated buffers. Only CHUNK_BITS words are held
+# at a time, so apart from the buffers memory does not grow with the key length.
+#
+# BB84 word: bit 0 Alice's value, bit 1 Alice's basis, bit 2 Bob's basis, bit 3 Eve's
+#            basis, bit 4 Bob's result when measuring in the wrong basis
+# B92 word:  bit 0 Alice's value, bit 1 Eve's filter, bit 2 whether Eve's filter passes
+#            the photon, bit 3 Bob's filter, bit 4 whether Bob's filter passes it
+# The remaining NOISE_BITS bits, word >> 5, flip the value when below errorRate * 2^27.
+NOISE_SHIFT = 5
+NOISE_BITS = 32 - NOISE_SHIFT
+
+# Number of qubits simulated at a time
+CHUNK_BITS = 1 << 20
+
+def _siftBB84(words, errorLimit, eve, out_A, out_B, kept):
+    """Kernel for siftBB84 over one chunk of words: append the sifted bits to out_A and
+    out_B from index kept and return the new count.
+    """
+    for k in range(len(words)):
+        w = words[k]
+        basis = (w >> 1) & 1
+        if basis != (w >> 2) & 1:
+            continue
+        if eve and (w >> 3) & 1 != basis:
+            # Eve resends in the other basis, so Bob's result is random
+            value = (w >> 4) & 1
+        else:
+            value = w & 1
+            if (w >> NOISE_SHIFT) < errorLimit:
+                value ^= 1
+        out_A[kept] = (w & 1) == 1
+        out_B[kept] = value == 1
+        kept += 1
+    return kept
+
+def _siftB92(words, errorLimit, eve, out_A, out_B, start, resent, kept):
+    """Kernel for siftB92 over the chunk of words starting at qubit start. Alice's raw
+    bits are written to out_A[start:] and compacted in place onto the bits Bob detected,
+    so resent (photons that reached Bob) and kept (photons he detected) are carried from
+    chunk to chunk. Returns the new (resent, kept).
+    """
+    for k in range(len(words)):
+        w = words[k]
+        state = w & 1
+        out_A[start + k] = state == 1
+        if eve and (state != (w >> 1) & 1 or (w >> 2) & 1 == 0):
+            continue
+        position = resent
+        resent += 1
+        if (w >> NOISE_SHIFT) < errorLimit:
+            state ^= 1
+        if state == (w >> 3) & 1 and (w >> 4) & 1 == 1:
+            out_A[kept] = out_A[position]
+            out_B[kept] = state == 1
+            kept += 1
+    return (resent, kept)
+
+def _siftBB84Numpy(words, errorLimit, eve, out_A, out_B, kept):
+    """NumPy equivalent of _siftBB84, giving the same keys for the same words."""
+    words = words[((words >> 1) ^ (words >> 2)) & 1 == 0]
+    value = (words & 1) ^ ((words >> NOISE_SHIFT) < errorLimit)
+    if eve:
+        value = np.where(((words >> 1) ^ (words >> 3)) & 1, (words >> 4) & 1, value)
+    stop = kept + len(words)
+    out_A[kept:stop] = words & 1
+    out_B[kept:stop] = value
+    return stop
+
+def _siftB92Numpy(words, errorLimit, eve, out_A, out_B, start, resent, kept):
+    """NumPy equivalent of _siftB92, giving the same keys for the same words."""
+    state = words & 1
+    out_A[start:start + len(words)] = state
+    if eve:
+        through = (state == (words >> 1) & 1) & ((words >> 2) & 1 == 1)
+        words, state = words[through], state[through]
+    state = state ^ ((words >> NOISE_SHIFT) < errorLimit)
+    passed = (state == (words >> 3) & 1) & ((words >> 4) & 1 == 1)
+    positions = resent + np.flatnonzero(passed)
+    stop = kept + len(positions)
+    out_A[kept:stop] = out_A[positions]
+    out_B[kept:stop] = state[passed]
+    return (resent + len(words), stop)
+
+_compiled = {}
+
+def haveNumba():
+    """Return True if Numba is installed, without importing it."""
+    return importlib.util.find_spec('numba') is not None
+
+def _kernel(name, jit):
+    """Return the kernel of the given name, compiled with Numba if jit is True, or its
+    NumPy equivalent otherwise. jit=None uses Numba when it is installed. Numba is only
+    imported, and each kernel compiled, on first use.
+    """
+    if jit is None:
+        jit = haveNumba()
+    if not jit:
+        return globals()[name + 'Numpy']
+    if name not in _compiled:
+        numba = importlib.import_module('numba')
+        _compiled[name] = numba.njit(cache=True, nogil=True)(globals()[name])
+    return _compiled[name]
+
+def _words(rng, count):
+    return np.frombuffer(rng.randomBytes(4 * count), dtype=np.uint32)
+
+def _errorLimit(errorRate):
+    return np.int64(round(min(max(errorRate, 0.0), 1.0) * (1 << NOISE_BITS)))
+
+def allocate(numBits):
+    """Return a pair of empty bool buffers large enough for the sifted keys of numBits
+    qubits, to pass as out to siftBB84 and siftB92 across runs.
+    """
+    return (np.empty(numBits, dtype=bool), np.empty(numBits, dtype=bool))
+
+def _buffers(numBits, out):
+    if out is None:
+        return allocate(numBits)
+    if len(out[0]) < numBits or len(out[1]) < numBits:
+        raise ValueError("Sift buffers hold %d bits, %d needed" % (min(len(out[0]), len(out[1])), numBits))
+    return out
+
+def siftBB84(numBits, errorRate=0.0, eve=False, out=None, jit=None, chunkSize=CHUNK_BITS):
+    """Simulate the quantum part of BB84 on numBits qubits in one pass: Alice's encoding,
+    an intercept-resend attack if eve is set, channel noise, Bob's measurement and the
+    discarding of mismatched bases. Returns the sifted keys (key_A, key_B) as bool arrays,
+    with the statistics of bb84.matchKeysBatch after the batch stages.
+    The keys are views into out, a pair of buffers from allocate(), which later calls may
+    overwrite; by default new buffers are allocated. jit selects the Numba kernel (True),
+    the NumPy one (False) or Numba if installed (None).
+    """
+    out_A, out_B = _buffers(numBits, out)
+    kernel = _kernel('_siftBB84', jit)
+    errorLimit = _errorLimit(errorRate)
+    rng = getRNG()
+    kept = 0
+    for start in range(0, numBits, chunkSize):
+        words = _words(rng, min(chunkSize, numBits - start))
+        kept = kernel(words, errorLimit, bool(eve), out_A, out_B, kept)
+    return (out_A[:kept], out_B[:kept])
+
+def siftB92(numBits, errorRate=0.0, eve=False, out=None, jit=None, chunkSize=CHUNK_BITS):
+    """Simulate the quantum part of B92 on numBits qubits in one pass, as siftBB84 does
+    for BB84, and return (key_A, key_B) as bool arrays. As with b92.matchKeysBatch, when
+    Eve's filters stop some photons Alice keeps the bits beyond the number that reached
+    Bob, so the keys differ in length.
+    """
+    out_A, out_B = _buffers(numBits, out)
+    kernel = _kernel('_siftB92', jit)
+    errorLimit = _errorLimit(errorRate)
+    rng = getRNG()
+    resent = kept = 0
+    for start in range(0, numBits, chunkSize):
+        words = _words(rng, min(chunkSize, numBits - start))
+        resent, kept = kernel(words, errorLimit, bool(eve), out_A, out_B, start, resent, kept)
+
+    # Alice's bits for the photons that never reached Bob
+    tail = numBits - resent
+    out_A[kept:kept + tail] = out_A[resent:numBits]
+    return (out_A[:kept + tail], out_B[:kept])
+
+def _run(protocol, n, numBits, sift, eve, errorRate, reconcile, amplify, discloseFraction, out, jit):
+    report = ProtocolResult(protocol, n, eve, errorRate)
+    report.stages['raw'] = numBits
+    key_A, key_B = sift(numBits, errorRate, eve, out, jit)
+    report.stages['sifted'] = len(key_B)
+
+    if len(key_A) != len(key_B):
+        report.setKeys(key_A, key_B)
+        return report.abort(ABORT_LENGTH)
+
+    announce_A, key_A, announce_B, key_B = simulations.disclose(key_A, key_B, discloseFraction)
+    report.stages['announced'] = len(announce_A)
+    estimate = float(np.count_nonzero(announce_A != announce_B)) / max(len(announce_A), 1)
+    sample = None if discloseFraction is None else (announce_A, announce_B)
+    return simulations.finish(report, key_A, key_B, True, reconcile, amplify, estimate, sample)
+
+def runBB84(n, eve=False, errorRate=0.0, reconcile=False, amplify=False, discloseFraction=None,
+            out=None, jit=None):
+    """Run BB84 with n initial key bits on the fused engine and return a ProtocolResult,
+    as simulations.runBB84 does with quiet=True. Channels and attacks are not supported.
+    Pass out from allocate(5 * n) to reuse the sift buffers between runs.
+    """
+    return _run('BB84', n, 5 * n, siftBB84, eve, errorRate, reconcile, amplify, discloseFraction, out, jit)
+
+def runB92(n, eve=False, errorRate=0.0, reconcile=False, amplify=False, discloseFraction=None,
+           out=None, jit=None):
+    """Run B92 with n initial key bits on the fused engine and return a ProtocolResult, see
+    runBB84. Pass out from allocate(8 * n) to reuse the sift buffers.
+    """
+    return _run('B92', n, 8 * n, siftB92, eve, errorRate, reconcile, amplify, discloseFraction, out, jit)
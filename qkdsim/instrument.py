@@ -0,0 +1,165 @@
+import json
+import time
+from functools import wraps
+
+class StageStats(object):
+    """Totals recorded for one stage: number of calls, wall time and elements processed."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.elements = 0
+
+    def rate(self):
+        """Elements processed per second, or None if no time was recorded."""
+        if self.seconds <= 0:
+            return None
+        return self.elements / self.seconds
+
+    def asDict(self):
+        return {'calls': self.calls, 'seconds': self.seconds, 'elements': self.elements,
+                'rate': self.rate()}
+
+class Profiler(object):
+    """Records the wall time, call count and element count of every instrumented stage
+    while it is active, e.g.
+        with Profiler() as profiler:
+            runBB84(1000, engine='numpy', quiet=True)
+        print(profiler)
+    Each hook is called as hook(stage, seconds, count) when a stage finishes.
+    Times are inclusive, so a stage that runs inside another counts towards both.
+    """
+
+    def __init__(self, hooks=()):
+        self.stats = {}
+        self.hooks = list(hooks)
+
+    def addHook(self, hook):
+        self.hooks.append(hook)
+
+    def record(self, stage, seconds, count=0):
+        stats = self.stats.get(stage)
+        if stats is None:
+            stats = self.stats[stage] = StageStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.elements += count
+        for hook in self.hooks:
+            hook(stage, seconds, count)
+
+    def reset(self):
+        self.stats = {}
+
+    def asDict(self):
+        """Return the recorded totals as a dict keyed by stage name."""
+        return dict((stage, stats.asDict()) for stage, stats in self.stats.items())
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.asDict(), **kwargs)
+
+    def render(self):
+        """Return the recorded totals as a table, slowest stage first."""
+        lines = ["%-24s %8s %12s %14s %14s" % ('stage', 'calls', 'seconds', 'elements', 'per second')]
+        for stage, stats in sorted(self.stats.items(), key=lambda item: -item[1].seconds):
+            rate = stats.rate()
+            lines.append("%-24s %8d %12.6f %14d %14s" % (stage, stats.calls, stats.seconds,
+                         stats.elements, '-' if rate is None else '%.0f' % rate))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.render()
+
+    def __enter__(self):
+        self.previous = enable(self)
+        return self
+
+    def __exit__(self, *exc):
+        enable(self.previous)
+        return False
+
+class _Stage(object):
+    """Times one run of a stage for the active profiler."""
+
+    def __init__(self, profiler, name, count):
+        self.profiler = profiler
+        self.name = name
+        self.count = count
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start, self.count)
+        return False
+
+class _NullStage(object):
+    """Stage returned when profiling is disabled; does nothing."""
+
+    count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+_active = None
+
+def getProfiler():
+    """Return the active profiler, or None if profiling is disabled."""
+    return _active
+
+def enable(profiler):
+    """Make profiler the active profiler and return the previous one. Passing None
+    disables profiling.
+    """
+    global _active
+    previous = _active
+    _active = profiler
+    return previous
+
+def disable():
+    return enable(None)
+
+def stage(name, count=0):
+    """Return a context manager timing the enclosed block as one call of the given stage,
+    which processed count elements. When profiling is disabled a shared no-op object is
+    returned, so instrumented code pays only for the function call.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name, count)
+
+def timed(name, count=None):
+    """Decorator recording every call of the function as one call of the given stage.
+    count(*args, **kwargs) returns the number of elements processed; by default it is the
+    first argument if that is an int, or its length otherwise.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                elements = count(*args, **kwargs) if count else _defaultCount(args)
+                profiler.record(name, seconds, elements)
+        return wrapper
+    return decorator
+
+def _defaultCount(args):
+    if not args:
+        return 0
+    if isinstance(args[0], int):
+        return args[0]
+    try:
+        return len(args[0])
+    except TypeError:
+        return 0
@@ -0,0 +1,210 @@
+import numpy as np
+from qkdsim.rng import getRNG
+
+# Number of bits unpacked at a time when a PackedKey is processed in chunks. Must be a
+# multiple of 8 so that chunks start on byte boundaries.
+CHUNK_BITS = 1 << 23
+
+# Number of set bits in each possible byte value
+POPCOUNT = np.array([bin(j).count('1') for j in range(256)], dtype=np.uint8)
+
+class PackedKey(object):
+    """A key, basis or measurement string stored as bits packed eight to a byte in a uint8
+    array, using the bit order of np.packbits. Padding bits in the last byte are always 0.
+    A PackedKey supports len(), iteration, integer indexing and slicing with a positive
+    step, and converts to a bool array through np.asarray.
+    """
+
+    def __init__(self, data, length):
+        self.data = np.asarray(data, dtype=np.uint8)
+        self.length = length
+        if len(self.data) != (length + 7) // 8:
+            raise ValueError("Expected %d bytes for a %d-bit key, got %d" % ((length + 7) // 8, length, len(self.data)))
+
+    @classmethod
+    def fromBits(cls, bits):
+        """Return a PackedKey holding the given list or array of bools."""
+        bits = np.asarray(bits, dtype=bool)
+        return cls(np.packbits(bits), len(bits))
+
+    @classmethod
+    def concatenate(cls, keys):
+        """Return a PackedKey holding the bits of the given PackedKeys one after another."""
+        writer = _BitWriter(sum(len(key) for key in keys))
+        for key in keys:
+            for start in range(0, len(key), CHUNK_BITS):
+                writer.write(key.toBits(start, start + CHUNK_BITS))
+        return writer.key()
+
+    @classmethod
+    def random(cls, length):
+        """Return a PackedKey of given length, each bit either 0 or 1 with equal probability."""
+        data = np.frombuffer(getRNG().randomBytes((length + 7) // 8), dtype=np.uint8).copy()
+        key = cls(data, length)
+        key._clearPadding()
+        return key
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "PackedKey(%d bits)" % self.length
+
+    def __array__(self, dtype=None, copy=None):
+        bits = self.toBits()
+        return bits if dtype is None else bits.astype(dtype)
+
+    def __iter__(self):
+        for start in range(0, self.length, CHUNK_BITS):
+            for b in self.toBits(start, start + CHUNK_BITS):
+                yield bool(b)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(self.length)
+            if step < 1:
+                raise ValueError("PackedKey slices must have a positive step")
+            return self.stride(start, step, stop)
+
+        if k < 0: k += self.length
+        if not 0 <= k < self.length:
+            raise IndexError("PackedKey index out of range")
+        return bool((self.data[k >> 3] >> (7 - (k & 7))) & 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedKey):
+            return NotImplemented
+        return self.length == other.length and np.array_equal(self.data, other.data)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __xor__(self, other):
+        self._checkLength(other)
+        return PackedKey(self.data ^ other.data, self.length)
+
+    def __and__(self, other):
+        self._checkLength(other)
+        return PackedKey(self.data & other.data, self.length)
+
+    def __or__(self, other):
+        self._checkLength(other)
+        return PackedKey(self.data | other.data, self.length)
+
+    def __invert__(self):
+        key = PackedKey(~self.data, self.length)
+        key._clearPadding()
+        return key
+
+    def toBits(self, start=0, stop=None):
+        """Return bits [start, stop) as a bool array. start must be a multiple of 8."""
+        if stop is None or stop > self.length: stop = self.length
+        if start >= stop:
+            return np.zeros(0, dtype=bool)
+        bits = np.unpackbits(self.data[start >> 3:(stop + 7) >> 3])
+        return bits[:stop - start].astype(bool)
+
+    def count(self):
+        """Return the number of set bits."""
+        total = 0
+        for start in range(0, len(self.data), CHUNK_BITS >> 3):
+            total += int(POPCOUNT[self.data[start:start + (CHUNK_BITS >> 3)]].sum(dtype=np.int64))
+        return total
+
+    def mismatches(self, other):
+        """Return the number of positions where this key and other differ, computed by XOR
+        and popcount over the packed bytes.
+        """
+        self._checkLength(other)
+        total = 0
+        for start in range(0, len(self.data), CHUNK_BITS >> 3):
+            stop = start + (CHUNK_BITS >> 3)
+            diff = self.data[start:stop] ^ other.data[start:stop]
+            total += int(POPCOUNT[diff].sum(dtype=np.int64))
+        return total
+
+    def stride(self, start, step, stop=None):
+        """Return a new PackedKey holding bits start, start+step, ... before stop."""
+        if stop is None or stop > self.length: stop = self.length
+        writer = _BitWriter(len(range(start, stop, step)))
+        for c0 in range(0, stop, CHUNK_BITS):
+            c1 = min(c0 + CHUNK_BITS, stop)
+            first = start if c0 <= start else c0 + (start - c0) % step
+            if first >= c1: continue
+            writer.write(self.toBits(c0, c1)[first - c0::step])
+
+        return writer.key()
+
+    def compress(self, mask):
+        """Return a new PackedKey holding only the bits where mask is set. mask is a bool
+        array or a PackedKey of the same length.
+        """
+        if isinstance(mask, PackedKey):
+            self._checkLength(mask)
+            total = mask.count()
+            getMask = mask.toBits
+        else:
+            mask = np.asarray(mask, dtype=bool)
+            if len(mask) != self.length:
+                raise ValueError("Mask length %d does not match key length %d" % (len(mask), self.length))
+            total = int(np.count_nonzero(mask))
+            getMask = lambda c0, c1: mask[c0:c1]
+
+        writer = _BitWriter(total)
+        for c0 in range(0, self.length, CHUNK_BITS):
+            c1 = min(c0 + CHUNK_BITS, self.length)
+            writer.write(self.toBits(c0, c1)[getMask(c0, c1)])
+
+        return writer.key()
+
+    def hex(self):
+        """Return the key as a hex string, with the first bit as the most significant."""
+        value = int.from_bytes(self.data.tobytes(), 'big') >> (-self.length % 8)
+        return hex(value)
+
+    def _checkLength(self, other):
+        if len(other) != self.length:
+            raise ValueError("Key lengths differ: %d and %d" % (self.length, len(other)))
+
+    def _clearPadding(self):
+        pad = -self.length % 8
+        if pad:
+            self.data[-1] &= (0xFF << pad) & 0xFF
+
+class _BitWriter(object):
+    """Append bool arrays to a preallocated packed buffer of known total length."""
+
+    def __init__(self, length):
+        self.data = np.zeros((length + 7) // 8, dtype=np.uint8)
+        self.length = length
+        self.pos = 0
+
+    def write(self, bits):
+        bits = np.asarray(bits, dtype=bool)
+        if self.pos + len(bits) > self.length:
+            raise ValueError("Too many bits written")
+
+        # Top up a partially filled byte one bit at a time, then pack the rest directly
+        offset = self.pos & 7
+        if offset and len(bits):
+            head = bits[:8 - offset]
+            for k in range(len(head)):
+                if head[k]:
+                    self.data[self.pos >> 3] |= 1 << (7 - offset - k)
+            self.pos += len(head)
+            bits = bits[len(head):]
+
+        if len(bits):
+            packed = np.packbits(bits)
+            self.data[self.pos >> 3:(self.pos >> 3) + len(packed)] = packed
+            self.pos += len(bits)
+
+    def key(self):
+        return PackedKey(self.data, self.length)
+
+def asPackedKey(bits):
+    """Return bits as a PackedKey, packing lists and arrays and passing PackedKeys through."""
+    if isinstance(bits, PackedKey):
+        return bits
+    return PackedKey.fromBits(bits)
@@ -1,55 +1,106 @@
 import numpy as np
-from Crypto.Random import random
-import qit
+from qkdsim.instrument import timed
+from qkdsim.packedkey import PackedKey
+from qkdsim.rng import getRNG
 
 MAX_PRINT_SIZE = 56
 
+# Probability that channel noise alone pushes a disclosed sample past the finite-size
+# abort threshold
+DETECT_EPSILON = 1e-6
+
+@timed('bitFormat')
 def bitFormat(bits):
-    """Return a printable representation of the given list of bools representing bits."""
+    """Return a printable representation of the given list of bools representing bits.
+    bits may also be a bool array or a PackedKey.
+    """
     if len(bits) < MAX_PRINT_SIZE:
         out = ', '.join(['1' if b == True else '0' if b == False else '-' for b in bits])
         return '[' + out + ']'
+    elif isinstance(bits, PackedKey):
+        return bits.hex()
     else:
-        binaryString = ""
-        for j in range(len(bits)):
-            if bits[j]:
-                binaryString += "1"
-            else: binaryString += "0"
-        return hex(int(binaryString, 2))
-
-def detectEavesdrop(key1, key2, errorRate):
-    """Return True if Alice and Bob detect Eve's interference, False otherwise."""
+        return PackedKey.fromBits(np.asarray(bits) != 0).hex()
+
+def detectEavesdrop(key1, key2, errorRate, epsilon=None):
+    """Return True if Alice and Bob detect Eve's interference, False otherwise.
+    By default the error rate may differ from errorRate by 1.2*errorRate. If epsilon is
+    given, key1 and key2 are a disclosed sample and the error rate may exceed errorRate up
+    to finiteSizeThreshold instead.
+    """
     if len(key1) == 0 or len(key2) == 0:
         return True
     if len(key1) != len(key2):
         return True
 
+    mismatch = countMismatches(key1, key2)
+    if epsilon is not None:
+        return float(mismatch) / len(key1) > finiteSizeThreshold(len(key1), errorRate, epsilon)
+
     tolerance = errorRate * 1.2
-    mismatch = sum([1 for k in range(len(key1)) if key1[k] != key2[k]])
     if abs((float(mismatch) / len(key1)) - errorRate) > tolerance:
         return True
 
     return False
 
+def finiteSizeThreshold(sampleSize, errorRate, epsilon=DETECT_EPSILON):
+    """Return the highest error rate of a disclosed sample of sampleSize bits that Alice and
+    Bob accept as channel noise at errorRate. By Hoeffding's inequality, noise alone exceeds
+    errorRate + sqrt(ln(1/epsilon) / (2 sampleSize)) with probability at most epsilon.
+    """
+    if sampleSize <= 0:
+        return errorRate
+    return errorRate + np.sqrt(np.log(1.0 / epsilon) / (2.0 * sampleSize))
+
+def countMismatches(key1, key2):
+    """Return the number of positions where key1 and key2 differ. Keys may be lists, bool
+    arrays or PackedKeys of the same length.
+    """
+    if isinstance(key1, PackedKey) and isinstance(key2, PackedKey):
+        return key1.mismatches(key2)
+    return int(np.count_nonzero(np.not_equal(np.asarray(key1, dtype=bool), np.asarray(key2, dtype=bool))))
+
 def discloseHalf(key1, key2):
     """Return the tuple (announce1, keep1, announce2, keep2), where
            announce2, announce2 = bit values to announce and discard
            keep1, keep2 = bit values of new shared keys
+    Works on lists, arrays and PackedKeys alike.
     """
     # Disclose every other bit
-    announce1 = [key1[j] for j in range(len(key1)) if j % 2 == 0]
-    keep1 = [key1[j] for j in range(len(key1)) if j % 2]
-    announce2 = [key2[j] for j in range(len(key2)) if j % 2 == 0]
-    keep2 = [key2[j] for j in range(len(key2)) if j % 2]
+    announce1 = key1[0::2]
+    keep1 = key1[1::2]
+    announce2 = key2[0::2]
+    keep2 = key2[1::2]
     return (announce1, keep1, announce2, keep2)
 
+def discloseSample(key1, key2, fraction=0.5):
+    """Return the tuple (announce1, keep1, announce2, keep2) as discloseHalf does, but
+    announcing a random sample of round(fraction*len(key1)) positions, chosen by a
+    permutation of the key indices. The kept bits stay in order. Works on lists, arrays
+    and PackedKeys alike.
+    """
+    n = len(key1)
+    mask = np.zeros(n, dtype=bool)
+    mask[getRNG().permutation(n)[:int(round(fraction * n))]] = True
+    return (_select(key1, mask), _select(key1, ~mask), _select(key2, mask), _select(key2, ~mask))
+
+def _select(bits, mask):
+    if isinstance(bits, PackedKey):
+        return bits.compress(mask)
+    if isinstance(bits, list):
+        return [b for b, m in zip(bits, mask) if m]
+    return np.asarray(bits)[mask]
+
 def equivState(state1, state2):
     """Return True if state1 and state2 represent the same quantum state."""
     return np.array_equal(state1.prob(), state2.prob())
 
 def getRandomBits(length):
     """Return a list of bits with given length, each either 0 or 1 with equal probability."""
-    bitstring = []
-    for j in range(length):
-        bitstring.append(random.choice([True, False]))
-    return bitstring
+    return getRNG().randomBits(length).tolist()
+
+def getRandomBitArray(length):
+    """Return a bool array with given length, each bit either 0 or 1 with equal probability.
+    Bits are drawn from the current random source in whole bytes rather than one at a time.
+    """
+    return getRNG().randomBits(length)
@@ -0,0 +1,124 @@
+import numpy as np
+from qkdsim.packedkey import PackedKey
+from qkdsim.rng import getRNG
+
+# Default number of Cascade passes
+PASSES = 4
+
+# Smallest error rate the first block size is chosen for. An estimate of 0 from a small
+# disclosed sample does not mean the key is free of errors, and a block spanning the
+# whole key cannot find an even number of them.
+MIN_QBER = 0.01
+
+class Pass(object):
+    """One Cascade pass: a permutation of the key positions split into blocks of equal size,
+    together with Alice's block parities, which are sent to Bob once when the pass starts.
+    """
+
+    def __init__(self, order, blockSize, key_A):
+        self.order = order
+        self.blockSize = blockSize
+        self.starts = np.arange(0, len(order), blockSize)
+        self.prefix_A = _prefixParity(key_A[order])
+        self.parity_A = _rangeParity(self.prefix_A, self.starts, self._ends())
+
+    def _ends(self):
+        return np.minimum(self.starts + self.blockSize, len(self.order))
+
+    def oddBlocks(self, key_B):
+        """Return the start and end of every block whose parity differs from Alice's,
+        along with Bob's parity prefix for this pass.
+        """
+        prefix_B = _prefixParity(key_B[self.order])
+        ends = self._ends()
+        odd = _rangeParity(prefix_B, self.starts, ends) != self.parity_A
+        return (self.starts[odd], ends[odd], prefix_B)
+
+def initialBlockSize(qber, length):
+    """Return the first-pass block size for the estimated error rate, ~0.73/qber, with
+    qber floored at MIN_QBER.
+    """
+    qber = max(qber, MIN_QBER)
+    return int(min(max(length, 1), max(4, 0.73 / qber)))
+
+def cascade(key_A, key_B, qber, passes=PASSES):
+    """Reconcile Bob's key with Alice's using the Cascade protocol and return the tuple
+    (key_B, leaked, rounds), where key_B is Bob's corrected key, leaked is the number of
+    parity bits exchanged over the classical channel and rounds the number of round trips
+    they took: one for the block parities of each pass and one per level of each binary
+    search. Parities of earlier passes are already known to Bob and cost no round trip.
+    qber is the estimated error rate, which sets the first block size; each following pass
+    doubles it and shuffles the key positions. Every odd block of a pass is searched in
+    parallel, and each corrected bit is traced back to the blocks of earlier passes that
+    contain it until no odd blocks remain in any pass.
+    """
+    packed = isinstance(key_B, PackedKey)
+    a = np.asarray(key_A, dtype=bool)
+    b = np.array(key_B, dtype=bool)
+    if len(a) != len(b):
+        raise ValueError("Key lengths differ: %d and %d" % (len(a), len(b)))
+
+    leaked = 0
+    rounds = 0
+    done = []
+    blockSize = initialBlockSize(qber, len(a))
+
+    for k in range(passes):
+        order = np.arange(len(a)) if k == 0 else getRNG().permutation(len(a))
+        current = Pass(order, blockSize, a)
+        leaked += len(current.starts)
+        rounds += 1
+        done.append(current)
+
+        # Keep correcting until every block of every pass so far has even parity
+        pending = [current]
+        while pending:
+            flipped = False
+            for p in pending:
+                starts, ends, prefix_B = p.oddBlocks(b)
+                if not len(starts): continue
+
+                positions, steps, depth = _binarySearch(p.prefix_A, prefix_B, starts, ends)
+                leaked += steps
+                rounds += depth
+                b[p.order[positions]] ^= True
+                flipped = True
+            pending = done if flipped else []
+
+        blockSize = min(2 * blockSize, max(len(a), 1))
+
+    return (PackedKey.fromBits(b) if packed else b, leaked, rounds)
+
+def _binarySearch(prefix_A, prefix_B, starts, ends):
+    """Locate one error in each of the given odd-parity blocks, all at once. Returns the
+    positions found, the number of parity bits Alice sent during the search and the number
+    of levels it took.
+    """
+    lo = starts.copy()
+    hi = ends.copy()
+    steps = 0
+    depth = 0
+    active = hi - lo > 1
+    while np.any(active):
+        l = lo[active]
+        h = hi[active]
+        mid = (l + h) // 2
+        steps += len(mid)
+        depth += 1
+
+        # Alice announces the parity of the left half; the error is on the side that differs
+        left = _rangeParity(prefix_A, l, mid) != _rangeParity(prefix_B, l, mid)
+        hi[active] = np.where(left, mid, h)
+        lo[active] = np.where(left, l, mid)
+        active = hi - lo > 1
+
+    return (lo, steps, depth)
+
+def _prefixParity(bits):
+    """Return p with p[j] = parity of bits[:j]."""
+    prefix = np.zeros(len(bits) + 1, dtype=bool)
+    np.bitwise_xor.accumulate(bits, out=prefix[1:])
+    return prefix
+
+def _rangeParity(prefix, starts, ends):
+    return prefix[ends] ^ prefix[starts]
@@ -0,0 +1,112 @@
+import qkdsim.qkdutils as util
+
+# Reasons a protocol run can be aborted
+ABORT_EMPTY = "no key bits left"
+ABORT_LENGTH = "key lengths differ"
+ABORT_ERRORS = "error rate outside tolerance"
+ABORT_BELL = "no Bell violation"
+
+class ProtocolResult(object):
+    """Structured outcome of one protocol run, returned by the run* functions in quiet mode.
+        key_A, key_B = Alice and Bob's final keys
+        mismatches   = number of positions where the final keys differ
+        aborted      = True if Alice and Bob detected interference and aborted
+        abortReason  = one of the ABORT_* strings, or None
+        estimate     = error rate measured on the announced bits, if any were announced
+        leaked       = parity bits exchanged during reconciliation
+        rounds       = round trips the reconciliation took
+        eveInfo      = Eve's information about the sifted key in bits per bit, if she attacked
+        chsh         = CHSH parameter |S| measured on the discarded E91 pairs
+        bellInconclusive = True if too few E91 pairs were discarded for the CHSH test
+        stages       = number of bits left after each protocol stage, in order
+    Nothing is formatted until render() is called.
+    """
+
+    def __init__(self, protocol, n, eve=False, errorRate=0.0):
+        self.protocol = protocol
+        self.n = n
+        self.eve = eve
+        self.errorRate = errorRate
+        self.key_A = []
+        self.key_B = []
+        self.mismatches = 0
+        self.aborted = False
+        self.abortReason = None
+        self.estimate = None
+        self.leaked = 0
+        self.rounds = 0
+        self.eveInfo = None
+        self.chsh = None
+        self.bellInconclusive = False
+        self.stages = {}
+
+    @property
+    def qber(self):
+        """Fraction of mismatched bits in the final keys, or None if they are empty."""
+        if not len(self.key_A):
+            return None
+        return float(self.mismatches) / len(self.key_A)
+
+    @property
+    def key(self):
+        """Alice's final key, or -1 if the protocol was aborted, as returned by run*."""
+        return -1 if self.aborted else self.key_A
+
+    def setKeys(self, key_A, key_B):
+        self.key_A = key_A
+        self.key_B = key_B
+        if len(key_A) == len(key_B):
+            self.mismatches = util.countMismatches(key_A, key_B)
+
+    def abort(self, reason):
+        self.aborted = True
+        self.abortReason = reason
+        return self
+
+    def asDict(self):
+        """Return the counts and outcome as a dict, leaving out the keys themselves."""
+        return {
+            'protocol': self.protocol,
+            'n': self.n,
+            'eve': self.eve,
+            'errorRate': self.errorRate,
+            'keyLength': len(self.key_A),
+            'mismatches': self.mismatches,
+            'qber': self.qber,
+            'aborted': self.aborted,
+            'abortReason': self.abortReason,
+            'estimate': self.estimate,
+            'leaked': self.leaked,
+            'rounds': self.rounds,
+            'eveInfo': self.eveInfo,
+            'chsh': self.chsh,
+            'bellInconclusive': self.bellInconclusive,
+            'stages': dict(self.stages),
+        }
+
+    def render(self):
+        """Return a human-readable summary of the run."""
+        lines = ["=====%s protocol=====" % self.protocol]
+        lines.append("with eavesdropping" if self.eve else "without eavesdropping")
+        for stage, size in self.stages.items():
+            lines.append("%-12s %d bits" % (stage + ':', size))
+        lines.append("Alice's %d-bit key:\n%s" % (len(self.key_A), util.bitFormat(self.key_A)))
+        lines.append("Bob's %d-bit key:\n%s" % (len(self.key_B), util.bitFormat(self.key_B)))
+        lines.append("Expected error rate: %f" % self.errorRate)
+        if self.qber is not None:
+            lines.append("Actual error rate: %f" % self.qber)
+        if self.eveInfo is not None:
+            lines.append("Eve's information: %f bits per sifted bit" % self.eveInfo)
+        if self.chsh is not None:
+            lines.append("CHSH parameter: %f%s" % (self.chsh, " (inconclusive)" if self.bellInconclusive else ""))
+        if self.leaked:
+            lines.append("Parity bits leaked during reconciliation: %d" % self.leaked)
+        if self.aborted:
+            lines.append("Aborted: %s" % self.abortReason)
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return "ProtocolResult(%s, %d bits, aborted=%r)" % (self.protocol, len(self.key_A), self.aborted)
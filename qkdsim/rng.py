@@ -0,0 +1,185 @@
+import os
+import numpy as np
+
+# Bytes fetched from the CSPRNG per refill when serving small requests
+CRYPTO_BUFFER_SIZE = 1 << 16
+
+def _cryptoSource():
+    """Return the function used by CryptoRNG to draw random bytes: Crypto.Random if it is
+    installed, otherwise the operating system's CSPRNG. Crypto is only imported here, on
+    first use.
+    """
+    try:
+        from Crypto.Random import get_random_bytes
+    except ImportError:
+        return os.urandom
+    return get_random_bytes
+
+class CryptoRNG(object):
+    """Random source backed by the PyCrypto CSPRNG, or os.urandom where PyCrypto is not
+    installed. Randomness is drawn in whole byte buffers and converted with NumPy, rather
+    than one call per bit. Not seedable.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._pos = 0
+        self._source = None
+
+    def randomBytes(self, n):
+        """Return n random bytes."""
+        if self._source is None:
+            self._source = _cryptoSource()
+        if n > CRYPTO_BUFFER_SIZE:
+            return self._source(n)
+        if self._pos + n > len(self._buffer):
+            self._buffer = self._source(CRYPTO_BUFFER_SIZE)
+            self._pos = 0
+        out = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return out
+
+    def randomBits(self, n):
+        """Return a bool array of n bits, each either 0 or 1 with equal probability."""
+        buf = np.frombuffer(self.randomBytes((n + 7) // 8), dtype=np.uint8)
+        return np.unpackbits(buf)[:n].astype(bool)
+
+    def random(self, size=None):
+        """Return uniform floats in [0, 1), as a scalar if size is None."""
+        count = 1 if size is None else int(np.prod(size))
+        words = np.frombuffer(self.randomBytes(8 * count), dtype=np.uint64)
+        out = (words >> np.uint64(11)) * (1.0 / (1 << 53))
+        return float(out[0]) if size is None else out.reshape(size)
+
+    def integers(self, high, size=None):
+        """Return uniform integers in [0, high), as a scalar if size is None."""
+        out = np.floor(self.random(size) * high).astype(np.int64)
+        return int(out) if size is None else out
+
+    def normal(self, scale=1.0, size=None):
+        """Return normally distributed floats with mean 0 and the given standard deviation,
+        which may be an array.
+        """
+        scale = np.asarray(scale, dtype=float)
+        if size is None and scale.ndim:
+            size = scale.shape
+        # Box-Muller transform
+        u1 = 1.0 - self.random(size)
+        u2 = self.random(size)
+        out = np.sqrt(-2.0 * np.log(u1)) * np.cos(2 * np.pi * u2) * scale
+        return float(out) if size is None else out
+
+    def choice(self, options):
+        """Return one element of options chosen uniformly at random."""
+        return options[self.integers(len(options))]
+
+    def permutation(self, n):
+        """Return a random permutation of range(n) as an int64 array."""
+        return np.argsort(self.random(n), kind='stable').astype(np.int64)
+
+    def spawn(self, n):
+        """Return n independent generators."""
+        return [CryptoRNG() for j in range(n)]
+
+class FastRNG(object):
+    """Seedable random source built on the counter-based Philox generator. Generators with
+    the same seed and stream produce the same sequence, and different streams of the same
+    seed are statistically independent, e.g. one stream per worker or trial.
+    """
+
+    def __init__(self, seed=None, stream=()):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        if not isinstance(stream, tuple):
+            stream = (stream,)
+
+        self.seed = seed
+        self.stream = stream
+        sequence = np.random.SeedSequence(seed, spawn_key=stream)
+        self.generator = np.random.Generator(np.random.Philox(sequence))
+
+    def __repr__(self):
+        return "FastRNG(seed=%r, stream=%r)" % (self.seed, self.stream)
+
+    def randomBytes(self, n):
+        """Return n random bytes."""
+        return self.generator.bytes(n)
+
+    def randomBits(self, n):
+        """Return a bool array of n bits, each either 0 or 1 with equal probability."""
+        buf = np.frombuffer(self.generator.bytes((n + 7) // 8), dtype=np.uint8)
+        return np.unpackbits(buf)[:n].astype(bool)
+
+    def random(self, size=None):
+        """Return uniform floats in [0, 1), as a scalar if size is None."""
+        return self.generator.random(size)
+
+    def integers(self, high, size=None):
+        """Return uniform integers in [0, high), as a scalar if size is None."""
+        out = self.generator.integers(high, size=size)
+        return int(out) if size is None else out
+
+    def normal(self, scale=1.0, size=None):
+        """Return normally distributed floats with mean 0 and the given standard deviation,
+        which may be an array.
+        """
+        return self.generator.normal(0.0, scale, size)
+
+    def choice(self, options):
+        """Return one element of options chosen uniformly at random."""
+        return options[self.integers(len(options))]
+
+    def permutation(self, n):
+        """Return a random permutation of range(n) as an int64 array."""
+        return self.generator.permutation(n).astype(np.int64)
+
+    def substream(self, k):
+        """Return the generator for child stream k of this one."""
+        return FastRNG(self.seed, self.stream + (k,))
+
+    def spawn(self, n):
+        """Return n independent child generators, streams 0..n-1 of this one."""
+        return [self.substream(k) for k in range(n)]
+
+_current = CryptoRNG()
+
+def getRNG():
+    """Return the random source used by the protocol modules."""
+    return _current
+
+def setRNG(rng):
+    """Make rng the random source used by the protocol modules and return the previous one."""
+    global _current
+    previous = _current
+    _current = rng
+    return previous
+
+def seed(value, stream=()):
+    """Switch to a FastRNG with the given seed and stream so that runs can be replayed
+    exactly. NumPy's global generator is seeded from the same stream as well, since qit
+    uses it for measurements in the qit engine.
+    """
+    rng = FastRNG(value, stream)
+    np.random.seed(rng.integers(2 ** 32))
+    setRNG(rng)
+    return rng
+
+def useCrypto():
+    """Switch back to the default CSPRNG source."""
+    setRNG(CryptoRNG())
+
+class using(object):
+    """Context manager that makes rng the current random source for the duration of a
+    with block.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def __enter__(self):
+        self.previous = setRNG(self.rng)
+        return self.rng
+
+    def __exit__(self, *exc):
+        setRNG(self.previous)
+        return False
@@ -0,0 +1,205 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
+import qkdsim.simulations as simulations
+
+# One-way delay of the simulated classical channel, in seconds
+LATENCY = 0.005
+
+# Time the link is busy sending each frame, whatever its size
+FRAME_TIME = 0.0001
+
+# Longest time a message waits for messages of other sessions to share its frame
+BATCH_WINDOW = 0.001
+
+# Runs the quantum part of each session off the event loop, one session at a time, since
+# the random source of qkdsim.rng is shared and not safe to draw from concurrently
+_simulator = ThreadPoolExecutor(max_workers=1)
+
+class ClassicalChannel(object):
+    """In-process classical channel between a key server (Alice) and its clients (Bob)
+    with a fixed one-way latency. The link sends one frame at a time, each keeping it busy
+    for frameTime. With batch=True, messages sent in the same direction within batchWindow
+    of each other travel together in one frame, so concurrent sessions share the cost of
+    each frame instead of paying it once per message.
+    """
+
+    def __init__(self, latency=LATENCY, batchWindow=BATCH_WINDOW, batch=True, frameTime=FRAME_TIME):
+        self.latency = latency
+        self.frameTime = frameTime
+        self.batchWindow = batchWindow
+        self.batch = batch
+        self.frames = 0
+        self.messages = 0
+        self.counts = {}
+        self._pending = {}
+        self._flushes = set()
+        self._link = None
+
+    def __repr__(self):
+        return "ClassicalChannel(latency=%g, %d messages in %d frames)" % (self.latency, self.messages, self.frames)
+
+    async def send(self, sender, kind, payload=None):
+        """Send a message of the given kind from sender ('A' or 'B') to the other side and
+        return its payload once it has been delivered.
+        """
+        self.messages += 1
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if not self.batch:
+            await self._transmit()
+            return payload
+
+        loop = asyncio.get_running_loop()
+        delivered = loop.create_future()
+        if sender not in self._pending:
+            self._pending[sender] = []
+            flush = loop.create_task(self._flush(sender))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        self._pending[sender].append((delivered, payload))
+        return await delivered
+
+    async def _flush(self, sender):
+        await asyncio.sleep(self.batchWindow)
+        frame = self._pending.pop(sender)
+        await self._transmit()
+        for delivered, payload in frame:
+            delivered.set_result(payload)
+
+    async def _transmit(self):
+        """Wait for the link, send one frame and wait for it to arrive."""
+        if self._link is None:
+            self._link = asyncio.Lock()
+        async with self._link:
+            self.frames += 1
+            await asyncio.sleep(self.frameTime)
+        await asyncio.sleep(self.latency)
+
+class SessionStats(object):
+    """Aggregate outcome of a set of concurrent sessions:
+        sessions   = number of sessions run
+        aborted    = number of sessions that aborted
+        secretBits = total length of the final keys
+        elapsed    = wall-clock time of the whole run, in seconds
+        latencies  = time each session spent on the classical channel, from the end of its
+                     simulation to its final key, in seconds
+        frames     = frames carried by the classical channel
+        messages   = messages carried by the classical channel
+        reports    = the ProtocolResult of each session
+    """
+
+    def __init__(self, reports, latencies, elapsed, link):
+        self.reports = reports
+        self.latencies = np.asarray(latencies, dtype=float)
+        self.elapsed = elapsed
+        self.sessions = len(reports)
+        self.aborted = sum(1 for report in reports if report.aborted)
+        self.secretBits = sum(len(report.key_A) for report in reports if not report.aborted)
+        self.frames = link.frames
+        self.messages = link.messages
+
+    def throughput(self):
+        """Return the secret key rate over all sessions, in bits per second."""
+        return self.secretBits / self.elapsed if self.elapsed > 0 else 0.0
+
+    def latency(self, percentile=50):
+        """Return the given percentile of the per-session latencies, in seconds."""
+        if not self.sessions:
+            return 0.0
+        return float(np.percentile(self.latencies, percentile))
+
+    def asDict(self):
+        return {
+            'sessions': self.sessions,
+            'aborted': self.aborted,
+            'secretBits': self.secretBits,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput(),
+            'latencyMedian': self.latency(50),
+            'latency99': self.latency(99),
+            'frames': self.frames,
+            'messages': self.messages,
+        }
+
+    def render(self):
+        """Return a human-readable summary of the run."""
+        return "%d sessions, %d aborted\n%d secret bits in %.3f s (%.0f bits/s)\n"\
+               "latency: median %.1f ms, 99th percentile %.1f ms\n%d messages in %d frames" % (
+                   self.sessions, self.aborted, self.secretBits, self.elapsed, self.throughput(),
+                   1000 * self.latency(50), 1000 * self.latency(99), self.messages, self.frames)
+
+    def __str__(self):
+        return self.render()
+
+async def runSession(link, n, eve=False, errorRate=0.0, reconcile=True, amplify=True, channel=None,
+                     attack=None, discloseFraction=None):
+    """Run one BB84 session with the numpy engine and exchange its public messages over
+    the ClassicalChannel link, then return its ProtocolResult. The protocol itself is
+    simulations.runBB84, with channel, attack and discloseFraction as there.
+    """
+    report = await simulate(n, eve, errorRate, reconcile, amplify, channel, attack, discloseFraction)
+    return await exchange(link, report)
+
+async def simulate(n, eve=False, errorRate=0.0, reconcile=True, amplify=True, channel=None,
+                   attack=None, discloseFraction=None):
+    """Run simulations.runBB84 for one session in a worker thread, so that the event loop
+    keeps delivering the messages of other sessions meanwhile, and return its
+    ProtocolResult. Simulations of concurrent sessions run one after another.
+    """
+    run = partial(simulations.runBB84, n, eve, errorRate, engine='numpy', quiet=True, reconcile=reconcile,
+                  amplify=amplify, channel=channel, attack=attack, discloseFraction=discloseFraction)
+    return await asyncio.get_running_loop().run_in_executor(_simulator, run)
+
+async def exchange(link, report):
+    """Send the public messages of a simulated session over the ClassicalChannel link and
+    return its report once the last one is delivered. The quantum transmission itself
+    takes no time, so this is the session's latency.
+    """
+    # Bob announces which photons he detected and his bases, Alice answers with hers,
+    # then both announce the disclosed bits
+    await link.send('B', 'bases')
+    await link.send('A', 'bases')
+    await link.send('B', 'disclose')
+    await link.send('A', 'disclose')
+    if report.aborted:
+        return report
+
+    # Each round trip of Cascade: Alice sends parities and Bob answers with his
+    for k in range(report.rounds):
+        await link.send('A', 'parity')
+        await link.send('B', 'parity')
+
+    if 'amplified' in report.stages:
+        await link.send('A', 'seed')
+    return report
+
+async def runSessions(numSessions, n, eve=False, errorRate=0.0, latency=LATENCY,
+                      batchWindow=BATCH_WINDOW, batch=True, frameTime=FRAME_TIME, reconcile=True,
+                      amplify=True, maxConcurrent=None, channel=None, attack=None, discloseFraction=None):
+    """Run numSessions BB84 sessions of n key bits each concurrently over one simulated
+    ClassicalChannel and return their SessionStats. maxConcurrent limits how many
+    sessions are in progress at once; channel, attack and discloseFraction are passed on
+    to runSession. Each session's latency counts only its messages, not the time its
+    simulation waited for or took on the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    link = ClassicalChannel(latency, batchWindow, batch, frameTime)
+    limit = asyncio.Semaphore(maxConcurrent or numSessions or 1)
+    latencies = [0.0] * numSessions
+
+    async def session(k):
+        async with limit:
+            report = await simulate(n, eve, errorRate, reconcile, amplify, channel, attack, discloseFraction)
+            start = loop.time()
+            await exchange(link, report)
+            latencies[k] = loop.time() - start
+            return report
+
+    start = loop.time()
+    reports = await asyncio.gather(*[session(k) for k in range(numSessions)])
+    return SessionStats(list(reports), latencies, loop.time() - start, link)
+
+def simulateSessions(numSessions, n, **kwargs):
+    """Blocking wrapper around runSessions, taking the same arguments."""
+    return asyncio.run(runSessions(numSessions, n, **kwargs))
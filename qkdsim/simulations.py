@@ -1,32 +1,233 @@
+import numpy as np
 import qkdsim.bb84 as bb84
 import qkdsim.b92 as b92
 import qkdsim.e91 as e91
 import qkdsim.qkdutils as util
-
-def runBB84(n, eve=False, errorRate=0.0, verbose=True):
+import qkdsim.reconciliation as reconciliation
+import qkdsim.amplification as amplification
+import qkdsim.attacks as attacks
+import qkdsim.instrument as instrument
+import qkdsim.states as states
+import qkdsim.packedkey as packedkey
+from qkdsim.packedkey import PackedKey
+from qkdsim.results import ProtocolResult, ABORT_EMPTY, ABORT_LENGTH, ABORT_ERRORS, ABORT_BELL
+
+ENGINES = ('qit', 'numpy')
+
+# Random bit sources, timed as the 'random' stage when profiling
+_randomPacked = instrument.timed('random')(PackedKey.random)
+_randomArray = instrument.timed('random')(util.getRandomBitArray)
+_randomList = instrument.timed('random')(util.getRandomBits)
+
+def _selectEngine(engine, packed):
+    """Return the tuple (batch, getRandomBits) for the given engine settings."""
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine: %s" % engine)
+    if packed and engine != 'numpy':
+        raise ValueError("packed keys require the numpy engine")
+
+    if packed:
+        return (True, _randomPacked)
+    if engine == 'numpy':
+        return (True, _randomArray)
+    return (False, _randomList)
+
+def _codes(qubits):
+    """Return the state codes of a list of qit states, see qkdsim.states."""
+    return np.array([states.toCode(q) for q in qubits], dtype=np.uint8)
+
+def _detected(numBits, channel, interception):
+    """Return the mask of photons that reach Bob, or None if all of them do."""
+    detected = None
+    if channel is not None and channel.transmittance < 1:
+        detected = channel.transmit(numBits)
+    if interception is not None and not interception.arrived.all():
+        detected = interception.arrived if detected is None else detected & interception.arrived
+    return detected
+
+def _attack(attack, protocol, sent_A, verbose):
+    """Apply the given attack to the qubits in transit and return the Interception."""
+    attack = attacks.getAttack(attack)
+    if verbose:
+        print("Eve attacks the qubits as they travel to Bob: %r\n" % attack)
+
+    with instrument.stage('attack', len(sent_A)):
+        return getattr(attack, protocol)(sent_A)
+
+def _eveInformation(report, key_A, guesses, classes, show):
+    """Record Eve's information about the sifted key."""
+    report.eveInfo = attacks.eveInformation(key_A, guesses, classes)
+    if show:
+        print("Eve's information about the sifted key: %f bits per bit" % report.eveInfo)
+
+def _keep(bits, mask):
+    """Return the bits where mask is set, held the same way as bits."""
+    if isinstance(bits, PackedKey):
+        return bits.compress(mask)
+    if isinstance(bits, list):
+        return [b for b, m in zip(bits, mask) if m]
+    return np.asarray(bits)[np.asarray(mask, dtype=bool)]
+
+def _sendPacked(rawKey, bases_A, bases_E, bases_B, errorRate, channel, attack):
+    """Run the numpy quantum stages of BB84 on a packed raw key and bases, simulating
+    packedkey.CHUNK_BITS qubits at a time so that only one chunk is ever held as state
+    codes. bases_E is None without eavesdropping and attack an attack object or None.
+    Returns the tuple (key_B, detected, interception): Bob's results and the mask of the
+    photons that reached him as PackedKeys, or None for the mask if all did, and the
+    Interception of the attack, whose guesses and classes alone are kept unpacked.
+    """
+    results, arrived, guesses, classes = [], [], [], []
+    lost = False
+    for start in range(0, len(rawKey), packedkey.CHUNK_BITS):
+        stop = min(start + packedkey.CHUNK_BITS, len(rawKey))
+        with instrument.stage('encodeKey', stop - start):
+            sent_A = bb84.encodeKeyBatch(rawKey.toBits(start, stop), bases_A.toBits(start, stop))
+
+        interception = None
+        if attack is not None:
+            with instrument.stage('attack', stop - start):
+                interception = attack.bb84(sent_A)
+            sent_A = interception.states
+            guesses.append(interception.guesses)
+            classes.append(interception.classes)
+        if bases_E is not None:
+            with instrument.stage('simulateEavesdrop', stop - start):
+                sent_A = bb84.simulateEavesdropBatch(sent_A, bases_E.toBits(start, stop))
+
+        with instrument.stage('simulateNoise', stop - start):
+            sent_A = bb84.simulateNoiseBatch(sent_A, errorRate)
+        with instrument.stage('decodeState', stop - start):
+            results.append(PackedKey.fromBits(bb84.decodeStateBatch(sent_A, bases_B.toBits(start, stop), channel)))
+
+        detected = _detected(stop - start, channel, interception)
+        lost = lost or detected is not None
+        arrived.append(PackedKey.fromBits(np.ones(stop - start, dtype=bool) if detected is None else detected))
+
+    interception = None
+    if attack is not None:
+        interception = attacks.Interception(None, None, np.concatenate(guesses), np.concatenate(classes))
+    detected = PackedKey.concatenate(arrived) if lost else None
+    return (PackedKey.concatenate(results), detected, interception)
+
+def disclose(key_A, key_B, fraction):
+    """Announce every other sifted bit, or a random sample of the given fraction of them,
+    and return the tuple (announce_A, key_A, announce_B, key_B). Used by the run functions
+    here and by the other engines, such as qkdsim.fused.
+    """
+    if fraction is None:
+        with instrument.stage('discloseHalf', len(key_A)):
+            return util.discloseHalf(key_A, key_B)
+    with instrument.stage('discloseSample', len(key_A)):
+        return util.discloseSample(key_A, key_B, fraction)
+
+def finish(report, key_A, key_B, quiet, reconcile=False, amplify=False, estimate=0.0, sample=None):
+    """Check the final keys for eavesdropping, reconcile and amplify them if asked to, and
+    return the report if quiet is set, or the key otherwise. estimate is the error rate measured on the
+    announced bits. If the announced bits were a random sample, pass them as sample and
+    the check is made on them with the finite-size threshold instead.
+    """
+    report.setKeys(key_A, key_B)
+    report.estimate = estimate
+    report.stages['kept'] = len(key_A)
+
+    with instrument.stage('detectEavesdrop', len(key_A)):
+        if sample is None:
+            detected = util.detectEavesdrop(key_A, key_B, report.errorRate)
+        else:
+            detected = len(key_A) == 0 or util.detectEavesdrop(sample[0], sample[1], report.errorRate,
+                                                              util.DETECT_EPSILON)
+
+    if detected:
+        report.abort(ABORT_EMPTY if len(key_A) == 0 else ABORT_ERRORS)
+        if not quiet:
+            print("\nAlice and Bob detect Eve's interference and abort the protocol.\n")
+    else:
+        if reconcile:
+            _reconcile(report, key_A, key_B, estimate, not quiet)
+        if amplify:
+            _amplify(report, estimate, not quiet)
+
+    return report if quiet else report.key
+
+def _reconcile(report, key_A, key_B, estimate, show):
+    """Correct Bob's key with Cascade and record the parity bits it leaked."""
+    with instrument.stage('reconcile', len(key_A)):
+        key_B, report.leaked, report.rounds = reconciliation.cascade(key_A, key_B, estimate)
+    report.setKeys(key_A, key_B)
+    report.stages['reconciled'] = len(key_A)
+
+    if show:
+        print("\nAlice and Bob reconcile their keys with Cascade, exchanging %d parity bits."\
+              "\n%d mismatched bits remain." % (report.leaked, report.mismatches))
+
+def _amplify(report, qber, show):
+    """Compress the keys with a random Toeplitz hash to remove Eve's information."""
+    with instrument.stage('amplify', len(report.key_A)):
+        key_A, key_B = amplification.amplify(report.key_A, report.key_B, qber, report.leaked)
+    report.setKeys(key_A, key_B)
+    report.stages['amplified'] = len(key_A)
+
+    if show:
+        print("\nAlice and Bob apply a random Toeplitz hash to their keys, leaving %d secret bits:"\
+              "\n%s" % (len(key_A), util.bitFormat(key_A)))
+
+@instrument.timed('runBB84')
+def runBB84(n, eve=False, errorRate=0.0, verbose=True, engine='qit', packed=False, quiet=False,
+            reconcile=False, amplify=False, channel=None, attack=None, discloseFraction=None):
     """Simulation of Bennett & Brassard's 1984 protocol for quantum key distribution with
     n initial bits in the raw key.
     If eve is set to True, assumes the presence of an eavesdropper attempting an
     intercept-resend attack.
+    engine selects how qubits are simulated: 'qit' builds one qit.state per qubit, while
+    'numpy' holds the whole batch as arrays and gives the same statistics much faster.
+    With the numpy engine, packed=True holds every key and basis string as a PackedKey and
+    runs the quantum stages packedkey.CHUNK_BITS qubits at a time, so memory grows with n
+    at about one bit per qubit for each string. Attacks still keep Eve's guesses unpacked.
+    With quiet=True nothing is formatted or printed, and a ProtocolResult is returned
+    instead of the key.
+    With reconcile=True, Bob's key is corrected with Cascade after the eavesdropping check,
+    and with amplify=True both keys are then shortened by Toeplitz privacy amplification.
+    channel is a qkdsim.channels.Channel the qubits pass through on their way to Bob, on
+    top of the errorRate bit flips. Photons it loses are discarded once Bob announces which
+    ones he detected.
+    attack selects an attack from qkdsim.attacks, by name or as an object, in place of the
+    full intercept-resend attack of eve=True, and Eve's information about the sifted key
+    is recorded. Attacks require the numpy engine.
+    By default every other sifted bit is announced and the kept key is checked against a
+    tolerance of 1.2*errorRate. With discloseFraction, a random sample of that fraction of
+    the sifted bits is announced instead, and Alice and Bob abort if its error rate exceeds
+    the finite-size bound of util.finiteSizeThreshold.
     """
+    batch, getRandomBits = _selectEngine(engine, packed)
+    show = not quiet
+    verbose = verbose and show
+    report = ProtocolResult('BB84', n, eve or attack is not None, errorRate)
+    interception = None
+    if attack is not None:
+        if not batch:
+            raise ValueError("attacks require the numpy engine")
+        eve = False
+
     numBits = 5 * n
+    report.stages['raw'] = numBits
 
     if verbose:
         print("\n=====BB84 protocol=====\n%d initial bits, ~%d key bits" % (numBits, n))
-        if eve: print("with eavesdropping")
+        if report.eve: print("with eavesdropping")
         else: print("without eavesdropping")
         if errorRate: print("with channel noise")
         else: print("without channel noise")
 
     # Alice generates a random bit string to be encoded
-    rawKey = util.getRandomBits(numBits)
+    rawKey = getRandomBits(numBits)
 
     # Alice also randomly chooses which basis to use when encoding each bit
     # 0: computational basis; 1: Hadamard basis
-    bases_A = util.getRandomBits(numBits)
+    bases_A = getRandomBits(numBits)
 
-    print("\nAlice generates %d random bits to be encoded:\n%s" % (numBits, util.bitFormat(rawKey)))
-    print("For each bit, Alice randomly chooses one of two non-orthogonal sets of bases:\n%s" % util.bitFormat(bases_A))
+    if show:
+        print("\nAlice generates %d random bits to be encoded:\n%s" % (numBits, util.bitFormat(rawKey)))
+        print("For each bit, Alice randomly chooses one of two non-orthogonal sets of bases:\n%s" % util.bitFormat(bases_A))
 
     if verbose:
         print("\nAlice encodes each bit according to the following strategy:"\
@@ -37,99 +238,181 @@ def runBB84(n, eve=False, errorRate=0.0, verbose=True):
               "\n      1   |   1   | +0.7071 (|0> - |1>)"\
               "\nShe then sends each qubit one by one to Bob over a quantum channel.\n")
 
-    # Alice prepares n qubits, with the kth qubit in state |0> or |1> in either the computational
-    # basis or the Hadamard basis, depending on the value of the kth bit in each bitstring
-    sent_A = bb84.encodeKey(rawKey, bases_A)
-
-    # QKD guarantees with high probability we will detect any eavesdropping
-
-    if eve:
-        if verbose:
-            print("Eve intercepts each qubit as it travels to Bob. Because it is not possible"\
-                  "\nto clone quantum states, she must measure each qubit before re-sending to"\
-                  "\nBob. Every time she measures a qubit in the 'wrong' basis, she has a 50%"\
-                  "\nprobability of being detected.\n")
-
-        # No matter what strategy Eve uses to select bases, the probability she will be detected
-        # is always 1-(3/4)^numBits if Alice chose her bases randomly
-        bases_E = util.getRandomBits(numBits)
-        print("Eve chooses a random basis to measure each qubit in:\n%s" % util.bitFormat(bases_E))
-
-        # Eve measures each qubit and attempts to cover her tracks
-        for k in range(numBits):
-            sent_A[k] = bb84.simulateEavesdrop(sent_A[k], bases_E[k])
-
-        if verbose: print("\nEve attempts to hide her actions by re-encoding her measurement result"\
-                          "\nbefore re-sending the qubits to Bob.\n")
-
-    # Introduce error due to noise
-    sent_A = bb84.simulateNoise(sent_A, errorRate)
-
-    # Bob measures each qubit in a randomly chosen basis
-    bases_B = util.getRandomBits(numBits)
-    key_B = []
-    for k in range(numBits):
-        key_B.append(bb84.decodeState(sent_A[k], bases_B[k]))
-
-    print("Bob chooses a random basis to measure each qubit in:\n%s" % util.bitFormat(bases_B))
-    print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
+    if packed:
+        # Bob's bases, and Eve's, are drawn up front and the qubits then sent a chunk at a
+        # time, so that only the packed keys and bases grow with n
+        if attack is not None:
+            attack = attacks.getAttack(attack)
+            if verbose:
+                print("Eve attacks the qubits as they travel to Bob: %r\n" % attack)
+        bases_E = None
+        if eve:
+            bases_E = getRandomBits(numBits)
+            if show:
+                print("Eve chooses a random basis to measure each qubit in:\n%s" % util.bitFormat(bases_E))
+        bases_B = getRandomBits(numBits)
+        key_B, detected, interception = _sendPacked(rawKey, bases_A, bases_E, bases_B, errorRate, channel, attack)
+    else:
+        # Alice prepares n qubits, with the kth qubit in state |0> or |1> in either the computational
+        # basis or the Hadamard basis, depending on the value of the kth bit in each bitstring
+        with instrument.stage('encodeKey', numBits):
+            if batch:
+                sent_A = bb84.encodeKeyBatch(rawKey, bases_A)
+            else:
+                sent_A = bb84.encodeKey(rawKey, bases_A)
+
+        # QKD guarantees with high probability we will detect any eavesdropping
+        if attack is not None:
+            interception = _attack(attack, 'bb84', sent_A, verbose)
+            sent_A = interception.states
+
+        if eve:
+            if verbose:
+                print("Eve intercepts each qubit as it travels to Bob. Because it is not possible"\
+                      "\nto clone quantum states, she must measure each qubit before re-sending to"\
+                      "\nBob. Every time she measures a qubit in the 'wrong' basis, she has a 50%"\
+                      "\nprobability of being detected.\n")
+
+            # No matter what strategy Eve uses to select bases, the probability she will be detected
+            # is always 1-(3/4)^numBits if Alice chose her bases randomly
+            bases_E = getRandomBits(numBits)
+            if show:
+                print("Eve chooses a random basis to measure each qubit in:\n%s" % util.bitFormat(bases_E))
+
+            # Eve measures each qubit and attempts to cover her tracks
+            with instrument.stage('simulateEavesdrop', numBits):
+                if batch:
+                    sent_A = bb84.simulateEavesdropBatch(sent_A, bases_E)
+                else:
+                    for k in range(numBits):
+                        sent_A[k] = bb84.simulateEavesdrop(sent_A[k], bases_E[k])
+
+            if verbose: print("\nEve attempts to hide her actions by re-encoding her measurement result"\
+                              "\nbefore re-sending the qubits to Bob.\n")
+
+        # Introduce error due to noise
+        with instrument.stage('simulateNoise', numBits):
+            if batch:
+                sent_A = bb84.simulateNoiseBatch(sent_A, errorRate)
+            else:
+                sent_A = bb84.simulateNoise(sent_A, errorRate)
+
+        # Bob measures each qubit in a randomly chosen basis
+        bases_B = getRandomBits(numBits)
+        with instrument.stage('decodeState', numBits):
+            if batch:
+                key_B = bb84.decodeStateBatch(sent_A, bases_B, channel)
+            elif channel is not None:
+                key_B = bb84.decodeStateBatch(_codes(sent_A), bases_B, channel).tolist()
+            else:
+                key_B = []
+                for k in range(numBits):
+                    key_B.append(bb84.decodeState(sent_A[k], bases_B[k]))
+
+        # Photons lost in the channel or stopped by Eve never reach Bob, and he announces
+        # which ones he detected
+        detected = _detected(numBits, channel, interception)
+
+    if detected is not None:
+        rawKey, bases_A, bases_B, key_B = [_keep(bits, detected) for bits in (rawKey, bases_A, bases_B, key_B)]
+        if interception is not None:
+            interception.guesses = _keep(interception.guesses, detected)
+            interception.classes = _keep(interception.classes, detected)
+        numBits = len(key_B)
+        report.stages['detected'] = numBits
+
+    if show:
+        print("Bob chooses a random basis to measure each qubit in:\n%s" % util.bitFormat(bases_B))
+        print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
 
     # Alice and Bob discard any bits where they chose different bases.
-    key_A, key_B = bb84.matchKeys(rawKey, key_B, bases_A, bases_B)
+    with instrument.stage('matchKeys', numBits):
+        if batch:
+            key_A, key_B = bb84.matchKeysBatch(rawKey, key_B, bases_A, bases_B)
+        else:
+            key_A, key_B = bb84.matchKeys(rawKey, key_B, bases_A, bases_B)
     numBits = len(key_A)
+    report.stages['sifted'] = numBits
+    if interception is not None:
+        guesses, classes = bb84.matchKeysBatch(interception.guesses, interception.classes, bases_A, bases_B)
+        _eveInformation(report, key_A, guesses, classes, show)
 
     if verbose:
         print("\nBob announces when he has measured the last qubit and discloses"\
               "\nthe bases he used for each measurement. Alice and Bob then discard"\
               "\nany bits where they chose different bases.\n")
 
-    print("Alice's key after discarding mismatches:\n%s" % util.bitFormat(key_A))
-    print("Bob's key after discarding mismatches:\n%s" % util.bitFormat(key_B))
+    if show:
+        print("Alice's key after discarding mismatches:\n%s" % util.bitFormat(key_A))
+        print("Bob's key after discarding mismatches:\n%s" % util.bitFormat(key_B))
 
     # Alice and Bob sacrifice a subset of their bits to try to detect Eve
-    announce_A, key_A, announce_B, key_B = util.discloseHalf(key_A, key_B)
+    announce_A, key_A, announce_B, key_B = disclose(key_A, key_B, discloseFraction)
+    report.stages['announced'] = len(announce_A)
     if verbose:
         print("\nAlice and Bob sacrifice %d of their %d shared bits and publicly announce"\
-              "\ntheir values. They agree to disclose every other bit of their shared key.\n" % (len(announce_A), numBits))
-
-    print("Alice's announced bits:\n%s" % util.bitFormat(announce_A))
-    print("Bob's announced bits:\n%s" % util.bitFormat(announce_B))
+              "\ntheir values. They agree to disclose %s of their shared key.\n" % (len(announce_A), numBits,
+              "every other bit" if discloseFraction is None else "a random sample"))
 
-    numBits = len(key_A)
-    print("Alice's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_A)))
-    print("Bob's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_B)))
+    if show:
+        print("Alice's announced bits:\n%s" % util.bitFormat(announce_A))
+        print("Bob's announced bits:\n%s" % util.bitFormat(announce_B))
 
-    print("Expected error rate: %f" % errorRate)
-    print("Actual error rate: %f" % (float(sum([1 for k in range(len(key_A)) if key_A[k] != key_B[k]]))/len(key_A)))
+        numBits = len(key_A)
+        print("Alice's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_A)))
+        print("Bob's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_B)))
 
-    if util.detectEavesdrop(key_A, key_B, errorRate):
-        print("\nAlice and Bob detect Eve's interference and abort the protocol.")
-        return -1
+        print("Expected error rate: %f" % errorRate)
+        print("Actual error rate: %f" % (float(util.countMismatches(key_A, key_B))/max(len(key_A), 1)))
 
-    return key_A
+    estimate = float(util.countMismatches(announce_A, announce_B)) / max(len(announce_A), 1)
+    sample = None if discloseFraction is None else (announce_A, announce_B)
+    return finish(report, key_A, key_B, quiet, reconcile, amplify, estimate, sample)
 
-def runB92(n, eve=False, errorRate=0.0, verbose=True):
+@instrument.timed('runB92')
+def runB92(n, eve=False, errorRate=0.0, verbose=True, engine='qit', packed=False, quiet=False,
+           reconcile=False, amplify=False, channel=None, attack=None, discloseFraction=None):
     """Simulation of Bennet's 1992 protocol for quantum key distribution with n initial
     bits in the raw key. If eve is set to True, assumes the presence of an eavesdropper
     attempting an intercept-resend attack. errorRate represents the probability that a bit
     will be flipped when Bob measures it.
+    engine and packed select how qubits and keys are held, quiet returns a ProtocolResult
+    without printing, reconcile and amplify add the post-processing stages, and channel
+    adds a noisy, lossy channel, attack an attack from qkdsim.attacks, and discloseFraction
+    a random-sample eavesdropping check, see runBB84.
+    Lost photons look absorbed to Bob.
     """
+    batch, getRandomBits = _selectEngine(engine, packed)
+    show = not quiet
+    verbose = verbose and show
+    report = ProtocolResult('B92', n, eve or attack is not None, errorRate)
+    interception = None
+    if attack is not None:
+        if not batch:
+            raise ValueError("attacks require the numpy engine")
+        eve = False
 
     numBits = 8 * n
+    report.stages['raw'] = numBits
 
     if verbose:
         print("\n=====B92 protocol=====\n%d initial bits, ~%d key bits" % (numBits, n))
-        if eve: print("with eavesdropping")
+        if report.eve: print("with eavesdropping")
         else: print("without eavesdropping")
         if errorRate: print("with channel noise")
         else: print("without channel noise")
 
     # Alice generates a random bit string to be encoded
-    rawKey = util.getRandomBits(numBits)
-    print("\nAlice generates %d random bits to be encoded:\n%s" % (numBits, util.bitFormat(rawKey)))
+    rawKey = getRandomBits(numBits)
+    if show:
+        print("\nAlice generates %d random bits to be encoded:\n%s" % (numBits, util.bitFormat(rawKey)))
 
     # Alice encodes each bit as a qubit as |0> in either the computational or Hadamard basis
-    sent_A = b92.encodeKey(rawKey)
+    with instrument.stage('encodeKey', numBits):
+        if batch:
+            sent_A = b92.encodeKeyBatch(rawKey)
+        else:
+            sent_A = b92.encodeKey(rawKey)
     if verbose:
         print("Alice encodes each bit according to the following strategy:"\
           "\n    value | state"\
@@ -138,85 +421,150 @@ def runB92(n, eve=False, errorRate=0.0, verbose=True):
           "\nShe then sends each qubit one by one to Bob over a quantum channel.\n")
 
     # QKD guarantees with high probability we will detect any eavesdropping
+    if attack is not None:
+        interception = _attack(attack, 'b92', sent_A, verbose)
+        sent_A = interception.states
+
     if eve:
         if verbose:
             print("Eve intercepts each qubit as it travels to Bob. Because it is not possible"\
                   "\nto clone quantum states, she must measure each qubit before re-sending to Bob.\n")
 
         # Eve randomly selects a filter to use for each qubit
-        bases_E = util.getRandomBits(numBits)
-        print("Eve chooses a random filter to measure each qubit with:\n%s" % util.bitFormat(bases_E))
+        bases_E = getRandomBits(numBits)
+        if show:
+            print("Eve chooses a random filter to measure each qubit with:\n%s" % util.bitFormat(bases_E))
 
         # Eve measures each qubit and attempts to cover her tracks
-        temp = []
-        for k in range(numBits):
-            result = b92.simulateEavesdrop(sent_A[k], bases_E[k])
-            if result != None: temp.append(result)
-
-        sent_A = temp
+        with instrument.stage('simulateEavesdrop', numBits):
+            if batch:
+                sent_A = b92.simulateEavesdropBatch(sent_A, bases_E)
+            else:
+                temp = []
+                for k in range(numBits):
+                    result = b92.simulateEavesdrop(sent_A[k], bases_E[k])
+                    if result != None: temp.append(result)
+
+                sent_A = temp
         numBits = len(sent_A)
+        report.stages['resent'] = numBits
 
         if verbose: print("\nEve attempts to hide her actions by re-encoding her measurement result"\
                           "\nbefore re-sending the qubits to Bob.\n")
 
     # Introduce error due to noise
-    sent_A = b92.simulateNoise(sent_A, errorRate)
+    with instrument.stage('simulateNoise', numBits):
+        if batch:
+            sent_A = b92.simulateNoiseBatch(sent_A, errorRate)
+        else:
+            sent_A = b92.simulateNoise(sent_A, errorRate)
 
     # Bob measures each qubit in a randomly chosen basis
-    bases_B = util.getRandomBits(numBits)
-    key_B = []
-    for k in range(numBits):
-        result = b92.decodeState(sent_A[k], bases_B[k])
-        if result == None: key_B.append(-1)
-        else: key_B.append(result)
-
-    print("Bob chooses a random filter to measure each qubit with:\n%s" % util.bitFormat(bases_B))
-    print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
+    bases_B = getRandomBits(numBits)
+    with instrument.stage('decodeState', numBits):
+        if batch:
+            key_B = b92.decodeStateBatch(sent_A, bases_B, channel)
+        elif channel is not None:
+            # B92 codes hold only the encoded bit, the basis bit of the state code
+            key_B = b92.decodeStateBatch(_codes(sent_A) >> 1, bases_B, channel).tolist()
+        else:
+            key_B = []
+            for k in range(numBits):
+                result = b92.decodeState(sent_A[k], bases_B[k])
+                if result == None: key_B.append(-1)
+                else: key_B.append(result)
+
+    # Bob cannot tell a lost photon from one absorbed by his filter
+    detected = _detected(numBits, channel, interception)
+    if detected is not None:
+        lost = ~detected
+        if batch:
+            key_B[lost] = -1
+        else:
+            key_B = [-1 if l else r for r, l in zip(key_B, lost)]
+
+    if show:
+        print("Bob chooses a random filter to measure each qubit with:\n%s" % util.bitFormat(bases_B))
+        print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
 
     # Discard bits where Bob did not see a result
-    key_A, key_B = b92.matchKeys(rawKey, key_B)
+    seen = np.asarray(key_B) != -1
+    with instrument.stage('matchKeys', numBits):
+        if batch:
+            key_A, key_B = b92.matchKeysBatch(rawKey, key_B)
+        else:
+            key_A, key_B = b92.matchKeys(rawKey, key_B)
+    if interception is not None:
+        _eveInformation(report, key_A, interception.guesses[seen], interception.classes[seen], show)
     numBits = len(key_B)
+    report.stages['sifted'] = numBits
 
     if verbose:
         print("\nBob announces which photons were completely absorbed and"\
           "\nAlice and Bob discard the corresponding bits from their keys.\n")
-    print("Alice's sifted key:\n%s" % util.bitFormat(key_A))
-    print("Bob's sifted key:\n%s" % util.bitFormat(key_B))
+    if show:
+        print("Alice's sifted key:\n%s" % util.bitFormat(key_A))
+        print("Bob's sifted key:\n%s" % util.bitFormat(key_B))
 
     # Compare key information
     if len(key_A) != len(key_B):
-        print("\nAlice and Bob announce the lengths of their keys. Since Alice's"\
-              "\nkey is %d bits and Bob's is %d bits, they are able to detect"\
-              "\nEve's interference and abort the protocol.\n" % (len(key_A), len(key_B)))
-        return -1
-
-    announce_A, key_A, announce_B, key_B = util.discloseHalf(key_A, key_B)
+        if show:
+            print("\nAlice and Bob announce the lengths of their keys. Since Alice's"\
+                  "\nkey is %d bits and Bob's is %d bits, they are able to detect"\
+                  "\nEve's interference and abort the protocol.\n" % (len(key_A), len(key_B)))
+        report.setKeys(key_A, key_B)
+        report.abort(ABORT_LENGTH)
+        return report if quiet else report.key
+
+    announce_A, key_A, announce_B, key_B = disclose(key_A, key_B, discloseFraction)
+    report.stages['announced'] = len(announce_A)
     if verbose:
         print("\nAlice and Bob sacrifice %d of their %d shared bits and publicly announce"\
-              "\ntheir values. They agree to disclose every other bit of their shared key.\n" % (len(announce_A), numBits))
-    print("Alice's announced bits:\n%s" % util.bitFormat(announce_A))
-    print("Bob's announced bits:\n%s" % util.bitFormat(announce_B))
-
-    numBits = len(key_A)
-    print("Alice's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_A)))
-    print("Bob's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_B)))
-
-    print("Expected error rate: %f" % errorRate)
-    print("Actual error rate: %f" % (float(sum([1 for k in range(len(key_A)) if key_A[k] != key_B[k]]))/len(key_A)))
-
-    if util.detectEavesdrop(key_A, key_B, errorRate):
-        print("\nAlice and Bob detect Eve's interference and abort the protocol.\n")
-        return -1
-
-    return key_A
+              "\ntheir values. They agree to disclose %s of their shared key.\n" % (len(announce_A), numBits,
+              "every other bit" if discloseFraction is None else "a random sample"))
+    if show:
+        print("Alice's announced bits:\n%s" % util.bitFormat(announce_A))
+        print("Bob's announced bits:\n%s" % util.bitFormat(announce_B))
+
+        numBits = len(key_A)
+        print("Alice's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_A)))
+        print("Bob's remaining %d-bit key:\n%s" % (numBits, util.bitFormat(key_B)))
+
+        print("Expected error rate: %f" % errorRate)
+        print("Actual error rate: %f" % (float(util.countMismatches(key_A, key_B))/max(len(key_A), 1)))
+
+    estimate = float(util.countMismatches(announce_A, announce_B)) / max(len(announce_A), 1)
+    sample = None if discloseFraction is None else (announce_A, announce_B)
+    return finish(report, key_A, key_B, quiet, reconcile, amplify, estimate, sample)
+
+@instrument.timed('runE91')
+def runE91(n, errorRate=0.0, verbose=True, engine='qit', packed=False, quiet=False,
+           reconcile=False, amplify=False, channel=None, eve=False):
+    """Simulation of Ekert's 1991 entanglement-based protocol for quantum key distribution.
+    engine='numpy' samples every pair at once instead of one pair at a time, packed packs
+    Alice's key after sampling and both keys after sifting, quiet returns a ProtocolResult
+    without printing, and reconcile and amplify add the post-processing stages, see runBB84.
+    channel is a qkdsim.channels.Channel that Bob's particle of each pair passes through.
+    Pairs whose particle is lost are discarded.
+    With eve=True, Eve measures Bob's particles on their way to him. Alice and Bob detect
+    her with a CHSH test on the pairs measured along different axes, and abort if |S| is
+    e91.BELL_Z standard errors below the bound of Bell's inequality. With fewer than
+    e91.MIN_TERM_PAIRS pairs in some term the test is inconclusive and does not abort.
+    """
+    batch, _ = _selectEngine(engine, packed)
+    show = not quiet
+    verbose = verbose and show
+    report = ProtocolResult('E91', n, eve, errorRate)
+    if eve:
+        channel = e91.interceptChannel() if channel is None else e91.interceptChannel() >> channel
 
-def runE91(n, errorRate=0.0, verbose=True):
-    """Simulation of Ekert's 1991 entanglement-based protocol for quantum key distribution."""
     numBits = 5 * n
+    report.stages['raw'] = numBits
 
     if verbose:
         print("\n=====E91 protocol=====\n%d initial bits, ~%d key bits" % (numBits, n))
-        print("without eavesdropping")
+        if eve: print("with eavesdropping")
+        else: print("without eavesdropping")
         if errorRate: print("with channel noise\n")
         else: print("without channel noise\n")
 
@@ -227,24 +575,85 @@ def runE91(n, errorRate=0.0, verbose=True):
     #     [0, pi/8, pi/4]
     # Bob randomly offsets his axis of measurement by one of the following:
     #     [0, pi/8, -pi/8]
-    bases_A, bases_B = e91.chooseAxes(numBits)
-    key_A, key_B = [], []
-
-    for j in range(numBits):
-        (new_A, new_B) = e91.measureEntangledState(bases_A[j], bases_B[j], errorRate)
-        key_A.append(new_A)
-        key_B.append(new_B)
-
-    print("Alice's randomly chosen axes of measurement:\n%s" % e91.formatBasesForPrint(bases_A))
-    print("Bob's randomly chosen axes of measurement:\n%s" % e91.formatBasesForPrint(bases_B))
-    print("Alice's measurement results:\n%s" % util.bitFormat(key_A))
-    print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
-
-    key_A, key_B, discard_A, discard_B = e91.matchKeys(key_A, key_B, bases_A, bases_B)
-    print("Alice's %d discarded bits:\n%s" % (len(discard_A), util.bitFormat(discard_A)))
-    print("Bob's %d discarded bits:\n%s" % (len(discard_B), util.bitFormat(discard_B)))
-
-    print("Alice's %d-bit sifted key:\n%s" % (len(key_A), util.bitFormat(key_A)))
-    print("Bob's %d-bit sifted key:\n%s" % (len(key_B), util.bitFormat(key_B)))
-
-    return key_A
+    if batch:
+        with instrument.stage('chooseAxes', numBits):
+            bases_A, bases_B = e91.chooseAxesBatch(numBits)
+        with instrument.stage('measureEntangledState', numBits):
+            key_A, key_B = e91.measureEntangledStateBatch(bases_A, bases_B, errorRate, channel)
+            if packed:
+                key_A = PackedKey.fromBits(key_A)
+        formatBases = e91.formatBasesForPrintBatch
+    else:
+        with instrument.stage('chooseAxes', numBits):
+            bases_A, bases_B = e91.chooseAxes(numBits)
+        key_A, key_B = [], []
+
+        with instrument.stage('measureEntangledState', numBits):
+            if channel is not None:
+                key_A, key_B = e91.measureEntangledStateBatch(bases_A, bases_B, errorRate, channel)
+                key_A, key_B = key_A.tolist(), key_B.tolist()
+            else:
+                for j in range(numBits):
+                    (new_A, new_B) = e91.measureEntangledState(bases_A[j], bases_B[j], errorRate)
+                    key_A.append(new_A)
+                    key_B.append(new_B)
+        formatBases = e91.formatBasesForPrint
+
+    if channel is not None and channel.transmittance < 1:
+        detected = channel.transmit(numBits)
+        bases_A, bases_B, key_A, key_B = [_keep(bits, detected) for bits in (bases_A, bases_B, key_A, key_B)]
+        numBits = len(key_B)
+        report.stages['detected'] = numBits
+
+    if show:
+        print("Alice's randomly chosen axes of measurement:\n%s" % formatBases(bases_A))
+        print("Bob's randomly chosen axes of measurement:\n%s" % formatBases(bases_B))
+        print("Alice's measurement results:\n%s" % util.bitFormat(key_A))
+        print("Bob's measurement results:\n%s" % util.bitFormat(key_B))
+
+    with instrument.stage('matchKeys', numBits):
+        if batch:
+            key_A, key_B, discard_A, discard_B = e91.matchKeysBatch(key_A, key_B, bases_A, bases_B)
+        else:
+            key_A, key_B, discard_A, discard_B = e91.matchKeys(key_A, key_B, bases_A, bases_B)
+    report.stages['sifted'] = len(key_A)
+
+    if show:
+        print("Alice's %d discarded bits:\n%s" % (len(discard_A), util.bitFormat(discard_A)))
+        print("Bob's %d discarded bits:\n%s" % (len(discard_B), util.bitFormat(discard_B)))
+
+        print("Alice's %d-bit sifted key:\n%s" % (len(key_A), util.bitFormat(key_A)))
+        print("Bob's %d-bit sifted key:\n%s" % (len(key_B), util.bitFormat(key_B)))
+
+    # The discarded pairs were measured along different axes, so Alice and Bob announce
+    # them to test Bell's inequality. Without a violation the pairs were not entangled
+    # when measured, and the whole sifted key is suspect.
+    with instrument.stage('chsh', len(discard_A)):
+        mismatch = np.asarray(bases_A) != np.asarray(bases_B)
+        bell = e91.CHSHAccumulator().update(np.asarray(bases_A)[mismatch], np.asarray(bases_B)[mismatch],
+                                            discard_A, discard_B)
+    report.chsh = bell.value()
+    report.setKeys(key_A, key_B)
+    report.stages['kept'] = len(key_A)
+
+    if show:
+        print("\nCHSH parameter of the %d discarded pairs: |S| = %f" % (len(discard_A), report.chsh))
+
+    if not bell.conclusive():
+        report.bellInconclusive = True
+        if show:
+            print("Too few discarded pairs for a conclusive Bell test.")
+    elif not bell.violated(z=e91.BELL_Z):
+        report.abort(ABORT_BELL)
+        if show:
+            print("\nAlice and Bob detect Eve's interference and abort the protocol.\n")
+        return report if quiet else report.key
+
+    # Nothing is announced, so post-processing uses both sides' expected flip rates
+    expected = 2 * errorRate * (1 - errorRate)
+    if reconcile:
+        _reconcile(report, key_A, key_B, expected, show)
+    if amplify:
+        _amplify(report, expected, show)
+
+    return report if quiet else report.key
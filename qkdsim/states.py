@@ -0,0 +1,73 @@
+import numpy as np
+
+# Every qubit state Alice sends is one of four, identified by a uint8 code holding the
+# encoded value in bit 0 and the encoding basis in bit 1:
+#     code | value | basis | state
+#      0   |   0   |   0   | +1 |0>
+#      1   |   1   |   0   | +1 |1>
+#      2   |   0   |   1   | +0.7071 |0> +0.7071 |1>
+#      3   |   1   |   1   | +0.7071 |0> -0.7071 |1>
+# B92 only sends codes 0 and 2. Codes 4 and 5 are the states an eavesdropper resends in
+# the Breidbart attack, halfway between the two bases:
+#      4   |   0   |   -   | cos(pi/8) |0> + sin(pi/8) |1>
+#      5   |   1   |   -   | cos(5pi/8) |0> + sin(5pi/8) |1>
+ZERO, ONE, PLUS, MINUS, BREIDBART_0, BREIDBART_1 = range(6)
+
+# Bit flip: Pauli X in the computational basis, Pauli Z in the Hadamard basis, and a swap
+# of the two Breidbart states
+FLIP = np.array([ONE, ZERO, MINUS, PLUS, BREIDBART_1, BREIDBART_0], dtype=np.uint8)
+
+# Hadamard operator; the Breidbart states are its eigenstates
+HADAMARD = np.array([PLUS, MINUS, ZERO, ONE, BREIDBART_0, BREIDBART_1], dtype=np.uint8)
+
+# Polarization angle t of each state cos(t) |0> + sin(t) |1>
+ANGLES = np.array([0, np.pi/2, np.pi/4, -np.pi/4, np.pi/8, 5*np.pi/8])
+
+# State vector of each code
+VECTORS = np.stack([np.cos(ANGLES), np.sin(ANGLES)], axis=1)
+
+# PROB_ONE[code, basis] = probability of measuring 1 after changing to the given basis
+PROB_ONE = np.round(np.stack([np.sin(ANGLES) ** 2, (1 - np.sin(2 * ANGLES)) / 2], axis=1), 15)
+
+_table = None
+
+def encode(value, basis):
+    """Return the code of the state encoding value in the given basis."""
+    return (1 if value else 0) | (2 if basis else 0)
+
+def toState(code):
+    """Return the qit.state for the given code. The states are built on first use and
+    shared afterwards, so callers must not modify them in place.
+    """
+    global _table
+    if _table is None:
+        import qit
+        zero = qit.state('0')
+        one = zero.u_propagate(qit.sx)
+        _table = (zero, one, zero.u_propagate(qit.H), one.u_propagate(qit.H),
+                  qit.state(VECTORS[BREIDBART_0]), qit.state(VECTORS[BREIDBART_1]))
+    return _table[code]
+
+def toCode(state):
+    """Return the code of the given qit.state, or None if it is not one of the states in
+    the table.
+    """
+    if isinstance(state, (int, np.integer)):
+        return int(state)
+    vector = np.asarray(state.data).ravel()
+    if len(vector) != 2:
+        return None
+    overlap = np.abs(VECTORS.dot(vector))
+    code = int(np.argmax(overlap))
+    return code if abs(overlap[code] - 1) < 1e-9 else None
+
+def measure(code, basis, rng):
+    """Return the result of measuring the state with the given code in the given basis,
+    drawing from rng only when the result is not certain.
+    """
+    p = PROB_ONE[code, 1 if basis else 0]
+    if p == 0.5:
+        return bool(rng.randomBits(1)[0])
+    if p == 0.0 or p == 1.0:
+        return p == 1.0
+    return rng.random() < p
@@ -0,0 +1,174 @@
+import numpy as np
+import qkdsim.bb84 as bb84
+import qkdsim.b92 as b92
+import qkdsim.e91 as e91
+import qkdsim.qkdutils as util
+
+# Default number of raw qubits pushed through the pipeline at a time
+BLOCK_SIZE = 1 << 20
+
+# Standard errors by which the CHSH parameter must fall below the classical bound before
+# an E91 stream stops early
+EARLY_STOP_Z = 3.0
+
+class StreamStats(object):
+    """Counters accumulated while a key stream is consumed. Once the stream is exhausted,
+    detected() gives the same verdict as util.detectEavesdrop on the whole key, or, if the
+    disclosed bits were a random sample, on the sample with the finite-size threshold.
+    """
+
+    def __init__(self):
+        self.rawBits = 0
+        self.siftedBits = 0
+        self.announcedBits = 0
+        self.announcedMismatches = 0
+        self.keptBits = 0
+        self.keptMismatches = 0
+        self.lengthMismatch = False
+        self.sampled = False
+        self.chsh = None
+
+    def errorRate(self):
+        """Return the fraction of mismatched bits in the kept key."""
+        if not self.keptBits:
+            return 0.0
+        return float(self.keptMismatches) / self.keptBits
+
+    def detected(self, errorRate):
+        """Return True if Alice and Bob detect Eve's interference, False otherwise."""
+        if self.keptBits == 0 or self.lengthMismatch:
+            return True
+        if self.chsh is not None and self.chsh.conclusive() and not self.chsh.violated(z=e91.BELL_Z):
+            return True
+        if self.sampled:
+            if not self.announcedBits:
+                return True
+            rate = float(self.announcedMismatches) / self.announcedBits
+            return rate > util.finiteSizeThreshold(self.announcedBits, errorRate, util.DETECT_EPSILON)
+        return abs(self.errorRate() - errorRate) > errorRate * 1.2
+
+def streamBB84(n, eve=False, errorRate=0.0, blockSize=BLOCK_SIZE, stats=None):
+    """Run the BB84 protocol of simulations.runBB84 on 5*n raw qubits as a pipeline of
+    generators, pushing blockSize qubits at a time through encode, eavesdrop, noise, measure,
+    sift and disclose. Yields the tuple (key_A, key_B) of bool arrays for each block of kept
+    key, so memory stays bounded by the block size however long the key is. Pass a
+    StreamStats as stats to check for eavesdropping once the stream is exhausted.
+    """
+    if stats is None: stats = StreamStats()
+    blocks = _rawBlocks(5 * n, blockSize, stats)
+    blocks = (_encodeBB84(rawKey) for rawKey in blocks)
+    if eve:
+        blocks = (_eavesdropBB84(block) for block in blocks)
+    blocks = (_noiseBB84(block, errorRate) for block in blocks)
+    blocks = (_measureBB84(block) for block in blocks)
+    blocks = (bb84.matchKeysBatch(rawKey, key_B, bases_A, bases_B) for rawKey, bases_A, bases_B, key_B in blocks)
+    return disclose(blocks, stats)
+
+def streamB92(n, eve=False, errorRate=0.0, blockSize=BLOCK_SIZE, stats=None):
+    """Run the B92 protocol of simulations.runB92 on 8*n raw qubits as a pipeline of
+    generators, see streamBB84. The stream stops early if Eve's filters absorb photons,
+    since Alice and Bob's key lengths then differ and they abort.
+    """
+    if stats is None: stats = StreamStats()
+    blocks = _rawBlocks(8 * n, blockSize, stats)
+    blocks = ((rawKey, b92.encodeKeyBatch(rawKey)) for rawKey in blocks)
+    if eve:
+        blocks = ((rawKey, b92.simulateEavesdropBatch(sent, util.getRandomBitArray(len(sent)))) for rawKey, sent in blocks)
+    blocks = ((rawKey, b92.simulateNoiseBatch(sent, errorRate)) for rawKey, sent in blocks)
+    blocks = ((rawKey, b92.decodeStateBatch(sent, util.getRandomBitArray(len(sent)))) for rawKey, sent in blocks)
+    blocks = (b92.matchKeysBatch(rawKey, key_B) for rawKey, key_B in blocks)
+    return disclose(blocks, stats)
+
+def streamE91(n, errorRate=0.0, blockSize=BLOCK_SIZE, stats=None, eve=False):
+    """Run the E91 protocol of simulations.runE91 on 5*n entangled pairs as a pipeline of
+    generators, see streamBB84. As in runE91, no bits are disclosed and the whole sifted key
+    is yielded. The pairs measured along different axes feed a CHSH test in stats.chsh, and
+    the stream stops early once the Bell violation is clearly lost.
+    """
+    if stats is None: stats = StreamStats()
+    stats.chsh = e91.CHSHAccumulator()
+    channel = e91.interceptChannel() if eve else None
+    blocks = (e91.chooseAxesBatch(numBits) for numBits in _blockSizes(5 * n, blockSize, stats))
+    blocks = (e91.measureEntangledStateBatch(bases_A, bases_B, errorRate, channel) + (bases_A, bases_B) for bases_A, bases_B in blocks)
+    blocks = _bellTest(blocks, stats.chsh)
+    blocks = (e91.matchKeysBatch(*block)[:2] for block in blocks)
+    return disclose(blocks, stats, announce=False)
+
+def _blockSizes(numBits, blockSize, stats):
+    for start in range(0, numBits, blockSize):
+        size = min(blockSize, numBits - start)
+        stats.rawBits += size
+        yield size
+
+def _rawBlocks(numBits, blockSize, stats):
+    for size in _blockSizes(numBits, blockSize, stats):
+        yield util.getRandomBitArray(size)
+
+def _encodeBB84(rawKey):
+    bases_A = util.getRandomBitArray(len(rawKey))
+    return (rawKey, bases_A, bb84.encodeKeyBatch(rawKey, bases_A))
+
+def _eavesdropBB84(block):
+    rawKey, bases_A, sent = block
+    return (rawKey, bases_A, bb84.simulateEavesdropBatch(sent, util.getRandomBitArray(len(sent))))
+
+def _noiseBB84(block, errorRate):
+    rawKey, bases_A, sent = block
+    return (rawKey, bases_A, bb84.simulateNoiseBatch(sent, errorRate))
+
+def _measureBB84(block):
+    rawKey, bases_A, sent = block
+    bases_B = util.getRandomBitArray(len(sent))
+    return (rawKey, bases_A, bases_B, bb84.decodeStateBatch(sent, bases_B))
+
+def _bellTest(blocks, chsh):
+    """Add the pairs of each block measured along different axes to the CHSH accumulator,
+    stopping before any key from a block that leaves |S| clearly below the bound.
+    """
+    for block in blocks:
+        key_A, key_B, bases_A, bases_B = block
+        mismatch = bases_A != bases_B
+        chsh.update(bases_A[mismatch], bases_B[mismatch], key_A[mismatch], key_B[mismatch])
+        if chsh.conclusive() and not chsh.violated(z=EARLY_STOP_Z):
+            return
+        yield block
+
+def disclose(blocks, stats, announce=True, fraction=None):
+    """Announce every other sifted bit of a stream of (key_A, key_B) blocks, counting
+    positions across block boundaries as util.discloseHalf does for the whole key, and
+    yield the kept bits of each block. With a fraction, a random sample of that fraction
+    of each block is announced instead, as util.discloseSample does. With announce=False
+    every sifted bit is kept. The counts are added to the StreamStats stats.
+    """
+    stats.sampled = fraction is not None
+    for key_A, key_B in blocks:
+        if len(key_A) != len(key_B):
+            stats.lengthMismatch = True
+            return
+
+        stats.siftedBits += len(key_A)
+        mismatch = np.asarray(key_A, dtype=bool) != np.asarray(key_B, dtype=bool)
+        if not announce:
+            stats.keptBits += len(mismatch)
+            stats.keptMismatches += int(np.count_nonzero(mismatch))
+            yield (key_A, key_B)
+            continue
+
+        if fraction is not None:
+            announce_A, keep_A, announce_B, keep_B = util.discloseSample(key_A, key_B, fraction)
+            stats.announcedBits += len(announce_A)
+            stats.announcedMismatches += util.countMismatches(announce_A, announce_B)
+            stats.keptBits += len(keep_A)
+            stats.keptMismatches += util.countMismatches(keep_A, keep_B)
+            yield (keep_A, keep_B)
+            continue
+
+        # Sifted bits with an even index in the whole key are announced
+        first = (stats.siftedBits - len(key_A)) % 2
+
+        stats.announcedBits += len(mismatch[first::2])
+        stats.announcedMismatches += int(np.count_nonzero(mismatch[first::2]))
+        stats.keptBits += len(mismatch[1 - first::2])
+        stats.keptMismatches += int(np.count_nonzero(mismatch[1 - first::2]))
+
+        yield (key_A[1 - first::2], key_B[1 - first::2])
@@ -0,0 +1,166 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import qkdsim
+import qkdsim.analytic as analytic
+import qkdsim.trials as trials
+
+METHODS = ('simulate', 'analytic', 'hybrid')
+
+# Grid parameters a sweep passes on to the trials; any other would only change the cache key
+PARAMETERS = ('protocol', 'n', 'eve', 'errorRate')
+
+_codeHash = None
+
+def codeVersion():
+    """Return a hash of the qkdsim source files and __version__, so that any change to
+    the simulation code gives new cache keys. Computed once per process.
+    """
+    global _codeHash
+    if _codeHash is None:
+        digest = hashlib.sha256(qkdsim.__version__.encode('utf-8'))
+        package = os.path.dirname(os.path.abspath(qkdsim.__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py'):
+                with open(os.path.join(package, name), 'rb') as f:
+                    digest.update(name.encode('utf-8') + b'\0' + f.read())
+        _codeHash = digest.hexdigest()
+    return _codeHash
+
+class SweepCache(object):
+    """On-disk store of sweep results, one JSON file per grid point. Entries are written
+    atomically, so an interrupted sweep never leaves a partial entry behind. If maxBytes is
+    given, the least recently used entries are evicted once the cache grows past it,
+    together with any temporary files a killed process left behind.
+    """
+
+    def __init__(self, directory, maxBytes=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, params, seed):
+        """Return the cache key for a grid point, which also covers the seed and the
+        version of the simulation code.
+        """
+        blob = json.dumps({'params': params, 'seed': seed, 'version': codeVersion()}, sort_keys=True)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        """Return the stored value for key, or None if there is none."""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        os.utime(path, None)    # Mark as recently used
+        return value
+
+    def put(self, key, value):
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(temp, self.path(key))
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+        if self.maxBytes is not None:
+            self.evict(self.maxBytes)
+
+    def evict(self, maxBytes):
+        """Delete the least recently used entries, and leftover temporary files, until the
+        cache holds at most maxBytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue    # Renamed or removed by another writer
+                entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= maxBytes: break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+def gridPoints(**axes):
+    """Return the list of parameter dicts in the cartesian product of the given axes, e.g.
+    gridPoints(protocol=['BB84', 'B92'], n=[256, 1024], eve=[False, True], errorRate=[0.0]).
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*[axes[k] for k in names])]
+
+def runSweep(points, numTrials, cacheDir, seed=0, workers=None, maxCacheBytes=None, callback=None,
+             method='simulate', checkTrials=10, coordinator=None):
+    """Run numTrials trials at each grid point with trials.runTrials and return a list with
+    one dict per point holding 'params', 'stats' (TrialStats.asDict) and 'cached'.
+    With method='analytic', stats holds the closed-form analytic.Estimate instead and no
+    trials are run. With method='hybrid', each estimate is first spot-checked against
+    checkTrials sampled runs, and the full trials only run where the two disagree. The
+    'method' entry of stats tells which was used.
+    Points already in the cache under cacheDir are loaded instead of recomputed, so an
+    interrupted or extended sweep only runs the missing points. Each point uses its own
+    seed derived from seed and its parameters. If given, callback is called with each
+    result dict as it becomes available. With a distributed.Coordinator, the trials of
+    each point are spread over its remote workers instead of local processes.
+    Points may only set the parameters in PARAMETERS; any other raises ValueError.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown method: %s" % method)
+    for params in points:
+        unknown = sorted(set(params) - set(PARAMETERS))
+        if unknown:
+            raise ValueError("Unsupported sweep parameters: %s" % ', '.join(unknown))
+    cache = SweepCache(cacheDir, maxCacheBytes)
+    results = []
+
+    for params in points:
+        entry = dict(params, numTrials=numTrials)
+        if method != 'simulate':
+            entry.update(method=method, checkTrials=checkTrials)
+        key = cache.key(entry, seed)
+        stats = cache.get(key)
+        cached = stats is not None
+
+        if not cached:
+            args = (params['protocol'], params['n'], params.get('eve', False), params.get('errorRate', 0.0))
+            pointSeed = int(key[:16], 16)
+            stats = None
+            if method == 'analytic':
+                stats = analytic.estimate(*args).asDict()
+            elif method == 'hybrid':
+                estimate, _, agrees = analytic.validate(*args, numTrials=checkTrials, seed=pointSeed)
+                if agrees:
+                    stats = estimate.asDict()
+            if stats is None:
+                if coordinator is not None:
+                    stats = coordinator.runTrials(args[0], numTrials, *args[1:], seed=pointSeed).asDict()
+                else:
+                    stats = trials.runTrials(args[0], numTrials, *args[1:], workers=workers, seed=pointSeed).asDict()
+                stats['method'] = 'simulate'
+            cache.put(key, stats)
+
+        result = {'params': params, 'stats': stats, 'cached': cached}
+        results.append(result)
+        if callback: callback(result)
+
+    return results
@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import sqrt
+from statistics import NormalDist
+import os
+import numpy as np
+import qkdsim.rng as rng
+import qkdsim.simulations as simulations
+
+PROTOCOLS = ('BB84', 'B92', 'E91')
+
+# Default bin edges for the histogram of error rates observed in Alice and Bob's final keys
+ERROR_BINS = np.linspace(0.0, 0.5, 51)
+
+class TrialStats(object):
+    """Running statistics over a set of protocol trials. Means and variances are updated
+    online, and two TrialStats can be merged, so partial results from separate workers
+    combine without keeping per-trial data.
+    """
+
+    def __init__(self, bins=ERROR_BINS):
+        self.bins = np.asarray(bins, dtype=float)
+        self.histogram = np.zeros(len(self.bins) - 1, dtype=np.int64)
+        self.trials = 0
+        self.detections = 0
+        self.siftedMean = 0.0
+        self.siftedM2 = 0.0
+        self.errorMean = 0.0
+        self.errorM2 = 0.0
+        self.errorTrials = 0
+
+    def add(self, detected, siftedLength, errorRate):
+        """Record the outcome of one trial. errorRate is None if no key bits were left."""
+        self.trials += 1
+        if detected: self.detections += 1
+
+        # Welford's update
+        delta = siftedLength - self.siftedMean
+        self.siftedMean += delta / self.trials
+        self.siftedM2 += delta * (siftedLength - self.siftedMean)
+
+        if errorRate is not None:
+            self.errorTrials += 1
+            delta = errorRate - self.errorMean
+            self.errorMean += delta / self.errorTrials
+            self.errorM2 += delta * (errorRate - self.errorMean)
+            k = np.searchsorted(self.bins, errorRate, side='right') - 1
+            self.histogram[min(max(k, 0), len(self.histogram) - 1)] += 1
+
+    def toState(self):
+        """Return the statistics as a dict of plain numbers and lists, e.g. for JSON."""
+        return {
+            'bins': self.bins.tolist(),
+            'histogram': self.histogram.tolist(),
+            'trials': self.trials,
+            'detections': self.detections,
+            'siftedMean': self.siftedMean,
+            'siftedM2': self.siftedM2,
+            'errorMean': self.errorMean,
+            'errorM2': self.errorM2,
+            'errorTrials': self.errorTrials,
+        }
+
+    @classmethod
+    def fromState(cls, state):
+        """Return the TrialStats held in a dict from toState()."""
+        stats = cls(state['bins'])
+        if len(state['histogram']) != len(stats.histogram):
+            raise ValueError("Histogram does not match its bins")
+        stats.histogram[:] = state['histogram']
+        stats.trials = int(state['trials'])
+        stats.detections = int(state['detections'])
+        stats.siftedMean = float(state['siftedMean'])
+        stats.siftedM2 = float(state['siftedM2'])
+        stats.errorMean = float(state['errorMean'])
+        stats.errorM2 = float(state['errorM2'])
+        stats.errorTrials = int(state['errorTrials'])
+        return stats
+
+    def merge(self, other):
+        """Fold the statistics of other into this object and return it."""
+        if not np.array_equal(self.bins, other.bins):
+            raise ValueError("Cannot merge statistics with different histogram bins")
+
+        self.siftedMean, self.siftedM2 = _combine(self.trials, self.siftedMean, self.siftedM2,
+                                                  other.trials, other.siftedMean, other.siftedM2)
+        self.errorMean, self.errorM2 = _combine(self.errorTrials, self.errorMean, self.errorM2,
+                                                other.errorTrials, other.errorMean, other.errorM2)
+        self.trials += other.trials
+        self.errorTrials += other.errorTrials
+        self.detections += other.detections
+        self.histogram += other.histogram
+        return self
+
+    def detectionRate(self):
+        return float(self.detections) / self.trials if self.trials else 0.0
+
+    def detectionInterval(self, confidence=0.95):
+        """Return the Wilson score interval for the detection probability."""
+        if not self.trials:
+            return (0.0, 1.0)
+        z = zScore(confidence)
+        n = self.trials
+        p = self.detectionRate()
+        centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return (max(0.0, centre - half), min(1.0, centre + half))
+
+    def siftedInterval(self, confidence=0.95):
+        """Return a normal confidence interval for the mean sifted key length."""
+        return _meanInterval(self.trials, self.siftedMean, self.siftedM2, confidence)
+
+    def errorInterval(self, confidence=0.95):
+        """Return a normal confidence interval for the mean error rate."""
+        return _meanInterval(self.errorTrials, self.errorMean, self.errorM2, confidence)
+
+    def asDict(self, confidence=0.95):
+        """Return the statistics as a JSON-serializable dict."""
+        return {
+            'trials': self.trials,
+            'detections': self.detections,
+            'detectionRate': self.detectionRate(),
+            'detectionInterval': list(self.detectionInterval(confidence)),
+            'siftedMean': self.siftedMean,
+            'siftedInterval': list(self.siftedInterval(confidence)),
+            'errorMean': self.errorMean,
+            'errorInterval': list(self.errorInterval(confidence)),
+            'errorBins': self.bins.tolist(),
+            'errorHistogram': self.histogram.tolist(),
+        }
+
+def runTrial(protocol, n, eve=False, errorRate=0.0, seed=None, index=0):
+    """Run a single trial of the given protocol using the batch engine and return the tuple
+    (detected, siftedLength, actualErrorRate). With a seed, the trial draws from stream
+    index of that seed, so any trial of runTrials can be replayed exactly.
+    """
+    source = rng.getRNG() if seed is None else rng.FastRNG(seed, index)
+    with rng.using(source):
+        if protocol == 'BB84':
+            report = simulations.runBB84(n, eve, errorRate, engine='numpy', quiet=True)
+        elif protocol == 'B92':
+            report = simulations.runB92(n, eve, errorRate, engine='numpy', quiet=True)
+        elif protocol == 'E91':
+            report = simulations.runE91(n, errorRate, engine='numpy', quiet=True, eve=eve)
+        else:
+            raise ValueError("Unknown protocol: %s" % protocol)
+
+    return (report.aborted, report.stages['sifted'], report.qber)
+
+def runTrials(protocol, numTrials, n, eve=False, errorRate=0.0, workers=None, seed=None,
+              chunkSize=None, bins=ERROR_BINS, callback=None):
+    """Run numTrials independent trials of the given protocol ('BB84', 'B92' or 'E91') over a
+    pool of worker processes and return the aggregated TrialStats. Trial k draws from
+    stream k of seed, so results do not depend on how trials are spread over workers.
+    If given, callback is called with the running TrialStats as each chunk completes.
+    """
+    if protocol not in PROTOCOLS:
+        raise ValueError("Unknown protocol: %s" % protocol)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunkSize is None:
+        chunkSize = max(1, -(-numTrials // (4 * workers)))
+
+    stats = TrialStats(bins)
+    stats.seed = seed
+    chunks = [(start, min(start + chunkSize, numTrials)) for start in range(0, numTrials, chunkSize)]
+
+    if workers == 1:
+        for start, stop in chunks:
+            stats.merge(runChunk(protocol, n, eve, errorRate, seed, start, stop, bins))
+            if callback: callback(stats)
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runChunk, protocol, n, eve, errorRate, seed, start, stop, bins)
+                   for start, stop in chunks]
+        for future in as_completed(futures):
+            stats.merge(future.result())
+            if callback: callback(stats)
+
+    return stats
+
+def runChunk(protocol, n, eve, errorRate, seed, start, stop, bins=ERROR_BINS):
+    """Run trials start..stop-1 and return their TrialStats."""
+    stats = TrialStats(bins)
+    for index in range(start, stop):
+        stats.add(*runTrial(protocol, n, eve, errorRate, seed, index))
+    return stats
+
+def _combine(n1, mean1, m21, n2, mean2, m22):
+    """Combine the running mean and sum of squared deviations of two samples."""
+    n = n1 + n2
+    if n == 0:
+        return (0.0, 0.0)
+    delta = mean2 - mean1
+    return (mean1 + delta * n2 / n, m21 + m22 + delta * delta * n1 * n2 / n)
+
+def _meanInterval(n, mean, m2, confidence):
+    if n < 2:
+        return (mean, mean)
+    half = zScore(confidence) * sqrt(m2 / (n - 1) / n)
+    return (mean - half, mean + half)
+
+def zScore(confidence):
+    """Return the two-sided normal quantile for the given confidence level."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
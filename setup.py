@@ -8,8 +8,12 @@ setup(name='qkdsim',
       url='https://github.com/cotaylor/qkdsim',
       packages=find_packages(),
       install_requires=[
-          'qit',
-          'pycrypto'
-          ]
+          'numpy>=1.17'
+          ],
+      extras_require={
+          'qit': ['qit'],
+          'crypto': ['pycrypto'],
+          'jit': ['numba']
+          }
       )
       
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+import qkdsim.rng as rng
+
+@pytest.fixture
+def seeded():
+    """Return rng.seed, and restore the random source and NumPy's global generator once
+    the test finishes, whether or not it passed.
+    """
+    previous = rng.getRNG()
+    state = np.random.get_state()
+    try:
+        yield rng.seed
+    finally:
+        rng.setRNG(previous)
+        np.random.set_state(state)
@@ -0,0 +1,26 @@
+import numpy as np
+import qkdsim.amplification as amplification
+import qkdsim.qkdutils as util
+import qkdsim.simulations as simulations
+
+def test_toeplitzHash():
+    # Compare against the dense matrix product
+    for (n, m) in [(1, 1), (10, 4), (37, 20), (256, 255)]:
+        key = util.getRandomBitArray(n)
+        seed = util.getRandomBitArray(n + m - 1)
+        T = np.array([[seed[i - j + n - 1] for j in range(n)] for i in range(m)], dtype=int)
+        expected = (T.dot(key.astype(int)) % 2) == 1
+        assert(np.array_equal(amplification.toeplitzHash(key, m, seed), expected))
+
+
+def test_secureLength():
+    assert(amplification.secureLength(10000, 0.0, 0, epsilon=0.5) == 9998)
+    assert(amplification.secureLength(10000, 0.11, 5000) == 0)
+    assert(amplification.secureLength(10000, 0.05, 3000) < amplification.secureLength(10000, 0.05, 2000))
+
+
+def test_amplifyRuns():
+    report = simulations.runBB84(8192, False, 0.03, engine='numpy', quiet=True, reconcile=True, amplify=True)
+    assert(not report.aborted)
+    assert(0 < report.stages['amplified'] < report.stages['reconciled'])
+    assert(report.mismatches == 0)
@@ -0,0 +1,61 @@
+from math import comb
+import qkdsim.analytic as analytic
+import qkdsim.attacks as attacks
+import qkdsim.channels as channels
+import qkdsim.simulations as simulations
+import qkdsim.sweep as sweep
+
+def test_binomialTail():
+    for k, p, t in [(40, 0.3, 5), (40, 0.3, 20), (1000, 0.01, 15), (10, 0.5, -1), (10, 0.5, 10)]:
+        exact = sum(comb(k, m) * p**m * (1 - p)**(k - m) for m in range(t + 1, k + 1))
+        assert(abs(analytic.binomialTail(k, p, t) - exact) < 1e-12)
+
+
+def test_estimates():
+    est = analytic.estimate('BB84', 1000, eve=True)
+    assert(est.rawBits == 5000 and est.siftedMean == 2500)
+    assert(abs(est.qber - 0.25) < 1e-12 and est.detectionRate == 1.0)
+
+    est = analytic.estimate('BB84', 1000, errorRate=0.05, attack=attacks.InterceptResend(0.5))
+    assert(abs(est.qber - (0.125 * 0.95 + 0.875 * 0.05)) < 1e-12)
+
+    # Noise on both sides scales |S| = 2*sqrt(2) by 0.64, below the classical bound, but
+    # only enough pairs show it with the margin of e91.BELL_Z standard errors
+    est = analytic.estimate('E91', 10000, errorRate=0.1)
+    assert(abs(est.qber - 0.18) < 1e-12 and est.detectionRate > 0.99)
+    assert(analytic.estimate('E91', 1000).detectionRate < 1e-6)
+    assert(analytic.estimate('E91', 20, eve=True).detectionRate == 0.0)
+
+    est = analytic.estimate('B92', 1000, channel=channels.depolarizing(0.1))
+    assert(abs(est.qber - 0.05 / 0.55) < 1e-12)
+
+
+def test_againstSimulation(seeded):
+    seeded(17)
+    numBits = 8000
+    for protocol, kwargs in [('BB84', {'attack': 'breidbart'}),
+                             ('BB84', {'attack': attacks.PhotonNumberSplitting(0.5), 'channel': channels.loss(10)}),
+                             ('B92', {'attack': 'intercept', 'channel': channels.amplitudeDamping(0.2)}),
+                             ('E91', {'errorRate': 0.02, 'channel': channels.dephasing(0.1)})]:
+        est = analytic.estimate(protocol, numBits, **kwargs)
+        run = getattr(simulations, 'run' + protocol)
+        report = run(numBits, engine='numpy', quiet=True, **kwargs)
+        assert(abs(report.stages['sifted'] - est.siftedMean) < 5 * est.siftedMean ** 0.5)
+        assert(abs(report.qber - est.qber) < 0.02)
+
+    # Eve's filters and the channel both stop photons
+    est = analytic.estimate('B92', numBits, eve=True, channel=channels.loss(10))
+    report = simulations.runB92(numBits, True, engine='numpy', quiet=True, channel=channels.loss(10))
+    assert(abs(report.stages['sifted'] - est.siftedMean) < 5 * est.siftedMean ** 0.5)
+
+
+def test_hybridSweep(tmpdir):
+    est, stats, agrees = analytic.validate('BB84', 64, False, 0.02, numTrials=10, seed=3)
+    assert(agrees and stats.trials == 10)
+
+    points = sweep.gridPoints(protocol=['BB84', 'E91'], n=[64], eve=[False], errorRate=[0.0, 0.05])
+    results = sweep.runSweep(points, 50, str(tmpdir), workers=1, method='hybrid')
+    assert(all(r['stats']['method'] == 'analytic' for r in results))
+
+    results = sweep.runSweep(points, 50, str(tmpdir), workers=1, method='analytic')
+    assert(results[0]['stats']['errorMean'] == 0.0 and not results[0]['cached'])
@@ -0,0 +1,45 @@
+import pytest
+import qkdsim.attacks as attacks
+import qkdsim.simulations as simulations
+from qkdsim.amplification import binaryEntropy
+
+def test_bb84Attacks(seeded):
+    seeded(16)
+    numBits = 20000
+
+    # Intercepting a fraction f of the qubits causes errors on f/4 of the sifted bits and
+    # tells Eve half of the ones she intercepted
+    for fraction in [1.0, 0.4]:
+        report = simulations.runBB84(numBits, engine='numpy', quiet=True,
+                                     attack=attacks.InterceptResend(fraction))
+        assert(report.eve and report.aborted)
+        assert(abs(report.estimate - fraction/4) < 0.015)
+        assert(abs(report.eveInfo - fraction/2) < 0.02)
+
+    # The Breidbart attack causes as many errors but guesses every bit with probability 0.85
+    report = simulations.runBB84(numBits, engine='numpy', quiet=True, attack='breidbart')
+    assert(abs(report.estimate - 0.25) < 0.015)
+    assert(abs(report.eveInfo - (1 - binaryEntropy(0.1464))) < 0.02)
+
+    # Photon number splitting causes no errors, only losses
+    report = simulations.runBB84(numBits, engine='numpy', packed=True, quiet=True,
+                                 attack=attacks.PhotonNumberSplitting(0.5))
+    assert(not report.aborted and report.estimate == 0.0)
+    assert(report.eveInfo == 1.0)
+    assert(report.stages['detected'] < report.stages['raw'] / 5)
+
+
+def test_b92Attacks(seeded):
+    seeded(16)
+    report = simulations.runB92(8000, engine='numpy', quiet=True, attack='intercept')
+    assert(report.estimate == 0.0 and report.eveInfo == 1.0)
+
+    report = simulations.runB92(8000, engine='numpy', quiet=True, attack='pns')
+    assert(report.eveInfo < 0.5)
+
+    with pytest.raises(ValueError):
+        simulations.runB92(100, engine='numpy', quiet=True, attack='breidbart')
+    with pytest.raises(ValueError):
+        simulations.runBB84(100, engine='qit', quiet=True, attack='intercept')
+    with pytest.raises(ValueError):
+        attacks.getAttack('clone')
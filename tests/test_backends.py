@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+import pytest
+import qkdsim.backends as backends
+
+def test_registry():
+    assert('numpy' in backends.available() and 'analytic' in backends.available())
+    report = backends.run('BB84', 64, errorRate=0.02)
+    assert(report.protocol == 'BB84' and report.stages['raw'] == 320)
+    est = backends.run('E91', 64, backend='analytic', quiet=True, engine='numpy')
+    assert(est.rawBits == 320)
+
+    with pytest.raises(ValueError):
+        backends.getBackend('gpu')
+    with pytest.raises(ValueError):
+        backends.run('BB85', 64)
+
+
+def test_lazyImports():
+    # A worker using the numpy backend never imports qit, and falls back to the operating
+    # system's CSPRNG where Crypto is missing
+    script = "import sys; sys.modules['Crypto'] = None\n"\
+             "import qkdsim.backends as backends\n"\
+             "report = backends.run('B92', 64)\n"\
+             "assert(report.stages['raw'] == 512)\n"\
+             "assert('qit' not in sys.modules)\n"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.check_call([sys.executable, '-c', script], cwd=root)
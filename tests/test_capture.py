@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import qkdsim.bb84 as bb84
+import qkdsim.capture as capture
+import qkdsim.qkdutils as util
+import qkdsim.streaming as streaming
+
+def test_captureReplay(tmpdir, seeded):
+    seeded(20)
+    directory = str(tmpdir.join('noisy'))
+    cap = capture.capture(directory, 4000, errorRate=0.05, blockSize=3001)
+    assert(len(cap) == 20000 and cap.bases_E is None)
+    assert(os.path.getsize(os.path.join(directory, 'rawKey.npy')) < 20000 // 8 + 200)
+
+    # Replaying block by block matches sifting and disclosing the whole capture at once
+    key_A, key_B = bb84.matchKeysBatch(np.asarray(cap.rawKey), np.asarray(cap.key_B),
+                                       np.asarray(cap.bases_A), np.asarray(cap.bases_B))
+    announce_A, keep_A, announce_B, keep_B = util.discloseHalf(key_A, key_B)
+    stats = streaming.StreamStats()
+    kept = list(capture.replay(directory, blockSize=4096, stats=stats))
+    assert(np.array_equal(np.concatenate([k for k, b in kept]), keep_A))
+    assert(stats.announcedMismatches == util.countMismatches(announce_A, announce_B))
+    assert(stats.detected(0.05) == util.detectEavesdrop(keep_A, keep_B, 0.05))
+
+    stats, detected = capture.analyze(cap)
+    assert(not detected and abs(stats.errorRate() - 0.05) < 0.02)
+    assert(capture.analyze(cap, errorRate=0.0)[1])
+
+    # The same capture replayed with random samples of different sizes
+    for fraction in (0.1, 0.5):
+        stats, detected = capture.analyze(cap, discloseFraction=fraction)
+        assert(abs(stats.announcedBits - fraction * stats.siftedBits) < 20 and not detected)
+        assert(stats.announcedBits + stats.keptBits == stats.siftedBits)
+
+    cap = capture.capture(str(tmpdir.join('eve')), 4000, eve=True)
+    assert(cap.bases_E is not None and capture.analyze(cap)[1])
+    assert(capture.analyze(cap, discloseFraction=0.1)[1])
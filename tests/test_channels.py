@@ -0,0 +1,51 @@
+import numpy as np
+import qkdsim.channels as channels
+import qkdsim.simulations as simulations
+import qkdsim.states as states
+
+def test_kraus():
+    for channel in [channels.bitFlip(0.1), channels.dephasing(0.2), channels.depolarizing(0.3),
+                    channels.amplitudeDamping(0.4), channels.loss(25)]:
+        assert(channel.isTracePreserving())
+
+    # Without noise the table reduces to ideal measurement
+    assert(np.allclose(channels.identity().probOne(), states.PROB_ONE))
+
+    # Depolarizing gives errors p/2 in either basis, dephasing only in the Hadamard basis
+    p = channels.depolarizing(0.2).probOne()
+    assert(np.allclose([p[states.ZERO, 0], p[states.MINUS, 1]], [0.1, 0.9]))
+    p = channels.dephasing(0.2).probOne()
+    assert(np.allclose([p[states.ONE, 0], p[states.PLUS, 1]], [1.0, 0.2]))
+    p = channels.amplitudeDamping(0.3).probOne()
+    assert(np.allclose([p[states.ZERO, 0], p[states.ONE, 0]], [0.0, 0.7]))
+
+    # Composition multiplies Kraus operators and transmittances
+    composed = channels.compose(channels.bitFlip(0.1), channels.bitFlip(0.1), channels.loss(10))
+    assert(np.isclose(composed.probOne()[states.ZERO, 0], 2 * 0.1 * 0.9))
+    assert(np.isclose(composed.transmittance, 10 ** -0.2))
+    rho = channels.DENSITY[[0, 1, 2, 3, 3]]
+    assert(np.allclose(composed.apply(rho), channels.bitFlip(0.1).apply(channels.bitFlip(0.1).apply(rho))))
+
+
+def test_errorRate():
+    # Each Pauli error flips the bits of one basis, so half of the BB84 states
+    assert(abs(channels.depolarizing(0.1).errorRate() - 0.05) < 1e-12)
+    assert(abs(channels.dephasing(0.1).errorRate() - 0.05) < 1e-12)
+    assert(abs(channels.bitFlip(0.1).errorRate() - 0.05) < 1e-12)
+    assert(channels.loss(10).errorRate() < 1e-12)
+
+
+def test_runWithChannel(seeded):
+    seeded(15)
+    numBits = 4000
+    channel = channels.depolarizing(0.1) >> channels.loss(20)
+
+    report = simulations.runBB84(numBits, engine='numpy', quiet=True, channel=channel)
+    assert(abs(report.stages['detected'] / float(report.stages['raw']) - 10 ** -0.4) < 0.01)
+    assert(abs(report.qber - 0.05) < 0.015)
+
+    report = simulations.runE91(numBits, engine='numpy', quiet=True, channel=channels.depolarizing(0.1))
+    assert(abs(report.qber - 0.05) < 0.015)
+
+    report = simulations.runB92(numBits, engine='numpy', quiet=True, channel=channels.identity())
+    assert(report.qber == 0.0)
@@ -0,0 +1,71 @@
+from math import sqrt
+import numpy as np
+import qkdsim.e91 as e91
+import qkdsim.simulations as simulations
+import qkdsim.streaming as streaming
+from qkdsim.results import ABORT_BELL
+
+def test_accumulator(seeded):
+    seeded(18)
+    numBits = 90000
+    basesA, basesB = e91.chooseAxesBatch(numBits)
+    A, B = e91.measureEntangledStateBatch(basesA, basesB)
+
+    # Chunked updates and merged accumulators give the same counts as one update
+    whole = e91.CHSHAccumulator().update(basesA, basesB, A, B)
+    chunked = e91.CHSHAccumulator()
+    for start in range(0, numBits, 7000):
+        chunked.update(basesA[start:start + 7000], basesB[start:start + 7000], A[start:start + 7000], B[start:start + 7000])
+    assert(np.array_equal(whole.counts, chunked.counts))
+    half = e91.CHSHAccumulator().update(basesA[::2], basesB[::2], A[::2], B[::2])
+    half.merge(e91.CHSHAccumulator().update(basesA[1::2], basesB[1::2], A[1::2], B[1::2]))
+    assert(np.array_equal(whole.counts, half.counts))
+
+    assert(abs(whole.value() - 2 * sqrt(2)) < 4 * whole.standardError())
+    assert(whole.violated() and whole.pairs() > 4 * numBits / 9 - 1000)
+    assert(e91.CHSHAccumulator().standardError() == float('inf'))
+
+
+def test_runE91Eve(seeded):
+    seeded(18)
+    report = simulations.runE91(2048, engine='numpy', quiet=True)
+    assert(not report.aborted and report.chsh > 2.5)
+
+    # Eve's measurements leave |S| near sqrt(2)
+    for packed in [False, True]:
+        report = simulations.runE91(2048, engine='numpy', packed=packed, quiet=True, eve=True)
+        assert(report.aborted and report.abortReason == ABORT_BELL)
+        assert(abs(report.chsh - sqrt(2)) < 0.25)
+        assert(abs(report.qber - 5.0 / 24) < 0.03)
+
+
+def test_smallRuns(seeded):
+    seeded(18)
+    # Too few pairs per term to tell the singlet apart: the test is inconclusive
+    for n in [4, 10, 20]:
+        for j in range(100):
+            report = simulations.runE91(n, engine='numpy', quiet=True)
+            assert(not report.aborted)
+        assert(report.bellInconclusive)
+    report = simulations.runE91(20, engine='numpy', quiet=True, eve=True)
+    assert(not report.aborted and report.bellInconclusive)
+
+    bell = e91.CHSHAccumulator()
+    assert(not bell.conclusive())
+    report = simulations.runE91(200, engine='numpy', quiet=True)
+    assert(not report.bellInconclusive)
+
+
+def test_streamE91Eve(seeded):
+    seeded(18)
+    numBits = 20000
+
+    # The stream stops after the first block once the violation is clearly lost
+    stats = streaming.StreamStats()
+    assert(list(streaming.streamE91(numBits, blockSize=4096, stats=stats, eve=True)) == [])
+    assert(stats.rawBits == 4096 and stats.detected(0.0))
+
+    stats = streaming.StreamStats()
+    for key_A, key_B in streaming.streamE91(numBits, blockSize=4096, stats=stats):
+        pass
+    assert(stats.rawBits == 5 * numBits and not stats.detected(0.0))
@@ -0,0 +1,44 @@
+import numpy as np
+import qkdsim.channels as channels
+import qkdsim.decoy as decoy
+
+def test_poissonSampling(seeded):
+    seeded(21)
+    stats = decoy.simulate(1000000, chunkSize=300000)
+    sent = stats.sent.sum(axis=1)
+    assert(np.all(np.abs(sent / 1e6 - np.array(decoy.PROBABILITIES)) < 0.003))
+    for c, mu in enumerate(decoy.INTENSITIES):
+        k = np.arange(decoy.MAX_PHOTONS + 1)
+        assert(abs(stats.sent[c].dot(k) / float(sent[c]) - mu) < 0.01)
+    assert(np.all(stats.sent[decoy.VACUUM, 1:] == 0))
+
+
+def test_decoyBounds(seeded):
+    seeded(21)
+    stats = decoy.simulate(4000000, distance=25)
+    Q, E = decoy.expectedGains(25)
+    assert(np.all(np.abs(stats.gains()[:2] - Q[:2]) < 0.05 * Q[:2]))
+    assert(abs(stats.errorRates()[decoy.SIGNAL] - E[decoy.SIGNAL]) < 0.003)
+
+    # The decoy estimate bounds the true single-photon yield from below, and tightly
+    bounds = stats.bounds()
+    Y1 = stats.photonYields()[1]
+    assert(0.8 * Y1 < bounds['Y1'] < 1.02 * Y1)
+    assert(stats.keyRate() > 0 and stats.secretBits() > 0)
+    assert(stats.sifted[decoy.SIGNAL] < stats.detected[decoy.SIGNAL].sum())
+
+    merged = decoy.DecoyStats().merge(stats).merge(stats)
+    assert(merged.pulses() == 8000000 and np.allclose(merged.gains(), stats.gains()))
+
+    # The channel's noise, not only its loss, raises the error rate
+    noisy = channels.loss(25) >> channels.depolarizing(0.04)
+    rate = stats.keyRate()
+    stats = decoy.simulate(4000000, channel=noisy)
+    Q, E = decoy.expectedGains(channel=noisy)
+    assert(abs(stats.errorRates()[decoy.SIGNAL] - E[decoy.SIGNAL]) < 0.003)
+    assert(E[decoy.SIGNAL] > decoy.expectedGains(25)[1][decoy.SIGNAL] + 0.015)
+    assert(stats.keyRate() < rate)
+
+    # No key survives 250 km of fibre
+    stats = decoy.simulate(1000000, channel=channels.loss(250))
+    assert(stats.keyRate() == 0.0)
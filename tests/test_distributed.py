@@ -0,0 +1,115 @@
+from multiprocessing import Process
+from multiprocessing.connection import Client
+import socket
+import threading
+import time
+import pytest
+import qkdsim.distributed as distributed
+import qkdsim.sweep as sweep
+import qkdsim.trials as trials
+
+def _startWorkers(coordinator, count):
+    workers = [Process(target=distributed.runWorker, args=(coordinator.address, coordinator.authkey))
+               for k in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def _dropTask(address, authkey):
+    """A worker that dies after taking its first task."""
+    conn = Client(address, authkey=authkey)
+    conn.recv_bytes()
+    conn.close()
+
+
+def test_coordinator(tmpdir):
+    with distributed.Coordinator() as coordinator:
+        # The first worker to connect takes a chunk and dies without answering
+        dropper = Process(target=_dropTask, args=(coordinator.address, coordinator.authkey))
+        dropper.start()
+        workers = _startWorkers(coordinator, 2)
+
+        updates = []
+        stats = coordinator.runTrials('BB84', 40, 64, errorRate=0.02, seed=24, chunkSize=5,
+                                      callback=lambda s: updates.append(s.trials))
+        local = trials.runTrials('BB84', 40, 64, errorRate=0.02, workers=1, seed=24)
+        assert(stats.trials == 40 and updates[-1] == 40 and len(updates) == 8)
+        assert(stats.detections == local.detections and list(stats.histogram) == list(local.histogram))
+        assert(abs(stats.siftedMean - local.siftedMean) < 1e-9)
+
+        points = sweep.gridPoints(protocol=['E91'], n=[512], eve=[False, True])
+        results = sweep.runSweep(points, 10, str(tmpdir), coordinator=coordinator)
+        assert([r['stats']['trials'] for r in results] == [10, 10])
+        assert(results[1]['stats']['detectionRate'] > results[0]['stats']['detectionRate'])
+        dropper.join()
+
+    for worker in workers:
+        worker.join(10)
+        assert(worker.exitcode == 0)
+
+
+def test_failedCall():
+    # Chunks left over from a call that gave up never reach the next one
+    with distributed.Coordinator(retries=0) as coordinator:
+        dropper = Process(target=_dropTask, args=(coordinator.address, coordinator.authkey))
+        dropper.start()
+        with pytest.raises(RuntimeError):
+            coordinator.runTrials('B92', 30, 32, seed=1, chunkSize=3)
+        dropper.join()
+
+        workers = _startWorkers(coordinator, 2)
+        stats = coordinator.runTrials('BB84', 12, 64, seed=2, chunkSize=3)
+        local = trials.runTrials('BB84', 12, 64, workers=1, seed=2)
+        assert(stats.trials == 12 and list(stats.histogram) == list(local.histogram))
+    for worker in workers:
+        worker.join(10)
+
+
+def test_concurrentCalls():
+    # Calls from two threads share the workers, and neither cancels the other
+    with distributed.Coordinator() as coordinator:
+        workers = _startWorkers(coordinator, 2)
+        results = {}
+        def call(protocol, seed):
+            results[protocol] = coordinator.runTrials(protocol, 12, 64, seed=seed, chunkSize=2, timeout=60)
+        threads = [threading.Thread(target=call, args=args) for args in [('BB84', 5), ('B92', 6)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        assert(results['BB84'].trials == results['B92'].trials == 12)
+        local = trials.runTrials('B92', 12, 64, workers=1, seed=6)
+        assert(list(results['B92'].histogram) == list(local.histogram))
+    for worker in workers:
+        worker.join(10)
+
+
+def test_acceptBackoff(monkeypatch):
+    # A listener that keeps failing is retried with growing delays, not in a busy loop
+    monkeypatch.setattr(distributed, 'ACCEPT_DELAY', 0.01)
+    calls = []
+    with distributed.Coordinator() as coordinator:
+        def accept():
+            calls.append(time.time())
+            raise OSError("Too many open files")
+        monkeypatch.setattr(coordinator.listener, 'accept', accept)
+        # Wake the acceptor from the real accept with a connection that fails its handshake
+        socket.create_connection(coordinator.address).close()
+        time.sleep(0.5)
+    assert(2 < len(calls) < 10)
+    assert(calls[-1] - calls[-2] > calls[1] - calls[0])
+
+
+def test_authkey(monkeypatch):
+    monkeypatch.delenv(distributed.AUTHKEY_VARIABLE, raising=False)
+    with pytest.raises(ValueError):
+        distributed.Coordinator(('0.0.0.0', 0))
+    with pytest.raises(ValueError):
+        distributed.runWorker(('localhost', 1))
+
+    monkeypatch.setenv(distributed.AUTHKEY_VARIABLE, 'shared secret')
+    with distributed.Coordinator(('0.0.0.0', 0)) as coordinator:
+        assert(coordinator.authkey == b'shared secret')
+
+    state = trials.runChunk('BB84', 32, False, 0.0, 3, 0, 4).toState()
+    assert(trials.TrialStats.fromState(state).toState() == state)
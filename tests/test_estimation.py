@@ -0,0 +1,47 @@
+import numpy as np
+import qkdsim.qkdutils as util
+import qkdsim.simulations as simulations
+from qkdsim.packedkey import PackedKey
+
+def test_discloseSample(seeded):
+    seeded(22)
+    key1 = util.getRandomBitArray(1000)
+    key2 = key1.copy()
+    announce1, keep1, announce2, keep2 = util.discloseSample(key1, key2, 0.1)
+    assert(len(announce1) == 100 and len(keep1) == 900)
+    assert(np.array_equal(announce1, announce2) and np.array_equal(keep1, keep2))
+
+    # The same sample is taken from lists and PackedKeys with the same random stream
+    for convert in [list, PackedKey.fromBits]:
+        seeded(23)
+        expected = util.discloseSample(key1, key2, 0.3)
+        seeded(23)
+        out = util.discloseSample(convert(key1.tolist()), convert(key2.tolist()), 0.3)
+        assert(all(np.array_equal(np.asarray(a, dtype=bool), b) for a, b in zip(out, expected)))
+
+
+def test_finiteSizeThreshold():
+    assert(util.finiteSizeThreshold(0, 0.05) == 0.05)
+    assert(abs(util.finiteSizeThreshold(2000, 0.05, 1e-6) - (0.05 + (np.log(1e6) / 4000) ** 0.5)) < 1e-12)
+    assert(util.finiteSizeThreshold(10000, 0.05) < util.finiteSizeThreshold(1000, 0.05))
+
+    key = [True] * 1000
+    noisy = [k if j % 20 else not k for j, k in enumerate(key)]
+    assert(not util.detectEavesdrop(key, noisy, 0.05, epsilon=1e-6))
+    noisier = [k if j % 5 else not k for j, k in enumerate(key)]
+    assert(util.detectEavesdrop(key, noisier, 0.05, epsilon=1e-6))
+
+
+def test_sampledRun(seeded):
+    seeded(22)
+    numBits = 20000
+    for packed in [False, True]:
+        report = simulations.runBB84(numBits, errorRate=0.05, engine='numpy', packed=packed, quiet=True,
+                                     discloseFraction=0.1)
+        assert(not report.aborted)
+        assert(report.stages['kept'] > 1.7 * report.stages['sifted'] / 2)
+        assert(abs(report.estimate - 0.05) < 0.02)
+
+    assert(simulations.runBB84(numBits, True, engine='numpy', quiet=True, discloseFraction=0.05).aborted)
+    assert(simulations.runB92(numBits, True, engine='numpy', quiet=True, discloseFraction=0.05).aborted)
+    assert(not simulations.runB92(numBits, False, 0.02, engine='numpy', quiet=True, discloseFraction=0.05).aborted)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import qkdsim.backends as backends
+import qkdsim.fused as fused
+import qkdsim.rng as rng
+
+def test_kernels():
+    # The pure Python kernels, which Numba compiles, agree bit for bit with the NumPy path
+    words = np.frombuffer(rng.FastRNG(25).randomBytes(4 * 4000), dtype=np.uint32)
+    errorLimit = fused._errorLimit(0.1)
+    for eve in (False, True):
+        a, b = fused.allocate(4000)
+        c, d = fused.allocate(4000)
+        kept = fused._siftBB84(words, errorLimit, eve, a, b, 0)
+        assert(fused._siftBB84Numpy(words, errorLimit, eve, c, d, 0) == kept)
+        assert((a[:kept] == c[:kept]).all() and (b[:kept] == d[:kept]).all())
+
+        resent, kept = fused._siftB92(words, errorLimit, eve, a, b, 0, 0, 0)
+        assert(fused._siftB92Numpy(words, errorLimit, eve, c, d, 0, 0, 0) == (resent, kept))
+        assert((a[:kept] == c[:kept]).all() and (b[:kept] == d[:kept]).all())
+
+
+def test_sift(seeded):
+    seeded(25)
+    out = fused.allocate(200000)
+    key_A, key_B = fused.siftBB84(200000, 0.05, out=out, chunkSize=30000)
+    assert(abs(len(key_A) / 200000.0 - 0.5) < 0.01 and abs(np.mean(key_A != key_B) - 0.05) < 0.005)
+    assert(np.shares_memory(key_A, out[0]))
+    key_A, key_B = fused.siftBB84(200000, 0.0, eve=True, out=out)
+    assert(abs(np.mean(key_A != key_B) - 0.25) < 0.01)
+
+    key_A, key_B = fused.siftB92(200000, 0.05, out=out, chunkSize=30000)
+    assert(len(key_A) == len(key_B) and abs(len(key_A) / 200000.0 - 0.25) < 0.01)
+    assert(abs(np.mean(key_A != key_B) - 0.05) < 0.01)
+    key_A, key_B = fused.siftB92(200000, eve=True, out=out, chunkSize=30000)
+    assert(len(key_A) > len(key_B))
+
+    with pytest.raises(ValueError):
+        fused.siftBB84(300000, out=out)
+
+
+def test_numba():
+    # The compiled kernels, not only their Python source, agree with the NumPy path
+    pytest.importorskip('numba')
+    words = np.frombuffer(rng.FastRNG(25).randomBytes(4 * 4000), dtype=np.uint32)
+    errorLimit = fused._errorLimit(0.1)
+    for eve in (False, True):
+        a, b = fused.allocate(4000)
+        c, d = fused.allocate(4000)
+        kept = fused._kernel('_siftBB84', True)(words, errorLimit, eve, a, b, 0)
+        assert(fused._kernel('_siftBB84', False)(words, errorLimit, eve, c, d, 0) == kept)
+        assert((a[:kept] == c[:kept]).all() and (b[:kept] == d[:kept]).all())
+
+        resent, kept = fused._kernel('_siftB92', True)(words, errorLimit, eve, a, b, 0, 0, 0)
+        assert(fused._kernel('_siftB92', False)(words, errorLimit, eve, c, d, 0, 0, 0) == (resent, kept))
+        assert((a[:kept] == c[:kept]).all() and (b[:kept] == d[:kept]).all())
+
+    key_A, key_B = fused.siftBB84(100000, 0.05, jit=True)
+    assert(abs(len(key_A) / 100000.0 - 0.5) < 0.01 and abs(np.mean(key_A != key_B) - 0.05) < 0.01)
+
+
+def test_backend(seeded):
+    # Cascade can leave a few errors in keys this short, so rather than any one seed
+    # ending error-free, the residual error rate must be well below the raw one. The
+    # bounds hold with room to spare over any 20 consecutive seeds up to 2000.
+    residual = []
+    for seed in range(20):
+        seeded(seed)
+        report = backends.run('BB84', 200, backend='fused', errorRate=0.02, reconcile=True)
+        assert(report.stages['raw'] == 1000)
+        if not report.aborted:
+            assert(report.leaked > 0)
+            residual.append(report.qber)
+    assert(len(residual) >= 15 and np.mean(np.equal(residual, 0)) > 0.25 and np.mean(residual) < 0.01)
+
+    seeded(25)
+    report = backends.run('BB84', 200, backend='fused', errorRate=0.02, reconcile=True, amplify=True)
+    assert(not report.aborted and 0 < report.stages['amplified'] < report.stages['kept'])
+    assert(backends.run('BB84', 200, backend='fused', eve=True).aborted)
+    assert(backends.run('B92', 200, backend='fused', eve=True).aborted)
+    with pytest.raises(ValueError):
+        backends.run('E91', 200, backend='fused')
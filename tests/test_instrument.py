@@ -0,0 +1,34 @@
+import json
+import qkdsim.instrument as instrument
+import qkdsim.simulations as simulations
+
+def test_profileRun():
+    numBits = 1024
+    calls = []
+
+    with instrument.Profiler(hooks=[lambda *args: calls.append(args)]) as profiler:
+        simulations.runBB84(numBits, False, 0.0, engine='numpy', quiet=True)
+    assert(instrument.getProfiler() is None)
+
+    stats = profiler.asDict()
+    for stage in ['runBB84', 'random', 'encodeKey', 'simulateNoise', 'decodeState',
+                  'matchKeys', 'discloseHalf', 'detectEavesdrop']:
+        assert(stage in stats)
+    assert(stats['runBB84']['calls'] == 1 and stats['runBB84']['elements'] == numBits)
+    assert(stats['random']['calls'] == 3)
+    assert(stats['encodeKey']['elements'] == 5*numBits)
+    assert('bitFormat' not in stats)
+    assert(len(calls) == sum(s['calls'] for s in stats.values()))
+    assert(json.loads(profiler.toJSON())['matchKeys']['calls'] == 1)
+
+
+def test_disabled():
+    assert(instrument.stage('encodeKey', 10) is instrument.stage('decodeState', 20))
+
+    profiler = instrument.Profiler()
+    with profiler:
+        with instrument.stage('outer', 5):
+            with instrument.stage('inner', 5): pass
+    simulations.runE91(256, engine='numpy', quiet=True)
+    assert(sorted(profiler.stats) == ['inner', 'outer'])
+    assert(profiler.stats['outer'].seconds >= profiler.stats['inner'].seconds)
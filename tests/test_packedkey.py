@@ -0,0 +1,83 @@
+import numpy as np
+import qkdsim.channels as channels
+import qkdsim.qkdutils as util
+import qkdsim.packedkey as packedkey
+import qkdsim.simulations as simulations
+from qkdsim.packedkey import PackedKey
+
+def test_fromBits():
+    for numBits in range(20):
+        bits = util.getRandomBitArray(numBits)
+        key = PackedKey.fromBits(bits)
+        assert(len(key) == numBits)
+        assert(np.array_equal(np.asarray(key), bits))
+        assert(list(key) == list(bits))
+
+
+def test_stride(monkeypatch):
+    # Use tiny chunks so selections cross chunk boundaries
+    monkeypatch.setattr(packedkey, 'CHUNK_BITS', 16)
+    bits = util.getRandomBitArray(203)
+    key = PackedKey.fromBits(bits)
+
+    for start in range(4):
+        for step in range(1, 5):
+            assert(np.array_equal(np.asarray(key[start::step]), bits[start::step]))
+
+
+def test_compress(monkeypatch):
+    monkeypatch.setattr(packedkey, 'CHUNK_BITS', 16)
+    bits = util.getRandomBitArray(203)
+    mask = util.getRandomBitArray(203)
+    key = PackedKey.fromBits(bits)
+
+    assert(np.array_equal(np.asarray(key.compress(mask)), bits[mask]))
+    assert(np.array_equal(np.asarray(key.compress(PackedKey.fromBits(mask))), bits[mask]))
+
+
+def test_mismatches():
+    key1 = PackedKey.random(1001)
+    key2 = PackedKey.random(1001)
+    expected = np.count_nonzero(np.asarray(key1) != np.asarray(key2))
+    assert(key1.mismatches(key2) == expected)
+    assert(util.countMismatches(key1, key2) == expected)
+    assert((~key1).mismatches(key1) == 1001)
+
+
+def test_bitFormatPacked():
+    bits = list(util.getRandomBitArray(301))
+    assert(util.bitFormat(PackedKey.fromBits(bits)) == util.bitFormat(bits))
+    assert(util.bitFormat(PackedKey.fromBits(bits[:10])) == util.bitFormat(bits[:10]))
+
+
+def test_concatenate(monkeypatch):
+    monkeypatch.setattr(packedkey, 'CHUNK_BITS', 16)
+    parts = [util.getRandomBitArray(k) for k in (0, 5, 40, 203)]
+    key = PackedKey.concatenate([PackedKey.fromBits(bits) for bits in parts])
+    assert(np.array_equal(np.asarray(key), np.concatenate(parts)))
+
+
+def test_runChunked(monkeypatch, seeded):
+    # The quantum stages of a packed run cross many chunk boundaries
+    seeded(4)
+    monkeypatch.setattr(packedkey, 'CHUNK_BITS', 64)
+    numBits = 4000
+    report = simulations.runBB84(numBits, errorRate=0.05, engine='numpy', packed=True, quiet=True,
+                                 channel=channels.loss(10))
+    assert(isinstance(report.key_A, PackedKey) and not report.aborted)
+    assert(abs(report.stages['detected'] / (5.0 * numBits) - channels.loss(10).transmittance) < 0.01)
+    assert(abs(report.qber - 0.05) < 0.02)
+
+    report = simulations.runBB84(numBits, True, engine='numpy', packed=True, quiet=True)
+    assert(report.aborted and abs(report.qber - 0.25) < 0.03)
+    report = simulations.runBB84(numBits, engine='numpy', packed=True, quiet=True, attack='intercept')
+    assert(report.aborted and abs(report.eveInfo - 0.5) < 0.05)
+
+
+def test_runPacked():
+    numBits = 2048
+
+    assert(len(simulations.runBB84(numBits, False, 0.0, False, engine='numpy', packed=True)) >= 3*numBits/4)
+    assert(simulations.runBB84(numBits, True, 0.0, False, engine='numpy', packed=True) == -1)
+    assert(len(simulations.runB92(numBits, False, 0.0, False, engine='numpy', packed=True)) >= 3*numBits/4)
+    assert(len(simulations.runE91(numBits, verbose=False, engine='numpy', packed=True)) >= 3*numBits/4)
@@ -0,0 +1,48 @@
+import numpy as np
+import qkdsim.qkdutils as util
+import qkdsim.reconciliation as reconciliation
+import qkdsim.simulations as simulations
+from qkdsim.packedkey import PackedKey
+
+def test_cascade():
+    numBits = 100000
+
+    for qber in (0.01, 0.05, 0.1):
+        key_A = util.getRandomBitArray(numBits)
+        key_B = key_A ^ (np.random.random_sample(numBits) < qber)
+        corrected, leaked, rounds = reconciliation.cascade(key_A, key_B, qber)
+
+        assert(np.count_nonzero(corrected != key_A) == 0)
+        # Cascade leaks somewhat more than the Shannon limit n*h(qber)
+        h = -qber*np.log2(qber) - (1-qber)*np.log2(1-qber)
+        assert(numBits*h < leaked < 1.5*numBits*h)
+        assert(reconciliation.PASSES < rounds < leaked)
+
+
+def test_cascadeZeroEstimate():
+    # An estimate of 0 still leaves blocks small enough to find pairs of errors
+    for j in range(50):
+        key_A = util.getRandomBitArray(2000)
+        key_B = key_A.copy()
+        key_B[np.random.choice(2000, 4, replace=False)] ^= True
+        corrected, leaked, rounds = reconciliation.cascade(key_A, key_B, 0.0)
+        assert(np.array_equal(corrected, key_A))
+
+
+def test_cascadePacked():
+    key_A = PackedKey.random(5000)
+    key_B = PackedKey.fromBits(np.asarray(key_A) ^ (np.random.random_sample(5000) < 0.05))
+    corrected, leaked, rounds = reconciliation.cascade(key_A, key_B, 0.05)
+    assert(isinstance(corrected, PackedKey))
+    assert(corrected == key_A)
+
+
+def test_reconcileRuns():
+    numBits = 4096
+
+    report = simulations.runBB84(numBits, False, 0.05, engine='numpy', quiet=True, reconcile=True)
+    assert(not report.aborted and report.mismatches == 0 and report.leaked > 0)
+    report = simulations.runB92(numBits, False, 0.05, engine='numpy', quiet=True, reconcile=True)
+    assert(not report.aborted and report.mismatches == 0 and report.leaked > 0)
+    report = simulations.runE91(numBits, 0.05, engine='numpy', quiet=True, reconcile=True)
+    assert(report.mismatches == 0 and report.leaked > 0)
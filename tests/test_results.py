@@ -0,0 +1,34 @@
+import qkdsim.simulations as simulations
+from qkdsim.results import ABORT_ERRORS, ABORT_LENGTH
+
+def test_quietBB84(capsys):
+    numBits = 2048
+
+    report = simulations.runBB84(numBits, False, 0.0, engine='numpy', quiet=True)
+    assert(capsys.readouterr().out == '')
+    assert(not report.aborted)
+    assert(report.qber == 0.0)
+    assert(list(report.stages) == ['raw', 'sifted', 'announced', 'kept'])
+    assert(report.stages['raw'] == 5*numBits)
+    assert(report.stages['announced'] + report.stages['kept'] == report.stages['sifted'])
+    assert(len(report.key) == report.stages['kept'])
+
+    report = simulations.runBB84(numBits, True, 0.0, engine='numpy', quiet=True)
+    assert(capsys.readouterr().out == '')
+    assert(report.aborted and report.abortReason == ABORT_ERRORS)
+    assert(report.key == -1)
+    assert('Aborted' in report.render())
+
+
+def test_quietB92(capsys):
+    report = simulations.runB92(2048, True, 0.0, engine='numpy', quiet=True)
+    assert(capsys.readouterr().out == '')
+    assert(report.abortReason == ABORT_LENGTH)
+    assert(report.stages['resent'] < report.stages['raw'])
+
+
+def test_quietE91(capsys):
+    report = simulations.runE91(2048, 0.05, engine='numpy', quiet=True)
+    assert(capsys.readouterr().out == '')
+    assert(report.asDict()['keyLength'] == report.stages['sifted'])
+    assert(abs(report.qber - 2*0.05*0.95) < 0.03)
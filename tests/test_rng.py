@@ -0,0 +1,43 @@
+import numpy as np
+import qkdsim.rng as rng
+import qkdsim.simulations as simulations
+
+def test_seedReplay(seeded):
+    # The same seed replays a run exactly, for every protocol
+    results = []
+    for j in range(2):
+        seeded(1234)
+        results.append((list(simulations.runBB84(256, False, 0.05, False, engine='numpy')),
+                        list(simulations.runB92(256, False, 0.05, False, engine='numpy')),
+                        list(simulations.runE91(256, 0.05, False, engine='numpy'))))
+
+    assert(results[0] == results[1])
+
+
+def test_independentStreams():
+    numBits = 4096
+    streams = rng.FastRNG(99).spawn(4)
+    bits = [s.randomBits(numBits) for s in streams]
+
+    assert(np.array_equal(rng.FastRNG(99, 2).randomBits(numBits), bits[2]))
+    for j in range(1, 4):
+        assert(abs(np.count_nonzero(bits[0] != bits[j]) - numBits/2) < 0.1 * numBits)
+
+
+def test_distributions():
+    numSamples = 100000
+
+    for source in (rng.CryptoRNG(), rng.FastRNG(7)):
+        assert(abs(np.count_nonzero(source.randomBits(numSamples)) - numSamples/2) < 0.01 * numSamples)
+        samples = source.random(numSamples)
+        assert(samples.min() >= 0 and samples.max() < 1)
+        assert(abs(samples.mean() - 0.5) < 0.01)
+        assert(set(source.integers(3, numSamples).tolist()) == set([0, 1, 2]))
+        assert(abs(source.normal(2.0, numSamples).std() - 2.0) < 0.05)
+
+
+def test_using():
+    previous = rng.getRNG()
+    with rng.using(rng.FastRNG(5)) as source:
+        assert(rng.getRNG() is source)
+    assert(rng.getRNG() is previous)
@@ -0,0 +1,29 @@
+import qkdsim.channels as channels
+import qkdsim.sessions as sessions
+
+def test_sessions(seeded):
+    seeded(19)
+    stats = sessions.simulateSessions(200, 300, errorRate=0.02, latency=0.001)
+    assert(stats.sessions == 200 and stats.aborted < 5)
+    assert(sum(report.mismatches == 0 for report in stats.reports) > 150)
+    assert(all(report.rounds >= 4 for report in stats.reports if not report.aborted))
+    assert(stats.secretBits > 150 * 200 and stats.throughput() > 0)
+
+    # Sessions finish their simulations one at a time and then exchange messages while the
+    # next ones are simulated, sharing frames with whichever sessions overlap them
+    assert(stats.frames < stats.messages / 8)
+    assert(min(stats.latencies) >= 6 * 0.001 and stats.latency(99) <= stats.elapsed)
+
+    stats = sessions.simulateSessions(20, 100, latency=0.001, batch=False, reconcile=False, amplify=False)
+    assert(stats.frames == stats.messages == 20 * 4)
+
+    stats = sessions.simulateSessions(20, 100, eve=True, latency=0.001, maxConcurrent=5)
+    assert(stats.aborted == 20 and stats.secretBits == 0)
+
+    # Sessions take the channel, attack and disclosure options of runBB84
+    stats = sessions.simulateSessions(20, 200, errorRate=0.02, latency=0.001, channel=channels.loss(5),
+                                      discloseFraction=0.3)
+    report = stats.reports[0]
+    assert(report.stages['detected'] < 1000 and report.stages['announced'] < 0.4 * report.stages['sifted'])
+    stats = sessions.simulateSessions(20, 200, latency=0.001, attack='intercept')
+    assert(stats.aborted == 20)
@@ -0,0 +1,34 @@
+import numpy as np
+import qkdsim.bb84 as bb84
+import qkdsim.b92 as b92
+import qkdsim.states as states
+
+def test_tables():
+    codes = np.arange(len(states.FLIP), dtype=np.uint8)
+    assert(np.array_equal(states.FLIP[states.FLIP], codes))
+    assert(np.array_equal(states.HADAMARD[states.HADAMARD], codes))
+    for value in [0, 1]:
+        for basis in [0, 1]:
+            code = states.encode(value, basis)
+            assert(states.PROB_ONE[code, basis] == value)
+            assert(states.PROB_ONE[code, 1 - basis] == 0.5)
+            assert(states.PROB_ONE[states.FLIP[code], basis] == 1 - value)
+
+
+def test_measureCodes(seeded):
+    seeded(14)
+    numTrials = 4000
+
+    for basis in [0, 1]:
+        assert(bb84.decodeState(states.encode(1, basis), basis) == True)
+        assert(bb84.decodeState(states.encode(0, basis), basis) == False)
+        ones = sum(bb84.decodeState(states.encode(0, basis), 1 - basis) for k in range(numTrials))
+        assert(abs(ones / numTrials - 0.5) < 0.05)
+
+    # B92 filters pass the state they are not orthogonal to half of the time
+    for code, basis, expected in [(states.ZERO, 0, False), (states.PLUS, 1, True)]:
+        results = [b92.decodeState(code, basis) for k in range(numTrials)]
+        assert(set(results) == set([None, expected]))
+        assert(abs(results.count(None) / numTrials - 0.5) < 0.05)
+    assert(all(b92.decodeState(states.ZERO, 1) is None for k in range(100)))
+    assert(all(b92.decodeState(states.PLUS, 0) is None for k in range(100)))
@@ -0,0 +1,50 @@
+import numpy as np
+import qkdsim.streaming as streaming
+
+def test_streamBB84():
+    numBits = 20000
+    blockSize = 1000
+
+    stats = streaming.StreamStats()
+    total = 0
+    for key_A, key_B in streaming.streamBB84(numBits, blockSize=blockSize, stats=stats):
+        assert(len(key_A) <= blockSize)
+        assert(np.array_equal(key_A, key_B))
+        total += len(key_A)
+
+    assert(stats.rawBits == 5*numBits)
+    assert(stats.keptBits == total)
+    assert(stats.announcedBits + stats.keptBits == stats.siftedBits)
+    assert(stats.announcedBits - stats.keptBits in (0, 1))
+    assert(not stats.detected(0.0))
+
+    stats = streaming.StreamStats()
+    for block in streaming.streamBB84(numBits, eve=True, blockSize=blockSize, stats=stats):
+        pass
+    assert(stats.detected(0.0))
+    assert(abs(stats.errorRate() - 0.25) < 0.02)
+
+
+def test_streamB92():
+    numBits = 20000
+
+    stats = streaming.StreamStats()
+    for block in streaming.streamB92(numBits, errorRate=0.05, blockSize=4096, stats=stats):
+        pass
+    assert(stats.rawBits == 8*numBits)
+    assert(abs(stats.errorRate() - 0.05) < 0.01)
+    assert(not stats.detected(0.05))
+
+    # Eve's absorbed photons are noticed in the first block
+    stats = streaming.StreamStats()
+    assert(list(streaming.streamB92(numBits, eve=True, blockSize=4096, stats=stats)) == [])
+    assert(stats.detected(0.0))
+
+
+def test_streamE91():
+    numBits = 20000
+
+    stats = streaming.StreamStats()
+    for key_A, key_B in streaming.streamE91(numBits, blockSize=4096, stats=stats):
+        assert(np.array_equal(key_A, key_B))
+    assert(stats.keptBits >= 3*numBits/4)
@@ -0,0 +1,53 @@
+import os
+import pytest
+import qkdsim.sweep as sweep
+
+def test_runSweep(tmpdir):
+    cacheDir = str(tmpdir.join('cache'))
+    points = sweep.gridPoints(protocol=['BB84', 'B92'], n=[64], eve=[False, True], errorRate=[0.0])
+    assert(len(points) == 4)
+
+    first = sweep.runSweep(points[:2], 5, cacheDir, workers=1)
+    assert(not any(r['cached'] for r in first))
+
+    # Resuming only computes the missing points and reproduces the cached ones
+    second = sweep.runSweep(points, 5, cacheDir, workers=1)
+    assert([r['cached'] for r in second] == [True, True, False, False])
+    assert(second[0]['stats'] == first[0]['stats'])
+    assert(second[3]['params']['eve'] and second[3]['stats']['detections'] == 5)
+
+    # A different seed is a different entry
+    third = sweep.runSweep(points[:1], 5, cacheDir, seed=1, workers=1)
+    assert(not third[0]['cached'])
+
+    # Parameters the trials do not take are refused rather than cached under new keys
+    with pytest.raises(ValueError):
+        sweep.runSweep(sweep.gridPoints(protocol=['BB84'], n=[64], discloseFraction=[0.1]), 5, cacheDir)
+
+
+def test_codeVersion(tmpdir, monkeypatch):
+    # Changing any source file changes every cache key
+    cache = sweep.SweepCache(str(tmpdir))
+    key = cache.key({'n': 64}, 0)
+    assert(cache.key({'n': 64}, 0) == key and len(sweep.codeVersion()) == 64)
+    monkeypatch.setattr(sweep, '_codeHash', 'edited')
+    assert(cache.key({'n': 64}, 0) != key)
+
+
+def test_evict(tmpdir):
+    cache = sweep.SweepCache(str(tmpdir))
+    for j in range(10):
+        cache.put('entry%d' % j, {'value': 'x' * 100})
+    cache.evict(500)
+    assert(sum(os.path.getsize(str(p)) for p in tmpdir.listdir()) <= 500)
+    assert(cache.get('entry9') is not None)
+
+    # A failed write leaves no temporary file, and one left by a killed process is evicted
+    with pytest.raises(TypeError):
+        cache.put('broken', {'value': object()})
+    assert(not [p for p in tmpdir.listdir() if p.ext == '.tmp'])
+    stale = tmpdir.join('stale.tmp')
+    stale.write('x' * 1000)
+    os.utime(str(stale), (0, 0))
+    cache.evict(500)
+    assert(not stale.exists() and cache.get('entry9') is not None)
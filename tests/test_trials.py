@@ -0,0 +1,40 @@
+import numpy as np
+import qkdsim.trials as trials
+
+def test_runTrials():
+    numTrials = 40
+    numBits = 256
+
+    stats = trials.runTrials('BB84', numTrials, numBits, workers=2, seed=1)
+    assert(stats.trials == numTrials)
+    assert(stats.detections == 0)
+    assert(stats.histogram.sum() == numTrials)
+    assert(abs(stats.siftedMean - 5*numBits/2) < 0.05 * numBits)
+
+    stats = trials.runTrials('BB84', numTrials, numBits, eve=True, workers=2, seed=1)
+    assert(stats.detections == numTrials)
+    low, high = stats.errorInterval()
+    assert(low <= stats.errorMean <= high)
+    assert(abs(stats.errorMean - 0.25) < 0.02)
+
+
+def test_runTrialsReproducible():
+    # Results only depend on the seed, not on how trials are spread over workers
+    serial = trials.runTrials('B92', 30, 128, errorRate=0.05, workers=1, seed=7)
+    parallel = trials.runTrials('B92', 30, 128, errorRate=0.05, workers=3, chunkSize=4, seed=7)
+    assert(serial.detections == parallel.detections)
+    assert(np.array_equal(serial.histogram, parallel.histogram))
+    assert(abs(serial.errorMean - parallel.errorMean) < 1e-12)
+
+    # Any single trial can be replayed from its index
+    assert(trials.runTrial('B92', 128, False, 0.05, seed=7, index=3) ==
+           trials.runTrial('B92', 128, False, 0.05, seed=7, index=3))
+
+
+def test_detectionInterval():
+    stats = trials.TrialStats()
+    for j in range(100):
+        stats.add(j < 30, 10, 0.0)
+    low, high = stats.detectionInterval()
+    assert(low < 0.3 < high)
+    assert(high - low < 0.2)
@@ -0,0 +1,115 @@
+from math import pi, cos
+import numpy as np
+import pytest
+import qkdsim.qkdutils as util
+import qkdsim.simulations as simulations
+import qkdsim.bb84 as bb84
+import qkdsim.b92 as b92
+import qkdsim.e91 as e91
+
+def test_runBB84Batch():
+    numTrials = 20
+    numBits = 2048
+
+    for j in range(numTrials):
+        assert(len(simulations.runBB84(numBits, False, 0.0, False, engine='numpy')) >= 3*numBits/4)
+        assert(simulations.runBB84(numBits, True, 0.0, False, engine='numpy') == -1)
+
+
+def test_decodeStateBB84Batch():
+    # Measuring in the encoding basis is deterministic, otherwise the result is even
+    numBits = 100000
+    tolerance = 0.01 * numBits
+    key = util.getRandomBitArray(numBits)
+    bases = util.getRandomBitArray(numBits)
+    states = bb84.encodeKeyBatch(key, bases)
+
+    assert(np.array_equal(bb84.decodeStateBatch(states, bases), key))
+
+    results = bb84.decodeStateBatch(states, np.logical_not(bases))
+    assert(abs(np.count_nonzero(results) - numBits/2) < tolerance)
+    assert(abs(np.count_nonzero(results != key) - numBits/2) < tolerance)
+
+    with pytest.raises(ValueError):
+        bb84.encodeKeyBatch(key, bases[:-1])
+
+
+def test_simulateEavesdropBB84Batch():
+    # Eve introduces an error on 1/4 of the sifted bits
+    numBits = 100000
+    key = util.getRandomBitArray(numBits)
+    bases_A = util.getRandomBitArray(numBits)
+    sent = bb84.simulateEavesdropBatch(bb84.encodeKeyBatch(key, bases_A), util.getRandomBitArray(numBits))
+    bases_B = util.getRandomBitArray(numBits)
+    key1, key2 = bb84.matchKeysBatch(key, bb84.decodeStateBatch(sent, bases_B), bases_A, bases_B)
+
+    assert(abs(float(np.count_nonzero(key1 != key2))/len(key1) - 0.25) < 0.02)
+
+
+def test_simulateNoiseBB84Batch():
+    numBits = 100000
+    errorRate = 0.1
+    key = util.getRandomBitArray(numBits)
+    bases = util.getRandomBitArray(numBits)
+    sent = bb84.simulateNoiseBatch(bb84.encodeKeyBatch(key, bases), errorRate)
+    results = bb84.decodeStateBatch(sent, bases)
+
+    assert(abs(float(np.count_nonzero(results != key))/numBits - errorRate) < 0.01)
+
+
+def test_runB92Batch():
+    numTrials = 20
+    numBits = 2048
+
+    for j in range(numTrials):
+        assert(len(simulations.runB92(numBits, False, 0.0, False, engine='numpy')) >= 3*numBits/4)
+        assert(simulations.runB92(numBits, True, 0.0, False, engine='numpy') == -1)
+
+
+def test_decodeStateB92Batch():
+    # Every photon that passes the filter carries Alice's bit, and ~1/4 of them pass
+    numBits = 100000
+    tolerance = 0.01
+    sent = util.getRandomBitArray(numBits)
+    results = b92.decodeStateBatch(b92.encodeKeyBatch(sent), util.getRandomBitArray(numBits))
+    seen = results != -1
+
+    assert(np.array_equal(results[seen].astype(bool), sent[seen]))
+    assert(abs(float(np.count_nonzero(seen))/numBits - 0.25) < tolerance)
+
+
+def test_matchKeysB92Batch():
+    keyA = np.array([True, False, True, True])
+    keyB = np.array([1, -1, -1, 1], dtype=np.int8)
+    resultA, resultB = b92.matchKeysBatch(keyA, keyB)
+    assert(list(resultA) == [True, True])
+    assert(list(resultB) == [True, True])
+
+
+def test_simulateE91Batch():
+    numTrials = 20
+    numBits = 2048
+
+    for j in range(numTrials):
+        assert(len(simulations.runE91(numBits, verbose=False, engine='numpy')) >= 3*numBits/4)
+
+
+def test_measureEntangledStateBatch():
+    numBits = 100000
+    basesA, basesB = e91.chooseAxesBatch(numBits)
+    A, B = e91.measureEntangledStateBatch(basesA, basesB)
+
+    # Bob's result must be anti-correlated with Alice's when they chose the same axis
+    match = basesA == basesB
+    assert(np.all(A[match] != B[match]))
+
+    # Otherwise the correlation coefficient is -cos[2(basisA-basisB)]
+    mask = (basesA == pi/4) & (basesB == -pi/8)
+    signA = np.where(A[mask], 1, -1)
+    signB = np.where(B[mask], 1, -1)
+    assert(abs(np.mean(signA * signB) + cos(2 * (pi/4 + pi/8))) < 0.05)
+
+
+def test_formatBasesForPrintBatch():
+    bases = [0, pi/8, pi/4, -pi/8]
+    assert(e91.formatBasesForPrintBatch(bases) == e91.formatBasesForPrint(bases))